@@ -0,0 +1,214 @@
+"""
+Per-request instrumentation.
+
+``instrumentation_middleware`` records, for every request, the wall time, the
+number of SQL queries and the time spent in them, the time spent building
+serializer ``.data`` and the response size. They are aggregated into
+histograms labelled by URL name and method (``movie-list``, ``review-create``,
+...) that ``MetricsView`` exposes in the Prometheus text format. Histograms
+are per process, so scrape every worker.
+
+With ``SERVER_TIMING`` (on in DEBUG) each response also carries a
+``Server-Timing`` header with the same numbers, visible in the browser's
+network panel.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+BYTES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+METRICS = {
+    'http_request_duration_seconds': ('Time to handle the request', SECONDS),
+    'http_request_db_queries': ('SQL queries run by the request', QUERIES),
+    'http_request_db_seconds': ('Time spent in SQL queries', SECONDS),
+    'http_request_serializer_seconds': ('Time spent building serializer data', SECONDS),
+    'http_response_size_bytes': ('Size of the response body', BYTES),
+}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (description, buckets) in METRICS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+
+                    label = ','.join(f'{key}="{value}"' for key, value in labels)
+                    cumulative = 0
+                    for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestStats:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.timings = {}
+
+
+# Set for the duration of a request; sync_to_async copies it into worker threads
+_current = ContextVar('request_stats', default=None)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's `name` timing."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[name] = stats.timings.get(name, 0) + time.perf_counter() - start
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def install(connection, **kwargs):
+    # Stays on the connection for its lifetime and only records while a request is running
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# Connections opened later, e.g. by the threads async views run the ORM in
+connection_created.connect(install)
+
+
+def observe(request, response, stats, duration):
+    match = getattr(request, 'resolver_match', None)
+    view = (match.url_name or match.view_name) if match else 'unmatched'
+    labels = (('method', request.method), ('view', view))
+
+    serializer = stats.timings.get('serializer', 0)
+    size = 0 if response.streaming else len(response.content)
+
+    registry.observe('http_request_duration_seconds', labels, duration)
+    registry.observe('http_request_db_queries', labels, stats.queries)
+    registry.observe('http_request_db_seconds', labels, stats.db_seconds)
+    registry.observe('http_request_serializer_seconds', labels, serializer)
+    registry.observe('http_response_size_bytes', labels, size)
+
+    if getattr(settings, 'SERVER_TIMING', settings.DEBUG):
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+            f'serializer;dur={serializer * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ])
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = RequestStats()
+            token = _current.set(stats)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+
+            observe(request, response, stats, time.perf_counter() - start)
+            return response
+    else:
+        def middleware(request):
+            # The connections this thread already has were opened before the signal was connected
+            for connection in connections.all(initialized_only=True):
+                install(connection)
+
+            stats = RequestStats()
+            token = _current.set(stats)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+
+            observe(request, response, stats, time.perf_counter() - start)
+            return response
+
+    return middleware
+
+
+class MetricsView(APIView):
+
+    permission_classes = [IsAdminUser]
+    schema = None
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
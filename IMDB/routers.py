@@ -0,0 +1,73 @@
+"""
+Read replica routing (DATABASE_REPLICAS in settings).
+
+Views wrapped in ``read_from_replicas`` (the catalog and review reads, see
+watchmate/api/urls.py) send the reads of their GET and HEAD requests to a
+randomly picked replica. Everything else uses the primary ("default"): all
+writes, reads made while handling POST/PUT/DELETE (so a view always sees its
+own writes, e.g. the review create and registration checks), every other
+view (admin, accounts, per-user pages, where a GET after a write must see
+it) and reads outside of requests (management commands, background work).
+"""
+
+import functools
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+
+READ_METHODS = ('GET', 'HEAD')
+
+# A context variable works for both sync and async views; sync_to_async copies it
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reading_from_replica():
+    return _replica_reads.get()
+
+
+def read_from_replicas(view):
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            with replica_reads(request.method in READ_METHODS):
+                return await view(request, *args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with replica_reads(request.method in READ_METHODS):
+                return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if replicas and reading_from_replica():
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'IMDB.instrumentation.instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -102,7 +103,46 @@ DATABASES = {
 # To use install render database url- pip install dj-database-url
 
 database_url = os.environ.get("DATABASE_URL")
-DATABASES['default'] = dj_database_url.parse(database_url)
+
+# Connections are kept open for DB_CONN_MAX_AGE seconds (checked before reuse)
+# instead of one new connection per request. With DB_POOL=true Postgres uses a
+# psycopg 3 connection pool instead (pip install "psycopg[pool]").
+
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+DB_CONN_HEALTH_CHECKS = os.environ.get("DB_CONN_HEALTH_CHECKS", "True").lower() == "true"
+DB_POOL = os.environ.get("DB_POOL", "False").lower() == "true"
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+
+def database_config(url):
+    config = dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS)
+
+    if DB_POOL and config["ENGINE"] == "django.db.backends.postgresql":
+        # The pool replaces persistent connections, Django refuses both at once
+        config["CONN_MAX_AGE"] = 0
+        config.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": DB_POOL_TIMEOUT,
+        }
+    return config
+
+
+DATABASES['default'] = database_config(database_url)
+
+# Read replicas, space separated URLs. GET/HEAD requests of the catalog and
+# review read views read from them, all writes and everything else use
+# default - see IMDB/routers.py.
+# Locally a copy of (or the same) SQLite file works as a stand-in.
+
+DATABASE_REPLICAS = []
+for number, replica_url in enumerate(os.environ.get("DATABASE_REPLICA_URLS", "").split(), 1):
+    DATABASES[f"replica_{number}"] = {**database_config(replica_url), "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica_{number}")
+
+DATABASE_ROUTERS = ["IMDB.routers.ReplicaRouter"]
 
 # Then install postgres driver - pip install psycopg2-binary
 # Then makemigrations...
@@ -153,12 +193,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication'
+        'UserApp.api.authentication.CachedJWTAuthentication'
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
+    # Token buckets per view scope - see IMDB/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': [
+        'IMDB.throttling.ScopedBucketThrottle',
+        'IMDB.throttling.IPBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': os.environ.get("THROTTLE_RATE_AUTH", "10/min"),
+        'register': os.environ.get("THROTTLE_RATE_REGISTER", "20/hour"),
+        'review': os.environ.get("THROTTLE_RATE_REVIEW", "30/min"),
+        'review_ip': os.environ.get("THROTTLE_RATE_REVIEW_IP", "120/min"),
+        'catalog': os.environ.get("THROTTLE_RATE_CATALOG", "600/min"),
+    },
+    # Set to the number of proxies in front of the app so clients are told apart by X-Forwarded-For
+    'NUM_PROXIES': int(os.environ["NUM_PROXIES"]) if os.environ.get("NUM_PROXIES") else None,
 }
 
 SIMPLE_JWT = {
@@ -173,4 +227,155 @@ SIMPLE_JWT = {
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "Django DRF IMDB-Clone"
-}
\ No newline at end of file
+}
+
+# Rating aggregation - see watchmate/ratings.py
+# With write-behind on, new ratings are buffered in BUFFER_CACHE_ALIAS and flushed in bulk
+
+RATING_WRITE_BEHIND = os.environ.get("RATING_WRITE_BEHIND", "False").lower() == "true"
+RATING_FLUSH_INTERVAL_MS = int(os.environ.get("RATING_FLUSH_INTERVAL_MS", "500"))
+RATING_FLUSH_EVENTS = int(os.environ.get("RATING_FLUSH_EVENTS", "100"))
+
+
+# Search backend for ?search= on the watchlist - see watchmate/search.py
+# "auto" uses PostgreSQL full-text search on Postgres and an in-process index otherwise
+
+WATCHLIST_SEARCH_BACKEND = os.environ.get("WATCHLIST_SEARCH_BACKEND", "auto")
+
+# Most matches the in-process index returns for one search, best first
+WATCHLIST_SEARCH_MAX_RESULTS = int(os.environ.get("WATCHLIST_SEARCH_MAX_RESULTS", "10000"))
+
+
+# Caching
+
+# Shared by every process with REDIS_URL (e.g. redis://localhost:6379/0), per process otherwise
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Buffered deltas must not be culled - see watchmate/buffers.py
+    "buffers": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "buffers",
+        "OPTIONS": {"MAX_ENTRIES": 10_000_000},
+    },
+}
+
+redis_url = os.environ.get("REDIS_URL")
+if redis_url:
+    for alias in CACHES:
+        CACHES[alias] = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": redis_url,
+        }
+
+BUFFER_CACHE_ALIAS = "buffers"
+
+# Response cache for the catalog read endpoints - see watchmate/cache.py
+# "lru" (bodies in-process), "django" (bodies in the cache alias below) or "none";
+# the tag versions always live in the cache alias, share it between processes
+
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "lru")
+RESPONSE_CACHE_ALIAS = "default"
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Per endpoint TTLs in seconds, by URL name
+RESPONSE_CACHE_TIMEOUTS = {
+    "stream-list": 300,
+    "stream-detail": 300,
+    "movie-list": 30,
+    "movie-detail": 60,
+    "review-list": 60,
+}
+
+
+# Number of titles kept in PlatformStats.top_titles - see watchmate/stats.py
+# Review rating deltas are buffered in BUFFER_CACHE_ALIAS and flushed in bulk
+
+PLATFORM_STATS_TOP_N = 5
+PLATFORM_STATS_FLUSH_INTERVAL_MS = int(os.environ.get("PLATFORM_STATS_FLUSH_INTERVAL_MS", "500"))
+PLATFORM_STATS_FLUSH_EVENTS = int(os.environ.get("PLATFORM_STATS_FLUSH_EVENTS", "100"))
+
+
+# Bulk catalog import - see watchmate/importer.py
+
+CATALOG_IMPORT_BATCH_SIZE = int(os.environ.get("CATALOG_IMPORT_BATCH_SIZE", "1000"))
+CATALOG_IMPORT_MAX_ERRORS = 100
+
+
+# Largest batch accepted by POST /api/review/bulk/ - see watchmate/reviews.py
+
+REVIEW_BULK_MAX_ITEMS = int(os.environ.get("REVIEW_BULK_MAX_ITEMS", "500"))
+
+
+# Rows fetched per round trip (and written per chunk) by the streaming export - see watchmate/export.py
+
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "2000"))
+
+
+# Serve the catalog/review reads with the async views of watchmate/api/async_views.py.
+# Only worth it under an ASGI server (gunicorn -k uvicorn.workers.UvicornWorker IMDB.asgi:application)
+
+ASYNC_READ_VIEWS = os.environ.get("ASYNC_READ_VIEWS", "False").lower() == "true"
+
+
+# Server-Timing header with per-request SQL and serializer time - see IMDB/instrumentation.py
+
+SERVER_TIMING = DEBUG
+
+
+# Users served from a per-process cache by the JWT authentication, and how often
+# the blacklisted token ids are reloaded - see UserApp/api/authentication.py
+
+JWT_USER_CACHE_TTL = int(os.environ.get("JWT_USER_CACHE_TTL", "30"))
+JWT_USER_CACHE_SIZE = int(os.environ.get("JWT_USER_CACHE_SIZE", "10000"))
+JWT_BLACKLIST_REFRESH_SECONDS = int(os.environ.get("JWT_BLACKLIST_REFRESH_SECONDS", "30"))
+
+
+# Top rated and trending rankings - see watchmate/ranking.py
+# RANKING_PRIOR_WEIGHT is the number of average ratings every title starts with
+
+RANKING_PRIOR_WEIGHT = int(os.environ.get("RANKING_PRIOR_WEIGHT", "10"))
+RANKING_HALF_LIFE_HOURS = float(os.environ.get("RANKING_HALF_LIFE_HOURS", "72"))
+RANKING_REBUILD_SECONDS = int(os.environ.get("RANKING_REBUILD_SECONDS", "600"))
+
+
+# Item-item recommendations - see watchmate/recommendations.py
+# RECOMMENDATIONS_SHRINKAGE is the number of common raters at which a similarity counts half
+
+RECOMMENDATIONS_TOP_K = int(os.environ.get("RECOMMENDATIONS_TOP_K", "20"))
+RECOMMENDATIONS_SHRINKAGE = int(os.environ.get("RECOMMENDATIONS_SHRINKAGE", "10"))
+
+
+# Background tasks for the side effects of writes - see watchmate/queue.py
+# TASK_QUEUE is inline (run at once), thread (outbox rows run by an in-process pool)
+# or worker (outbox rows run by manage.py run_worker)
+
+TASK_QUEUE = os.environ.get("TASK_QUEUE", "inline")
+TASK_WORKER_THREADS = int(os.environ.get("TASK_WORKER_THREADS", "4"))
+TASK_MAX_ATTEMPTS = int(os.environ.get("TASK_MAX_ATTEMPTS", "5"))
+TASK_RETRY_DELAY_SECONDS = float(os.environ.get("TASK_RETRY_DELAY_SECONDS", "1"))
+TASK_RETENTION_HOURS = int(os.environ.get("TASK_RETENTION_HOURS", "24"))
+
+
+# Where the throttling buckets live - see IMDB/throttling.py
+# memory (per process), django (the THROTTLE_CACHE_ALIAS cache, shared) or none
+
+THROTTLE_BACKEND = os.environ.get("THROTTLE_BACKEND", "memory")
+THROTTLE_CACHE_ALIAS = os.environ.get("THROTTLE_CACHE_ALIAS", "default")
+THROTTLE_MAX_KEYS = int(os.environ.get("THROTTLE_MAX_KEYS", "100000"))
+
+
+# PBKDF2 iterations of new password hashes, 0 for Django's default - see UserApp/hashers.py
+# Only lower it for load tests, existing hashes are upgraded on login when it goes back up
+
+PASSWORD_HASHERS = [
+    "UserApp.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+PASSWORD_HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", "0"))
@@ -0,0 +1,190 @@
+"""
+Token bucket throttling (DEFAULT_THROTTLE_CLASSES in settings).
+
+Views name their scope with ``throttle_scope`` (``auth``, ``register``,
+``review``, ``catalog``) and DEFAULT_THROTTLE_RATES gives each scope a DRF
+rate string such as ``"30/min"``. Every scope and client has a bucket of that
+many tokens, refilled at the rate: a request takes one, so a client can burst
+the whole bucket and is then held to the average rate, like a sliding window.
+A bucket is two numbers updated in place, so a check is O(1), and one left
+alone until it is full again is the same as none, so it can be dropped.
+
+``ScopedBucketThrottle`` counts per user when authenticated and per IP
+address otherwise. ``IPBucketThrottle`` counts per IP address against the
+``<scope>_ip`` rate, if there is one, e.g. to bound the review writes of many
+accounts behind one address.
+
+``THROTTLE_BACKEND`` selects the store: ``memory`` (default) keeps the
+buckets per process, at most ``THROTTLE_MAX_KEYS`` of them with the least
+recently used dropped first, so every process allows the full rate;
+``django`` keeps them in the Django cache ``THROTTLE_CACHE_ALIAS`` (e.g.
+Redis) shared by all processes, as a read and a write, so concurrent requests
+can now and then both take the last token; ``none`` turns throttling off.
+
+Throttled requests get a 429 with a ``Retry-After`` header: the seconds until
+the next token.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Off for in-process load generators, see disabled()
+_enabled = ContextVar('throttling_enabled', default=True)
+
+
+@contextmanager
+def disabled():
+    token = _enabled.set(False)
+    try:
+        yield
+    finally:
+        _enabled.reset(token)
+
+
+def parse_rate(rate):
+    # "30/min" -> (30, 60): bucket size and the seconds it takes to refill
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period[0]]
+
+
+def take_token(state, capacity, period, now):
+    """(tokens, stamp) after refilling and taking a token, and the seconds to wait (0 when taken)."""
+    if state is None:
+        tokens = capacity
+    else:
+        tokens, stamp = state
+        tokens = min(capacity, tokens + (now - stamp) * capacity / period)
+
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) * period / capacity
+
+
+class MemoryStore:
+
+    blocking = False
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        # key -> (tokens, stamp, full_at), least recently used first
+        self.buckets = OrderedDict()
+
+    def take(self, key, capacity, period, now):
+        with self.lock:
+            entry = self.buckets.pop(key, None)
+            (tokens, stamp), wait = take_token(entry and entry[:2], capacity, period, now)
+            self.buckets[key] = (tokens, stamp, stamp + (capacity - tokens) * period / capacity)
+
+            # Buckets that are full again, or the least recently used beyond the limit
+            while self.buckets:
+                oldest = next(iter(self.buckets.values()))
+                if oldest[2] > now and len(self.buckets) <= self.max_keys:
+                    break
+                self.buckets.popitem(last=False)
+
+            return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class DjangoCacheStore:
+
+    blocking = True
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, period, now):
+        state, wait = take_token(self.cache.get(key), capacity, period, now)
+        # Expires once it would be full again
+        self.cache.set(key, state, timeout=int(period) + 1)
+        return wait
+
+    def clear(self):
+        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+
+    name = getattr(settings, 'THROTTLE_BACKEND', 'memory')
+    if name == 'none':
+        return None
+
+    with _store_lock:
+        if _store is None:
+            if name == 'django':
+                _store = DjangoCacheStore(getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default'))
+            else:
+                _store = MemoryStore(getattr(settings, 'THROTTLE_MAX_KEYS', 100000))
+        return _store
+
+
+def reset():
+    global _store
+
+    with _store_lock:
+        if _store is not None:
+            _store.clear()
+        _store = None
+
+
+def take(scope, client):
+    """Take a token of `client` in `scope`; returns the seconds to wait, 0 when the request may go ahead."""
+    rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+    store = get_store()
+    if rate is None or store is None or not _enabled.get():
+        return 0.0
+
+    capacity, period = parse_rate(rate)
+    return store.take(f'throttle:{scope}:{client}', capacity, period, time.time())
+
+
+class ScopedBucketThrottle(BaseThrottle):
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if scope is None:
+            return True
+
+        self.wait_seconds = take(scope, self.get_client(request))
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPBucketThrottle(ScopedBucketThrottle):
+
+    def get_scope(self, view):
+        scope = super().get_scope(view)
+        return f'{scope}_ip' if scope else None
+
+    def get_client(self, request):
+        return f'ip:{self.get_ident(request)}'
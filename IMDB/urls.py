@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.shortcuts import redirect
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from IMDB.instrumentation import MetricsView
+
 def root_redirect(request):
     return redirect('/api/schema/docs/')
 
@@ -28,6 +30,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include("watchmate.api.urls")),
     path('account/', include('UserApp.api.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/schema/docs/", SpectacularSwaggerView.as_view(url_name="schema"))
 ]
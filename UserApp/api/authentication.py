@@ -0,0 +1,165 @@
+"""
+JWT authentication without a database query per request.
+
+``CachedJWTAuthentication`` validates the access token's signature and expiry
+like ``JWTAuthentication`` and then serves the user from an in-process cache
+(``JWT_USER_CACHE_TTL`` seconds, at most ``JWT_USER_CACHE_SIZE`` users). The
+signals in UserApp.signals drop a user from the cache when it is saved or
+deleted, e.g. deactivated, in this process; other processes pick the change up
+when the entry expires, so keep the TTL short.
+
+Blacklisted token ids (``token_blacklist``) are kept in an in-process set
+that is reloaded every ``JWT_BLACKLIST_REFRESH_SECONDS`` and updated at once
+for tokens blacklisted in this process. Logging out blacklists the access
+token too, so it stops working before it expires. Refreshing a token still
+checks the blacklist tables directly.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch, get_md5_hash_password
+
+
+class UserCache:
+
+    # Keyed by str(pk), tokens carry the user id as a string
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, pk):
+        key = str(pk)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires, user = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+        # Every request gets its own instance
+        return copy.copy(user)
+
+    def set(self, user):
+        ttl = getattr(settings, 'JWT_USER_CACHE_TTL', 30)
+        if ttl <= 0:
+            return
+
+        key = str(user.pk)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, copy.copy(user))
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > getattr(settings, 'JWT_USER_CACHE_SIZE', 10000):
+                self.entries.popitem(last=False)
+
+    def invalidate(self, pk):
+        with self.lock:
+            self.entries.pop(str(pk), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class BlacklistCache:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.expires = {}
+            self.loaded_at = None
+
+    def reload(self):
+        # Only tokens that have not expired yet can still be presented
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        expires = dict(rows.values_list('token__jti', 'token__expires_at'))
+
+        with self.lock:
+            self.expires = expires
+            self.loaded_at = time.monotonic()
+
+    def contains(self, jti):
+        interval = getattr(settings, 'JWT_BLACKLIST_REFRESH_SECONDS', 30)
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > interval:
+            self.reload()
+
+        with self.lock:
+            return jti in self.expires
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.expires[jti] = expires_at
+
+    def discard(self, jti):
+        with self.lock:
+            self.expires.pop(jti, None)
+
+
+users = UserCache()
+blacklist = BlacklistCache()
+
+
+def blacklist_token(token):
+    """Blacklist a validated token of any type, e.g. the access token of a logout."""
+    jti = token[api_settings.JTI_CLAIM]
+
+    outstanding, created = OutstandingToken.objects.get_or_create(
+        jti=jti,
+        defaults={
+            'user_id': token.get(api_settings.USER_ID_CLAIM),
+            'token': str(token),
+            'created_at': token.current_time,
+            'expires_at': datetime_from_epoch(token['exp']),
+        },
+    )
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+
+        if blacklist.contains(token.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken(_('Token is blacklisted'))
+        return token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+
+        user = users.get(user_id) if user_id is not None else None
+        if user is None:
+            # Raises for unknown and inactive users, so only active users are cached
+            user = super().get_user(validated_token)
+            users.set(user)
+            return user
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+
+    # Same bearer token scheme in the OpenAPI schema
+    target_class = 'UserApp.api.authentication.CachedJWTAuthentication'
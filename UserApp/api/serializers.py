@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
 
 
 class RegistrationSerializers(serializers.ModelSerializer):
@@ -14,7 +16,12 @@ class RegistrationSerializers(serializers.ModelSerializer):
         extra_kwargs = {
             'password': {
                 'write_only': True
-            }
+            },
+            # No UniqueValidator: the insert in create() relies on the unique
+            # constraints instead of querying for the username first
+            'username': {
+                'validators': [UnicodeUsernameValidator()]
+            },
         }
 
     # Drf best practice is to overide create, not save
@@ -30,19 +37,26 @@ class RegistrationSerializers(serializers.ModelSerializer):
                 "error": "Passwords must be identical"
             })
         
-        # Check if email already exists
-        email = validated_data['email'].lower()
-        if User.objects.filter(email=email).exists():
-            raise serializers.ValidationError({
-                "error": "Email already exists"
-            })
-        
         # To set up the password
         # **validated_data only represents username and email 
         # because password1 and password2 have been removed by pop
         account = User(**validated_data)
-        # Hashes the password
+        account.email = User.objects.normalize_email(account.email)
+        # Hashes the password (the slow part) before the insert
         account.set_password(password)
-        account.save()
 
-        return account
\ No newline at end of file
+        # The unique username and case-insensitive email indexes reject
+        # duplicates, only a failed insert looks up which one it was
+        try:
+            with transaction.atomic():
+                account.save()
+        except IntegrityError:
+            if User.objects.filter(username=account.username).exists():
+                raise serializers.ValidationError({
+                    "username": ["A user with that username already exists."]
+                })
+            raise serializers.ValidationError({
+                "error": "Email already exists"
+            })
+
+        return account
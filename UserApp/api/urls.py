@@ -1,10 +1,9 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from UserApp.api.views import RegistrationAPIView, LogoutAPIView
+from UserApp.api.views import RegistrationAPIView, LogoutAPIView, TokenObtainAPIView, TokenRefreshAPIView
 
 urlpatterns = [
     path('register/', RegistrationAPIView.as_view(), name="register" ),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/', TokenObtainAPIView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshAPIView.as_view(), name='token_refresh'),
     path('logout/', LogoutAPIView.as_view(), name='logout')
 ]
\ No newline at end of file
@@ -1,16 +1,28 @@
+from django.db import transaction
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from drf_spectacular.utils import extend_schema
 
 
+from UserApp.api.authentication import blacklist_token
 from UserApp.api.serializers import RegistrationSerializers
 
+class TokenObtainAPIView(TokenObtainPairView):
+    throttle_scope = 'auth'
+
+
+class TokenRefreshAPIView(TokenRefreshView):
+    throttle_scope = 'auth'
+
+
 class LogoutAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'auth'
 
     def post(self, request):
         refresh_token = request.data.get("refresh")
@@ -25,13 +37,18 @@ class LogoutAPIView(APIView):
             token = RefreshToken(refresh_token)
 
             # Confirm that the refresh token belongs to the particular user
-            if token.get('user_id') != request.user.id:
+            # (simplejwt writes the user id claim as a string)
+            if str(token.get('user_id')) != str(request.user.id):
                 return Response(
                     {"detail": "Token does not belong to this user."},
                     status=status.HTTP_403_FORBIDDEN
                 )
             token.blacklist()
 
+            # The access token of this request stops working too, not only when it expires
+            if isinstance(request.auth, AccessToken):
+                blacklist_token(request.auth)
+
             return Response(
                 {"detail": "Logout successful."},
                 status=status.HTTP_205_RESET_CONTENT
@@ -47,6 +64,7 @@ class LogoutAPIView(APIView):
 
 class RegistrationAPIView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'register'
 
     @extend_schema(
         request=RegistrationSerializers,
@@ -58,13 +76,14 @@ class RegistrationAPIView(APIView):
         data = {}
 
         if serializers.is_valid():
-            account = serializers.save()
+            # The user and its OutstandingToken row commit together
+            with transaction.atomic():
+                account = serializers.save()
+                refresh = RefreshToken.for_user(account)
 
             data['response'] = "Registration Successful"
             data['username'] = account.username
             data['email'] = account.email
-
-            refresh = RefreshToken.for_user(account)
             data['token'] = {
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class UserappConfig(AppConfig):
     name = 'UserApp'
+
+    def ready(self):
+        # Connect the signal receivers
+        from UserApp import signals  # noqa: F401
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher as DjangoPBKDF2PasswordHasher
+
+
+class PBKDF2PasswordHasher(DjangoPBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 hasher with ``PASSWORD_HASH_ITERATIONS`` iterations (Django's
+    default when 0). Hashing is most of the cost of a registration or login;
+    load tests can lower it. Passwords hashed with another count still verify
+    and are rehashed with the current one on the next login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', 0) or DjangoPBKDF2PasswordHasher.iterations
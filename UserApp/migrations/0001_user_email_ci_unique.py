@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 23:55
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    # Accounts are not merged or renamed behind anyone's back: list the
+    # addresses that differ only in case and stop before the index fails
+    User = apps.get_model('auth', 'User')
+
+    duplicates = list(
+        User.objects.exclude(email='').annotate(email_ci=Lower('email')).order_by()
+        .values('email_ci').annotate(users=Count('id')).filter(users__gt=1)
+        .values_list('email_ci', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Several users share an email address up to case, change or clear all but one of "
+            "them before migrating: " + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    # Registration relies on it rather than looking the address up first.
+    # Blank emails (e.g. createsuperuser without one) are left out.
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_ci_uniq ON auth_user (LOWER(email)) WHERE email <> ''",
+            "DROP INDEX auth_user_email_ci_uniq",
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from UserApp.api import authentication
+
+
+# Saved users (password changes, deactivation...) are read again on their next request
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    authentication.users.invalidate(instance.pk)
+
+
+# Tokens blacklisted by this process are refused at once, not at the next reload
+
+@receiver(post_save, sender=BlacklistedToken)
+def add_blacklisted_token(sender, instance, **kwargs):
+    authentication.blacklist.add(instance.token.jti, instance.token.expires_at)
+
+
+@receiver(post_delete, sender=BlacklistedToken)
+def remove_blacklisted_token(sender, instance, **kwargs):
+    authentication.blacklist.discard(instance.token.jti)
@@ -1,8 +1,16 @@
+from importlib import import_module
+
+from django.apps import apps
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
 from django.urls import reverse
 
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from UserApp.api import authentication
 
 # Create your tests here.
 
@@ -24,6 +32,52 @@ class RegisterTests(APITestCase):
         self.assertIsInstance(response.data, dict)
 
 
+class RegistrationPipelineTests(APITestCase):
+
+    def register(self, username, email):
+        data = {"username": username, "email": email, "password": "password321#", "password2": "password321#"}
+        return self.client.post(reverse('register'), data)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_register_inserts_without_lookups(self):
+        # The user and its refresh token, in a savepoint each within the test's transaction
+        with self.assertNumQueries(6):
+            response = self.register("jude", "Example159@Example.COM")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        user = User.objects.get(username="jude")
+        self.assertEqual(user.email, "Example159@example.com")
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$1000$"))
+        self.assertTrue(user.check_password("password321#"))
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_duplicates_are_rejected_by_the_indexes(self):
+        self.register("jude", "example159@example.com")
+
+        response = self.register("other", "EXAMPLE159@example.com")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], "Email already exists")
+
+        response = self.register("jude", "another@example.com")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', response.data)
+
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_migration_stops_on_case_duplicates(self):
+        migration = import_module('UserApp.migrations.0001_user_email_ci_unique')
+        User.objects.create_user(username="jude", email="example159@example.com")
+        migration.check_duplicate_emails(apps, None)
+
+        # As before the index, rolled back with the test
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX auth_user_email_ci_uniq")
+        User.objects.create_user(username="other", email="Example159@example.com")
+
+        with self.assertRaisesMessage(RuntimeError, "example159@example.com"):
+            migration.check_duplicate_emails(apps, None)
+
+
     
 class LogoutTests(APITestCase):
 
@@ -43,4 +97,56 @@ class LogoutTests(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertIsInstance(response.data, dict)
-        self.assertEqual(response.data['detail'], 'Token does not belong to this user.')
\ No newline at end of file
+        self.assertEqual(response.data['detail'], 'Token does not belong to this user.')
+
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="jude", email="example159@example.com", password="password321#")
+
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "jude", "password": "password321#"})
+        self.tokens = response.data
+
+        authentication.blacklist.reset()
+
+    def authenticate(self, access=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {access or self.tokens['access']}")
+        return authentication.CachedJWTAuthentication().authenticate(request)
+
+    def test_user_is_cached(self):
+        # The user row and the blacklist are read once
+        with self.assertNumQueries(2):
+            user, token = self.authenticate()
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user.username, "jude")
+
+    def test_saved_user_is_read_again(self):
+        self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_logout_blacklists_access_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+        response = self.client.post(reverse('logout'), {"refresh": self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+
+        with self.assertRaises(InvalidToken):
+            self.authenticate()
+
+        response = self.client.post(reverse('logout'), {"refresh": self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Other processes see it on their next reload
+        authentication.blacklist.reset()
+        with self.assertRaises(InvalidToken):
+            self.authenticate()
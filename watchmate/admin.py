@@ -2,6 +2,16 @@ from django.contrib import admin
 from .models import StreamPlatform, WatchList, Review
 
 # Register your models here.
+
+# __str__ of both models reads a related object, so join it in for the changelists
+class WatchListAdmin(admin.ModelAdmin):
+    list_select_related = ('platform',)
+
+
+class ReviewAdmin(admin.ModelAdmin):
+    list_select_related = ('review_user', 'watchlist')
+
+
 admin.site.register(StreamPlatform)
-admin.site.register(WatchList)
-admin.site.register(Review)
\ No newline at end of file
+admin.site.register(WatchList, WatchListAdmin)
+admin.site.register(Review, ReviewAdmin)
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Async variants of the catalog and review read endpoints, for ASGI deployments
+(``ASYNC_READ_VIEWS = True``, see watchmate/api/urls.py).
+
+GET requests are answered natively: rows come from the async ORM (``aget``,
+``acount``, ``async for``) so the worker serves other requests while waiting
+on the database, and serialization then runs on the fetched rows without any
+further queries. The response cache and the ETag handling are the same as on
+the DRF views and the cache entries are shared with them.
+
+Everything else goes to the DRF view the async one stands in for, run in a
+thread: writes, and reads with query parameters only the DRF view handles
+(``sync_params``).
+
+Before a read, the DRF view's authentication, permission and throttle checks
+run in a thread (``check``), so reads are authenticated, refused and throttled
+per user or IP address exactly as on the DRF views (see IMDB/throttling.py).
+"""
+
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import InvalidPage, Paginator
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.request import Request
+
+from watchmate.cache import cache_response
+from watchmate.models import Review, StreamPlatform, WatchList
+from watchmate.api import views
+from watchmate.api.conditional import latest_update, make_etag, not_modified, row_state, set_validators
+from watchmate.api.pagination import WatchListPagination
+from watchmate.api.renderers import FastJSONRenderer
+from watchmate.api.serializers import ReviewSerializers, StreamPlatformSerializers, WatchListSerializers
+
+
+def render(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def not_found(model=None):
+    # Same bodies as the 404s of the DRF views
+    detail = f'No {model.__name__} matches the given query.' if model else 'Not found.'
+    return render({'detail': detail}, status=404)
+
+
+class AsyncReadView(View):
+    """
+    Subclasses set ``sync_view`` and define ``async def read(self, request,
+    **kwargs)``, which answers the plain GETs.
+    """
+
+    # The DRF view that handles everything but plain reads
+    sync_view = None
+    sync_params = ()
+
+    sync_handler = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        if cls.sync_view is None or not inspect.iscoroutinefunction(getattr(cls, 'read', None)):
+            raise ImproperlyConfigured(f'{cls.__name__} must set sync_view and define an async read() method')
+
+        view = super().as_view(sync_handler=cls.sync_view.as_view(), **initkwargs)
+
+        # Authentication and CSRF are the DRF view's job, as for its own as_view()
+        view.csrf_exempt = True
+
+        # Lets the schema generator document the DRF view
+        view.cls = cls.sync_view
+        view.initkwargs = {}
+        return view
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_handler)(request, *args, **kwargs)
+
+    post = put = patch = delete = options = delegate
+
+    async def get(self, request, *args, **kwargs):
+        if any(param in request.GET for param in self.sync_params):
+            return await self.delegate(request, *args, **kwargs)
+
+        response = await self.check(request, *args, **kwargs)
+        if response is not None:
+            return response
+        return await self.read(request, *args, **kwargs)
+
+    async def check(self, request, *args, **kwargs):
+        # The DRF view's initial(): authentication, permissions and throttles,
+        # with the same error responses as the DRF view's own
+        view = self.sync_view()
+        view.args, view.kwargs = args, kwargs
+        view.headers = view.default_response_headers
+        view.request = view.initialize_request(request, *args, **kwargs)
+        try:
+            await sync_to_async(view.initial)(view.request, *args, **kwargs)
+        except Exception as exc:
+            response = view.finalize_response(view.request, view.handle_exception(exc), *args, **kwargs)
+            return response.render()
+        return None
+
+    def conditional(self, request, data, etag, last_modified=None):
+        response = not_modified(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+        return set_validators(render(data), etag=etag, last_modified=last_modified)
+
+
+class WatchlistAsync(AsyncReadView):
+
+    sync_view = views.WatchlistAV
+    sync_params = ('search', 'pagination', 'cursor', 'fields', 'exclude')
+
+    pagination_class = WatchListPagination
+
+    @cache_response(tags=['watch'], timeout=30)
+    async def read(self, request):
+        # Page number pagination as in WatchListPagination, with the COUNT
+        # and the page fetched through the async ORM
+        pagination = self.pagination_class()
+        pagination.request = Request(request)
+
+        paginator = Paginator(WatchList.objects.order_by('-created'), pagination.get_page_size(pagination.request))
+        paginator.count = await paginator.object_list.acount()
+
+        number = request.GET.get(pagination.page_query_param) or 1
+        if number in pagination.last_page_strings:
+            number = paginator.num_pages
+        try:
+            page = paginator.page(number)
+        except InvalidPage:
+            return render({'detail': 'Invalid page.'}, status=404)
+
+        page.object_list = [title async for title in page.object_list]
+        pagination.page = page
+
+        envelope = pagination.get_paginated_response([]).data
+        etag = make_etag(request, [row_state(row) for row in page.object_list], envelope)
+
+        data = pagination.get_paginated_response(WatchListSerializers(page.object_list, many=True).data).data
+        return self.conditional(request, data, etag, latest_update(page.object_list))
+
+
+class WatchlistdetailAsync(AsyncReadView):
+
+    sync_view = views.WatchlistdetailAV
+    sync_params = ('fields', 'exclude')
+
+    @cache_response(tags=['watch:{pk}'])
+    async def read(self, request, pk):
+        try:
+            title = await WatchList.objects.aget(pk=pk)
+        except WatchList.DoesNotExist:
+            return not_found(WatchList)
+
+        etag = make_etag(request, title.pk, title.updated)
+        return self.conditional(request, WatchListSerializers(title).data, etag, title.updated)
+
+
+class ReviewlistAsync(AsyncReadView):
+
+    sync_view = views.ReviewlistAV
+    sync_params = ('pagination', 'cursor', 'fields', 'exclude')
+
+    @cache_response(tags=['reviews:{pk}'])
+    async def read(self, request, pk):
+        reviews = [review async for review in Review.objects.for_api().filter(watchlist=pk).order_by('-created')]
+
+        etag = make_etag(request, [row_state(row) for row in reviews], None)
+        return self.conditional(request, ReviewSerializers(reviews, many=True).data, etag, latest_update(reviews))
+
+
+class ReviewdetailAsync(AsyncReadView):
+
+    sync_view = views.ReviewdetailAV
+    sync_params = ('fields', 'exclude')
+
+    async def read(self, request, pk):
+        try:
+            review = await Review.objects.for_api().aget(pk=pk)
+        except Review.DoesNotExist:
+            return not_found(Review)
+
+        etag = make_etag(request, review.pk, review.updated)
+        return self.conditional(request, ReviewSerializers(review).data, etag, review.updated)
+
+
+class StreamplatformListAsync(AsyncReadView):
+
+    sync_view = views.StreamplatformList
+    sync_params = ('fields', 'exclude', 'watchlist_size')
+
+    @cache_response(tags=['stream', 'watch'], timeout=300)
+    async def read(self, request):
+        platforms = [platform async for platform in StreamPlatform.objects.with_watchlist()]
+        return render(StreamPlatformSerializers(platforms, many=True).data)
+
+
+class StreamplatformDetailAsync(AsyncReadView):
+
+    sync_view = views.StreamplatformDetail
+    sync_params = ('fields', 'exclude', 'watchlist_size')
+
+    @cache_response(tags=['stream:{pk}', 'watch'], timeout=300)
+    async def read(self, request, pk):
+        try:
+            platform = await StreamPlatform.objects.with_watchlist().aget(pk=pk)
+        except StreamPlatform.DoesNotExist:
+            return not_found()
+        return render(StreamPlatformSerializers(platform).data)
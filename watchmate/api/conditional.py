@@ -0,0 +1,101 @@
+"""
+Conditional GETs (ETag / Last-Modified -> 304) for the generic views.
+
+Validators come from the `updated` column of the rows the view fetches anyway,
+so a 304 costs no extra query and skips serialization and rendering. Lists
+hash the (id, updated) pairs of the page plus the pagination envelope (count,
+next/previous links), so additions and deletions change the ETag too. Both
+also send Last-Modified, the latest `updated` of the page's rows for lists;
+as it misses deletions, clients should prefer the ETag (If-None-Match wins
+over If-Modified-Since).
+"""
+
+import hashlib
+from calendar import timegm
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def make_etag(request, *parts):
+    # The query string (page, size, search, fields...) changes the body too
+    query = sorted(request.GET.lists())
+    raw = repr((request.path, query, parts))
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def row_state(row):
+    if isinstance(row, dict):
+        return row['id'], row['updated']
+    return row.pk, row.updated
+
+
+def latest_update(rows):
+    # Last-Modified of a list: its most recently updated row, None if empty
+    return max((row_state(row)[1] for row in rows), default=None)
+
+
+def not_modified(request, etag=None, last_modified=None):
+    # A 304 (or 412) response when the client's validators still match, else None
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+    # The 304 copies its validator headers from this placeholder
+    placeholder = set_validators(HttpResponse(), etag=etag, last_modified=last_modified)
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp, response=placeholder)
+    return None if response is placeholder else response
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+    return response
+
+
+class ConditionalListMixin:
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            rows = page
+            # count and next/previous links, without any results
+            envelope = self.get_paginated_response([]).data
+        else:
+            rows = list(queryset)
+            envelope = None
+
+        etag = make_etag(request, [row_state(row) for row in rows], envelope)
+        last_modified = latest_update(rows)
+
+        response = not_modified(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+
+        serializer = self.get_serializer(rows, many=True)
+        if page is not None:
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response(serializer.data)
+
+        return set_validators(response, etag=etag, last_modified=last_modified)
+
+
+class ConditionalRetrieveMixin:
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+
+        etag = make_etag(request, instance.pk, instance.updated)
+
+        response = not_modified(request, etag=etag, last_modified=instance.updated)
+        if response is not None:
+            return response
+
+        serializer = self.get_serializer(instance)
+        return set_validators(Response(serializer.data), etag=etag, last_modified=instance.updated)
@@ -0,0 +1,79 @@
+"""
+Sparse fieldsets: ``?fields=id,title`` only renders those fields and
+``?exclude=description`` renders all but those, on every watchmate endpoint
+that reads. Unknown names are ignored.
+
+The selection trims the SQL as well as the JSON: views map each field to the
+column it is read from (``field_lookups``) and only read the selected columns,
+with ``only()`` for serializers and ``values()`` for projections. Relations
+that are not selected are not joined at all.
+"""
+
+
+def split_fields(value):
+    # "id, title," -> ['id', 'title'], None when absent or empty
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()] or None
+
+
+def select_fields(names, fields=None, exclude=None):
+    """The names out of `names` (in their order) that `fields` and `exclude` keep."""
+    return [
+        name for name in names
+        if (fields is None or name in fields) and (exclude is None or name not in exclude)
+    ]
+
+
+def select_lookups(field_lookups, required=(), fields=None, exclude=None):
+    """The lookups to read for the selected fields, plus the `required` ones."""
+    lookups = [field_lookups[name] for name in select_fields(field_lookups, fields, exclude)]
+    lookups = [lookup for lookup in lookups if lookup]
+    return lookups + [lookup for lookup in required if lookup not in lookups]
+
+
+class SparseFieldsMixin:
+
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    # Serializer field -> the lookup it is read from; None only trims the output
+    field_lookups = None
+
+    # Read whatever is selected, conditional GETs and cursors need them
+    required_lookups = ('id',)
+
+    def get_field_selection(self):
+        # Responses to writes always have every field
+        if self.request.method not in ('GET', 'HEAD'):
+            return None, None
+
+        params = self.request.query_params
+        return split_fields(params.get(self.fields_query_param)), split_fields(params.get(self.exclude_query_param))
+
+    def get_selected_lookups(self):
+        fields, exclude = self.get_field_selection()
+        if self.field_lookups is None or (fields is None and exclude is None):
+            return None
+
+        return select_lookups(self.field_lookups, self.required_lookups, fields, exclude)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        lookups = self.get_selected_lookups()
+        if lookups is None:
+            return queryset
+
+        # A deferred relation can't be select_related()
+        if not any('__' in lookup for lookup in lookups):
+            queryset = queryset.select_related(None)
+        return queryset.only(*lookups)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, exclude = self.get_field_selection()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if exclude is not None:
+            kwargs.setdefault('exclude', exclude)
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,16 @@
+from rest_framework import filters
+
+from watchmate import search
+
+
+class WatchListSearchFilter(filters.SearchFilter):
+
+    # Same ?search= parameter as SearchFilter, answered by the configured
+    # search backend and ordered by relevance
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+
+        if not terms:
+            return queryset
+
+        return search.get_backend(queryset.db).search(queryset, terms)
@@ -1,4 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class WatchListPagination(PageNumberPagination):
 
@@ -6,4 +14,221 @@ class WatchListPagination(PageNumberPagination):
     page_query_param = 'p'
     page_size_query_param = 'size'
     max_page_size = 10
-    last_page_strings = ('end',)
\ No newline at end of file
+    last_page_strings = ('end',)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination on `ordering` (created, id by default).
+
+    Each page is a plain `WHERE (created, id) < (last created, last id) LIMIT n`,
+    so deep pages cost the same as the first one. No COUNT query runs unless
+    the client asks for it with ?total=true.
+    """
+
+    page_size = 2
+    page_size_query_param = 'size'
+    max_page_size = 10
+    cursor_query_param = 'cursor'
+    total_query_param = 'total'
+
+    # The last field has to be unique so every row has a distinct position
+    ordering = ('-created', '-id')
+
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, row):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, queryset, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+
+            return [
+                queryset.model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (ValueError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, values):
+        # Rows strictly after `values` in `ordering`:
+        # a > x OR (a = x AND b > y) OR ...
+        condition = Q()
+        equal = {}
+
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+
+        self.count = None
+        if request.query_params.get(self.total_query_param, '').lower() == 'true':
+            self.count = queryset.count()
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(queryset, cursor)))
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset[:size + 1])
+        self.page = rows[:size]
+        self.has_next = len(rows) > size
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link()}
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer', 'description': f'Only present with ?{self.total_query_param}=true'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor returned in "next" of the previous page',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.total_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to true to include the total count',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+
+class SelectablePagination(BasePagination):
+    """
+    Lets the client choose between `page_pagination_class` and keyset
+    pagination per request: ?pagination=cursor or a ?cursor= parameter
+    selects the keyset mode. `default_mode` picks the mode per endpoint.
+    A page_pagination_class of None means unpaginated by default.
+    """
+
+    page_pagination_class = WatchListPagination
+    cursor_pagination_class = KeysetPagination
+    mode_query_param = 'pagination'
+    default_mode = 'page'
+
+    # Parameters that order the results their own way (?search= by relevance),
+    # which keyset pages on (created, id) would silently discard
+    ordered_query_params = ('search',)
+
+    def get_mode(self, request):
+        if request.query_params.get(self.cursor_query_param) is not None:
+            return 'cursor'
+        return request.query_params.get(self.mode_query_param, self.default_mode)
+
+    @property
+    def cursor_query_param(self):
+        return self.cursor_pagination_class.cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.get_mode(request) == 'cursor':
+            ordered = [param for param in self.ordered_query_params if request.query_params.get(param)]
+            if ordered:
+                raise ValidationError({
+                    self.mode_query_param: [f'Cursor pagination cannot be combined with ?{ordered[0]}=, use page pagination.'],
+                })
+            self.paginator = self.cursor_pagination_class()
+        elif self.page_pagination_class is not None:
+            self.paginator = self.page_pagination_class()
+        else:
+            return None
+
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        if self.page_pagination_class is None:
+            return schema
+        return self.page_pagination_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [{
+            'name': self.mode_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Set to "cursor" for keyset pagination',
+            'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+        }]
+        if self.page_pagination_class is not None:
+            parameters += self.page_pagination_class().get_schema_operation_parameters(view)
+        parameters += self.cursor_pagination_class().get_schema_operation_parameters(view)
+
+        # Both paginators take ?size=, only list it once
+        unique = {}
+        for parameter in parameters:
+            unique.setdefault(parameter['name'], parameter)
+        return list(unique.values())
+
+
+class WatchListSelectablePagination(SelectablePagination):
+
+    page_pagination_class = WatchListPagination
+
+
+class ReviewListPagination(SelectablePagination):
+
+    # Review lists stay unpaginated unless a cursor page is asked for
+    page_pagination_class = None
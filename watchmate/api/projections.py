@@ -0,0 +1,159 @@
+"""
+Read-only serialization of ``values()`` rows for the hot list endpoints.
+
+A projection renders the same JSON as its ModelSerializer (same keys in the
+same order, same values once encoded) from plain dicts read straight off the
+database cursor. Model instances are never built and no per-field Python runs:
+no field introspection, no ``to_representation()`` per field and value.
+Datetimes are left as they are for the renderer to encode
+(see watchmate/api/renderers.py).
+
+Views opt in with ``projection_class`` (``ProjectionMixin``); writes and the
+schema still go through the serializer. Sparse fieldsets (?fields=, ?exclude=,
+see watchmate/api/fields.py) narrow the values() to the selected columns.
+"""
+
+from collections import defaultdict
+
+from IMDB.instrumentation import timed
+from watchmate.api.fields import SparseFieldsMixin, select_fields, select_lookups
+from watchmate.models import WatchList
+
+
+class Projection:
+
+    # Output key -> values() lookup, in the order of the serializer's fields
+    fields = {}
+
+    # Read whatever is selected, conditional GETs and cursors need them
+    required = ('id', 'created', 'updated')
+
+    def __init__(self, instance=None, many=False, fields=None, exclude=None):
+        self.instance = instance
+        self.many = many
+
+        # Same as DynamicFieldsMixin, unknown names are ignored
+        self.output = select_fields(self.fields, fields, exclude)
+
+    @classmethod
+    def values(cls, queryset, fields=None, exclude=None):
+        return queryset.values(*select_lookups(cls.fields, cls.required, fields, exclude))
+
+    def to_representation(self, row):
+        return {name: row[self.fields[name]] for name in self.output}
+
+    def represent(self, rows):
+        # values() rows already have the serializer's keys, in order
+        if self.output == list(self.fields) and all(name == lookup for name, lookup in self.fields.items()):
+            return rows
+        return [self.to_representation(row) for row in rows]
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            if self.many:
+                return self.represent(list(self.instance))
+            return self.represent([self.instance])[0]
+
+
+class WatchListProjection(Projection):
+
+    fields = {
+        'id': 'id',
+        'title': 'title',
+        'description': 'description',
+        'active': 'active',
+        'avg_rating': 'avg_rating',
+        'number_rating': 'number_rating',
+        'rating_sum': 'rating_sum',
+        'created': 'created',
+        'updated': 'updated',
+        'platform': 'platform',
+    }
+
+
+class ReviewProjection(Projection):
+
+    fields = {
+        'id': 'id',
+        # StringRelatedField, i.e. str(user)
+        'review_user': 'review_user__username',
+        'description': 'description',
+        'rating': 'rating',
+        'active': 'active',
+        'created': 'created',
+        'updated': 'updated',
+        'watchlist': 'watchlist',
+    }
+
+
+class StreamPlatformProjection(Projection):
+
+    fields = {
+        'id': 'id',
+        'watchlist': None,
+        'name': 'name',
+        'about': 'about',
+        'website': 'website',
+    }
+
+    required = ('id',)
+
+    title_projection = WatchListProjection
+
+    def __init__(self, instance=None, many=False, fields=None, exclude=None, watchlist_size=None):
+        super().__init__(instance, many, fields, exclude)
+        self.watchlist_size = watchlist_size
+
+    def watchlists(self, rows):
+        # One query for the titles of every platform, like with_watchlist()
+        titles = WatchList.objects.filter(platform__in=[row['id'] for row in rows])
+        titles = self.title_projection.values(titles.latest_per_platform(self.watchlist_size))
+
+        # represent() rather than .data, the serializer time is counted by the outer .data
+        by_platform = defaultdict(list)
+        for title in self.title_projection(many=True).represent(list(titles)):
+            by_platform[title['platform']].append(title)
+        return by_platform
+
+    def represent(self, rows):
+        watchlists = self.watchlists(rows) if 'watchlist' in self.output else {}
+
+        return [
+            {name: watchlists.get(row['id'], []) if name == 'watchlist' else row[name] for name in self.output}
+            for row in rows
+        ]
+
+
+class ProjectionMixin(SparseFieldsMixin):
+
+    # GET lists of a generic view go through `projection_class`: the filtered
+    # queryset is narrowed to its values() and the rows rendered by it
+    projection_class = None
+
+    @property
+    def field_lookups(self):
+        return self.projection_class.fields if self.projection_class else None
+
+    @property
+    def required_lookups(self):
+        return self.projection_class.required if self.projection_class else ('id',)
+
+    def use_projection(self):
+        # The schema generator inspects the serializer
+        if getattr(self, 'swagger_fake_view', False):
+            return False
+        return self.projection_class is not None and self.request.method in ('GET', 'HEAD')
+
+    def filter_queryset(self, queryset):
+        # After the filters, so annotations they add (e.g. the search rank) stay out of the rows
+        queryset = super().filter_queryset(queryset)
+        if self.use_projection():
+            queryset = self.projection_class.values(queryset, *self.get_field_selection())
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.use_projection() and kwargs.get('many'):
+            fields, exclude = self.get_field_selection()
+            return self.projection_class(*args, fields=fields, exclude=exclude, **kwargs)
+        return super().get_serializer(*args, **kwargs)
@@ -1,8 +1,39 @@
 from rest_framework import serializers
-from watchmate.models import StreamPlatform, WatchList, Review
 
+from IMDB.instrumentation import timed
+from watchmate.api.fields import select_fields
+from watchmate.models import StreamPlatform, WatchList, Review, PlatformStats
 
-class ReviewSerializers(serializers.ModelSerializer):
+
+class TimedDataMixin:
+
+    # Building .data counts as serializer time in the request metrics.
+    # Only the outermost serializer's .data is read, so nothing is counted twice
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class DynamicFieldsMixin:
+
+    # Pass fields=[...] to only render those fields, exclude=[...] to leave some out
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        exclude = kwargs.pop('exclude', None)
+
+        super().__init__(*args, **kwargs)
+
+        if fields is not None or exclude is not None:
+            for name in set(self.fields) - set(select_fields(self.fields, fields, exclude)):
+                self.fields.pop(name)
+
+
+class ReviewSerializers(TimedDataMixin, DynamicFieldsMixin, serializers.ModelSerializer):
 
     review_user = serializers.StringRelatedField(read_only=True)
 
@@ -11,22 +42,66 @@ class ReviewSerializers(serializers.ModelSerializer):
         model = Review
 
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
+
+
+class ReviewBulkSerializer(ReviewSerializers):
 
+    # Titles are resolved in bulk by watchmate.reviews
+    watchlist = serializers.IntegerField()
 
-class WatchListSerializers(serializers.ModelSerializer):
+    class Meta(ReviewSerializers.Meta):
+
+        # The one-review-per-user check is done for the whole batch at once
+        validators = []
+
+
+class WatchListSerializers(TimedDataMixin, DynamicFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
 
         model = WatchList
         fields = '__all__'
 
+        # Maintained by watchmate.ratings from the reviews
+        read_only_fields = ['avg_rating', 'number_rating', 'rating_sum']
+        list_serializer_class = TimedListSerializer
+
+
+
+class ScoredWatchListSerializers(WatchListSerializers):
+
+    # The ranking or recommendation score, added by ScoredTitlesMixin
+    score = serializers.FloatField(read_only=True)
+
+
+
+class WatchListImportSerializer(WatchListSerializers):
+
+    # watchmate.importer resolves platforms from memory, so skip the per-row lookup
+    platform = serializers.IntegerField()
+
         
 
-class StreamPlatformSerializers(serializers.ModelSerializer):
+class StreamPlatformSerializers(TimedDataMixin, DynamicFieldsMixin, serializers.ModelSerializer):
 
     watchlist = WatchListSerializers(many=True, read_only=True)
 
     class Meta:
 
         model = StreamPlatform
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = TimedListSerializer
+
+
+
+class PlatformStatsSerializers(TimedDataMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+
+    avg_rating = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+
+        model = PlatformStats
+        fields = ['platform', 'title_count', 'active_count', 'review_count', 'avg_rating', 'rating_histogram', 'top_titles', 'updated']
+        list_serializer_class = TimedListSerializer
@@ -1,13 +1,42 @@
+from django.conf import settings
 from django.urls import path
+from IMDB.routers import read_from_replicas
 from watchmate.api import views
 
+# Under ASGI the read endpoints can be served by async views, which hand
+# everything else to the DRF views below (see watchmate/api/async_views.py)
+if getattr(settings, 'ASYNC_READ_VIEWS', False):
+    from watchmate.api import async_views
+
+    stream_list = async_views.StreamplatformListAsync.as_view()
+    stream_detail = async_views.StreamplatformDetailAsync.as_view()
+    movie_list = async_views.WatchlistAsync.as_view()
+    movie_detail = async_views.WatchlistdetailAsync.as_view()
+    review_list = async_views.ReviewlistAsync.as_view()
+    review_detail = async_views.ReviewdetailAsync.as_view()
+else:
+    stream_list = views.StreamplatformList.as_view()
+    stream_detail = views.StreamplatformDetail.as_view()
+    movie_list = views.WatchlistAV.as_view()
+    movie_detail = views.WatchlistdetailAV.as_view()
+    review_list = views.ReviewlistAV.as_view()
+    review_detail = views.ReviewdetailAV.as_view()
+
 urlpatterns = [
-    path("stream/", views.StreamplatformList.as_view(), name='stream-list'),
-    path("stream/<int:pk>/", views.StreamplatformDetail.as_view(), name="stream-detail"),
-    path("watch/", views.WatchlistAV.as_view(), name="movie-list"),
-    path("watch/<int:pk>/", views.WatchlistdetailAV.as_view(), name="movie-detail"),
+    path("stream/", read_from_replicas(stream_list), name='stream-list'),
+    path("stream/<int:pk>/", read_from_replicas(stream_detail), name="stream-detail"),
+    path("stream/<int:pk>/stats/", read_from_replicas(views.StreamplatformStats.as_view()), name="stream-stats"),
+    path("export/<str:name>/", views.CatalogExport.as_view(), name="catalog-export"),
+    path("watch/", read_from_replicas(movie_list), name="movie-list"),
+    path("watch/import/", views.CatalogImport.as_view(), name="catalog-import"),
+    path("watch/top/", read_from_replicas(views.WatchlistRanking.as_view(ranking_name='top')), name="movie-top"),
+    path("watch/trending/", read_from_replicas(views.WatchlistRanking.as_view(ranking_name='trending')), name="movie-trending"),
+    path("watch/<int:pk>/", read_from_replicas(movie_detail), name="movie-detail"),
+    path("watch/<int:pk>/similar/", read_from_replicas(views.WatchlistSimilar.as_view()), name="movie-similar"),
     path("<int:pk>/review/create/", views.ReviewcreateAV.as_view(), name="review-create"),
-    path("<int:pk>/reviews/", views.ReviewlistAV.as_view(), name="review-list"),
-    path("review/<int:pk>/", views.ReviewdetailAV.as_view(), name="review-detail"),
-    path("user/reviews/", views.UserReview.as_view(), name="user-review-list")
-]
\ No newline at end of file
+    path("review/bulk/", views.ReviewBulkCreate.as_view(), name="review-bulk-create"),
+    path("<int:pk>/reviews/", read_from_replicas(review_list), name="review-list"),
+    path("review/<int:pk>/", read_from_replicas(review_detail), name="review-detail"),
+    path("user/reviews/", views.UserReview.as_view(), name="user-review-list"),
+    path("user/recommendations/", views.UserRecommendations.as_view(), name="user-recommendations"),
+]
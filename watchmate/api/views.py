@@ -1,33 +1,49 @@
-from django.http import Http404
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404, StreamingHttpResponse
+from django.db import IntegrityError, transaction
 
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 from rest_framework import status, generics
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework import filters
-from drf_spectacular.utils import extend_schema
-
-from watchmate.models import WatchList, StreamPlatform, Review
-from watchmate.api.serializers import StreamPlatformSerializers, WatchListSerializers, ReviewSerializers
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, SAFE_METHODS
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+
+from watchmate import export, importer, queue, ranking, recommendations, reviews, tasks
+from watchmate.cache import cache_response
+from watchmate.models import WatchList, StreamPlatform, Review, PlatformStats
+from watchmate.api.serializers import StreamPlatformSerializers, WatchListSerializers, ScoredWatchListSerializers, ReviewSerializers, ReviewBulkSerializer, PlatformStatsSerializers
+from watchmate.api.conditional import ConditionalListMixin, ConditionalRetrieveMixin
+from watchmate.api.fields import SparseFieldsMixin, select_fields
+from watchmate.api.projections import ProjectionMixin, WatchListProjection, ReviewProjection, StreamPlatformProjection
+from watchmate.api.renderers import FastJSONRenderer
 from watchmate.api.permissions import IsAdminOrReadonly, IsReviewOrReadonly
-from watchmate.api.pagination import WatchListPagination
+from watchmate.api.pagination import WatchListPagination, WatchListSelectablePagination, ReviewListPagination
+from watchmate.api.filters import WatchListSearchFilter
+
 
+class UserReview(ProjectionMixin, ConditionalListMixin, generics.ListAPIView):
 
-class UserReview(generics.ListAPIView):
+    throttle_scope = 'catalog'
 
     serializer_class = ReviewSerializers
+    pagination_class = ReviewListPagination
+
+    projection_class = ReviewProjection
+    renderer_classes = [FastJSONRenderer]
 
     def get_queryset(self):
         user = self.request.query_params.get('username', None)
 
-        return Review.objects.filter(review_user__username = user).order_by("-created")
+        return Review.objects.for_api().filter(review_user__username = user).order_by("-created")
 
 
 
 class ReviewcreateAV(generics.CreateAPIView):
 
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'review'
 
     serializer_class = ReviewSerializers
 
@@ -40,109 +56,302 @@ class ReviewcreateAV(generics.CreateAPIView):
         pk = self.kwargs.get('pk')
         movie = WatchList.objects.get(pk=pk)
 
-        # To ensure that the user can only review once
         review_user = self.request.user
-        review_queryset = Review.objects.filter(watchlist=movie, review_user=review_user)
 
-        if review_queryset.exists():
+        # Save the review and fold its rating into the movie's running totals together.
+        # The unique constraint on (watchlist, review_user) ensures the user can only review once
+        try:
+            with transaction.atomic():
+                review = serializer.save(watchlist=movie, review_user=review_user)
+                queue.enqueue(
+                    tasks.review_added, key=f'review-added:{review.pk}:{review.created.isoformat()}',
+                    title_id=movie.pk, platform_id=movie.platform_id, rating=review.rating,
+                )
+                ranking.review_added(movie.pk, movie.platform_id, review.rating, review.created)
+        except IntegrityError:
             raise ValidationError("You have already reviewed this Movie")
-        
-        # To calculate rating
 
-        if movie.number_rating == 0:
-            movie.avg_rating = serializer.validated_data["rating"]
-        else: 
-            movie.avg_rating = (movie.avg_rating + serializer.validated_data["rating"])/2
-        
-        movie.number_rating = movie.number_rating + 1
-        movie.save()
-        
-        # save serializer
-        serializer.save(watchlist=movie, review_user=review_user)
 
+class ReviewBulkCreate(APIView):
+
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'review'
+
+    @extend_schema(
+        request=ReviewBulkSerializer(many=True),
+        responses={201: dict, 207: dict, 400: dict},
+    )
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError('Expected a list of reviews')
 
-class ReviewlistAV(generics.ListAPIView):
+        limit = getattr(settings, 'REVIEW_BULK_MAX_ITEMS', 500)
+        if len(items) > limit:
+            raise ValidationError(f'At most {limit} reviews per request')
+
+        results = reviews.submit(items, request.user)
+
+        created = sum('id' in result for result in results)
+        if created == len(results):
+            code = status.HTTP_201_CREATED
+        elif created:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+
+        return Response({'created': created, 'results': results}, status=code)
+
+
+class ReviewlistAV(ProjectionMixin, ConditionalListMixin, generics.ListAPIView):
 
     permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
+    pagination_class = ReviewListPagination
     
     serializer_class = ReviewSerializers
 
+    projection_class = ReviewProjection
+    renderer_classes = [FastJSONRenderer]
+
+    @cache_response(tags=['reviews:{pk}'])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         pk= self.kwargs['pk']
 
-        return Review.objects.filter(watchlist=pk).order_by("-created")
+        return Review.objects.for_api().filter(watchlist=pk).order_by("-created")
 
 
 
-class ReviewdetailAV(generics.RetrieveUpdateDestroyAPIView):
+class ReviewdetailAV(SparseFieldsMixin, ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
 
     serializer_class = ReviewSerializers
     permission_classes = [IsReviewOrReadonly]
 
-    def get_queryset(self):
-        return Review.objects.all()
-    
+    queryset = Review.objects.for_api()
+
+    field_lookups = ReviewProjection.fields
+    required_lookups = ('id', 'updated')
+
+    @property
+    def throttle_scope(self):
+        # Reads are catalog traffic, edits and deletes count as review writes
+        return 'catalog' if self.request.method in SAFE_METHODS else 'review'
+
     def perform_update(self, serializer):
-        pk = self.kwargs['pk']
-        review = Review.objects.get(pk=pk)
+        review = serializer.instance
         movie = review.watchlist
 
         review_user = self.request.user
         review_queryset = Review.objects.filter(watchlist=movie, review_user=review_user)
 
         if review_queryset.exists():
-            
-            # rating calculation
-            if movie.number_rating == 0 :
-                movie.avg_rating = serializer.validated_data['rating']
-            else:
-                movie.avg_rating = (movie.avg_rating + serializer.validated_data['rating'])/2
-            movie.number_rating = movie.number_rating + 1
-
-            movie.save()
-
-            serializer.save(watchlist=movie, review_user=review_user)
+            # Only the difference between the old and new rating touches the movie
+            with transaction.atomic():
+                # The locked row's rating, a concurrent edit of the same review waits for this one
+                old_rating = Review.objects.select_for_update().values_list('rating', flat=True).get(pk=review.pk)
+                review = serializer.save(watchlist=movie, review_user=review_user)
+                queue.enqueue(
+                    tasks.review_changed, key=f'review-changed:{review.pk}:{review.updated.isoformat()}',
+                    title_id=movie.pk, platform_id=movie.platform_id, old_rating=old_rating, new_rating=review.rating,
+                )
+                ranking.review_changed(movie.pk, movie.platform_id, old_rating, review.rating, review.created)
         else:
             raise ValidationError('Update is impossible as this review is not yours')
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            key = f'review-removed:{instance.pk}:{instance.created.isoformat()}'
+            instance.delete()
+            queue.enqueue(
+                tasks.review_removed, key=key,
+                title_id=instance.watchlist_id, platform_id=instance.watchlist.platform_id, rating=instance.rating,
+            )
+            ranking.review_removed(instance.watchlist_id, instance.watchlist.platform_id, instance.rating, instance.created)
+
 
 
-class WatchlistAV(generics.ListCreateAPIView):
+class WatchlistAV(ProjectionMixin, ConditionalListMixin, generics.ListCreateAPIView):
 
     permission_classes= [IsAdminOrReadonly]
-    pagination_class = WatchListPagination
+    throttle_scope = 'catalog'
+    pagination_class = WatchListSelectablePagination
 
     queryset = WatchList.objects.all().order_by("-created")
 
     serializer_class = WatchListSerializers
 
-    filter_backends = [filters.SearchFilter]
+    projection_class = WatchListProjection
+    renderer_classes = [FastJSONRenderer]
+
+    filter_backends = [WatchListSearchFilter]
 
     search_fields = ['title', '=platform__name']
 
+    @cache_response(tags=['watch'], timeout=30)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+
+class ScoredTitlesMixin(SparseFieldsMixin):
+
+    # Titles in a precomputed order (rankings, recommendations): the views
+    # define get_scored_titles(), a sequence of (id, score) pairs. One query
+    # reads the rows of a page and each gets its score
+
+    permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
+    pagination_class = WatchListPagination
+
+    queryset = WatchList.objects.all()
+    serializer_class = ScoredWatchListSerializers
+    renderer_classes = [FastJSONRenderer]
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_scored_titles())
+        scores = dict(page)
+
+        fields, exclude = self.get_field_selection()
+        rows = WatchListProjection.values(WatchList.objects.filter(pk__in=scores), fields, exclude)
+        rows = {row['id']: row for row in rows}
+
+        # Titles deleted since the scores were computed are skipped
+        titles = [rows[pk] for pk in scores if pk in rows]
+        results = WatchListProjection(titles, many=True, fields=fields, exclude=exclude).data
+
+        if select_fields(['score'], fields, exclude):
+            for result, row in zip(results, titles):
+                result['score'] = round(scores[row['id']], 4)
+
+        return self.get_paginated_response(results)
+
+
+class WatchlistRanking(ScoredTitlesMixin, generics.ListAPIView):
+
+    # 'top' or 'trending', see watchmate/ranking.py
+    ranking_name = None
+
+    def get_platform(self):
+        platform = self.request.query_params.get('platform')
+        if platform is None:
+            return None
+        try:
+            return int(platform)
+        except ValueError:
+            raise ValidationError({'platform': ['A valid integer is required.']})
+
+    @extend_schema(
+        parameters=[OpenApiParameter('platform', int, description='Only rank the titles of this platform')],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_scored_titles(self):
+        return ranking.Ranking(self.ranking_name, self.get_platform())
+
 
+class WatchlistSimilar(ScoredTitlesMixin, generics.ListAPIView):
 
-class WatchlistdetailAV(generics.RetrieveUpdateDestroyAPIView):
+    # Precomputed by the build_recommendations command, see watchmate/recommendations.py
+
+    def get_scored_titles(self):
+        scored = recommendations.similar(self.kwargs['pk'])
+        if scored is None:
+            if not WatchList.objects.filter(pk=self.kwargs['pk']).exists():
+                raise Http404
+            return []
+        return scored
+
+
+class UserRecommendations(ScoredTitlesMixin, generics.ListAPIView):
+
+    permission_classes = [IsAuthenticated]
+
+    def get_scored_titles(self):
+        return recommendations.recommend(self.request.user.id)
+
+
+
+class WatchlistdetailAV(SparseFieldsMixin, ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
 
     permission_classes= [IsAdminOrReadonly]
+    throttle_scope = 'catalog'
 
     queryset = WatchList.objects.all()
 
     serializer_class = WatchListSerializers
 
+    field_lookups = WatchListProjection.fields
+    required_lookups = ('id', 'updated')
+
+    @cache_response(tags=['watch:{pk}'])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+
+class StreamPlatformQueryMixin(SparseFieldsMixin):
+
+    field_lookups = StreamPlatformProjection.fields
+    required_lookups = StreamPlatformProjection.required
 
+    # Upper bound for ?watchlist_size=, same as the WatchlistAV page size limit
+    max_watchlist_size = WatchListPagination.max_page_size
+
+    def get_watchlist_size(self):
+        # ?watchlist_size=N only nests the N most recent titles of each platform
+        try:
+            size = int(self.request.query_params.get('watchlist_size', ''))
+        except ValueError:
+            return None
+
+        if size <= 0:
+            return None
+        return min(size, self.max_watchlist_size)
+
+    def get_queryset(self):
+        queryset = StreamPlatform.objects.all()
+
+        lookups = self.get_selected_lookups()
+        if lookups is not None:
+            queryset = queryset.only(*lookups)
+
+        # Titles are only fetched when they are going to be rendered
+        if 'watchlist' in select_fields(self.field_lookups, *self.get_field_selection()):
+            queryset = queryset.with_watchlist(limit=self.get_watchlist_size())
+        return queryset
 
-class StreamplatformList(APIView):
+
+
+class StreamplatformList(StreamPlatformQueryMixin, APIView):
 
     permission_classes = [IsAdminOrReadonly]
+    throttle_scope = 'catalog'
+
+    # None renders model instances with StreamPlatformSerializers
+    projection_class = StreamPlatformProjection
+    renderer_classes = [FastJSONRenderer]
 
     @extend_schema(
         responses=StreamPlatformSerializers(many=True),
     )
+    @cache_response(tags=['stream', 'watch'], timeout=300)
     def get(self, request):
-        stream = StreamPlatform.objects.all()
+        fields, exclude = self.get_field_selection()
 
-        serializers = StreamPlatformSerializers(stream, many=True)
+        if self.projection_class is not None:
+            stream = self.projection_class.values(StreamPlatform.objects.all(), fields, exclude)
+            serializers = self.projection_class(
+                stream, many=True, fields=fields, exclude=exclude, watchlist_size=self.get_watchlist_size(),
+            )
+            return Response(serializers.data)
+
+        stream = self.get_queryset()
+
+        serializers = StreamPlatformSerializers(stream, many=True, fields=fields, exclude=exclude)
         return Response(serializers.data)
     
     @extend_schema(
@@ -159,27 +368,30 @@ class StreamplatformList(APIView):
   
         
 
-class StreamplatformDetail(APIView):
+class StreamplatformDetail(StreamPlatformQueryMixin, APIView):
 
     permission_classes = [IsAdminOrReadonly]
+    throttle_scope = 'catalog'
 
     @extend_schema(
         responses=StreamPlatformSerializers,
     )
     def get_object(self, pk):
         try:
-            return StreamPlatform.objects.get(pk=pk)
+            return self.get_queryset().get(pk=pk)
         except StreamPlatform.DoesNotExist:
             raise Http404
 
     @extend_schema(
         responses=StreamPlatformSerializers,
     )
+    @cache_response(tags=['stream:{pk}', 'watch'], timeout=300)
     def get(self, request, pk):
         
         stream = self.get_object(pk)
+        fields, exclude = self.get_field_selection()
 
-        serializers = StreamPlatformSerializers(stream)
+        serializers = StreamPlatformSerializers(stream, fields=fields, exclude=exclude)
         return Response(serializers.data)
 
     @extend_schema(
@@ -206,3 +418,70 @@ class StreamplatformDetail(APIView):
         return Response({
             "message": "Stream has been deleted successfully"
         }, status=status.HTTP_204_NO_CONTENT)
+
+
+
+class StreamplatformStats(SparseFieldsMixin, generics.RetrieveAPIView):
+
+    permission_classes = [IsAdminOrReadonly]
+    throttle_scope = 'catalog'
+
+    # Precomputed by watchmate.stats, so this is a single primary key lookup
+    queryset = PlatformStats.objects.all()
+
+    serializer_class = PlatformStatsSerializers
+
+
+
+class CatalogImport(APIView):
+
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        request={'multipart/form-data': {'type': 'object', 'properties': {'file': {'type': 'string', 'format': 'binary'}}}},
+        responses={200: dict},
+    )
+    def post(self, request):
+        # Either a multipart upload in "file" or the JSONL/CSV as the request body.
+        # Both are read line by line, the input is never loaded at once.
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                raise ValidationError({'file': ['No file was submitted.']})
+            lines, name = upload, upload.name
+        else:
+            lines, name = request.stream, ''
+
+        if lines is None:
+            raise ValidationError('Empty request body')
+
+        fmt = request.query_params.get('fmt') or importer.guess_format(name, request.content_type)
+        if fmt not in importer.FORMATS:
+            raise ValidationError({'fmt': [f'Must be one of {", ".join(importer.FORMATS)}.']})
+
+        report = importer.CatalogImporter().run(importer.read_rows(lines, fmt))
+        return Response(report)
+
+
+
+class CatalogExport(APIView):
+
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={200: str})
+    def get(self, request, name):
+        if name not in export.EXPORTS:
+            raise Http404
+
+        fmt = request.query_params.get('fmt', 'ndjson')
+        if fmt not in export.FORMATS:
+            raise ValidationError({'fmt': [f'Must be one of {", ".join(export.FORMATS)}.']})
+
+        try:
+            watermark = export.parse_watermark(request.query_params.get('since'), request.query_params.get('since_id'))
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages)
+
+        response = StreamingHttpResponse(export.render(name, fmt, watermark), content_type=export.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+        return response
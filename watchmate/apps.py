@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class WatchmateConfig(AppConfig):
     name = 'watchmate'
+
+    def ready(self):
+        # Connect the signal receivers
+        from watchmate import signals  # noqa: F401
@@ -0,0 +1,392 @@
+"""
+Benchmark suite for the API (see the bench_api and bench_compare commands).
+
+``seed`` generates a reproducible data set of platforms, titles, users and
+reviews with bulk inserts. Scenarios then drive the real URL routing,
+middleware and views in process through DRF's APIClient:
+
+- ``browse``: title list pages, ``?search=`` and title details
+- ``reviews``: review lists and review details
+- ``submit``: review creation and updates by authenticated users
+- ``auth``: JWT login and token refresh
+
+Every request is timed and its SQL queries counted, and the results are
+aggregated per endpoint (method and URL name) into req/s, p50/p95/p99 latency
+and queries per request.
+
+``serialization`` times the list payloads alone (fetch, serialize, render),
+ModelSerializer and JSONRenderer against projection and FastJSONRenderer
+(see the bench_serializers command).
+
+``recommendation_build`` times the item-item similarity build on synthetic
+ratings (see the bench_recommendations command).
+
+``registrations`` posts registrations from concurrent threads, each with its
+own client and database connection (see the bench_registrations command).
+"""
+
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from IMDB import throttling
+from watchmate import cache, ranking, ratings, recommendations, search, stats
+from watchmate.api.projections import ReviewProjection, StreamPlatformProjection, WatchListProjection
+from watchmate.api.renderers import FastJSONRenderer
+from watchmate.api.serializers import ReviewSerializers, StreamPlatformSerializers, WatchListSerializers
+from watchmate.models import Review, StreamPlatform, WatchList
+
+
+WORDS = (
+    "night dark star war love city lost king queen ghost river shadow fire "
+    "blood moon iron silent last secret dream storm wild broken golden"
+).split()
+
+PASSWORD = "bench-password"
+
+BATCH_SIZE = 5000
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def seed(rng, platforms=10, titles=2000, users=200, reviews=5000):
+    """Bulk insert a data set; returns the title ids, the users and the reviewed (user, title) pairs."""
+    platform_rows = StreamPlatform.objects.bulk_create(
+        StreamPlatform(name=f"bench{n}", about="Benchmark platform", website="https://example.com")
+        for n in range(platforms)
+    )
+
+    WatchList.objects.bulk_create(
+        (
+            WatchList(title=sentence(rng, 3), description=sentence(rng, 12), platform=rng.choice(platform_rows))
+            for _ in range(titles)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    title_ids = list(WatchList.objects.filter(platform__in=platform_rows).values_list('id', flat=True))
+
+    # Hashing once keeps seeding fast, logins still pay for the real check
+    password = make_password(PASSWORD)
+    usernames = [f"bench{n}" for n in range(users)]
+    User.objects.bulk_create((User(username=name, password=password) for name in usernames), batch_size=BATCH_SIZE)
+    user_rows = list(User.objects.filter(username__in=usernames).order_by('id'))
+
+    # One review per (user, title) pair at most
+    pairs = set()
+    limit = min(reviews, len(user_rows) * len(title_ids))
+    while len(pairs) < limit:
+        pairs.add((rng.choice(user_rows).id, rng.choice(title_ids)))
+
+    Review.objects.bulk_create(
+        (
+            Review(review_user_id=user, watchlist_id=title, rating=rng.randint(1, 5), description=sentence(rng, 8))
+            for user, title in sorted(pairs)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    # Bulk inserts skip the signals that keep these up to date
+    ratings.rebuild(WatchList.objects.filter(pk__in=title_ids))
+    stats.rebuild([platform.pk for platform in platform_rows])
+    search.index.reset()
+    ranking.index.reset()
+    cache.invalidate('catalog')
+
+    return title_ids, user_rows, pairs
+
+
+class Runner:
+
+    def __init__(self, rng, titles, users, reviewed):
+        self.rng = rng
+        self.titles = titles
+        self.users = users
+        self.reviewed = set(reviewed)
+
+        self.client = APIClient()
+        self.samples = defaultdict(list)
+        self.tokens = {}
+
+    def request(self, method, url, user=None, **kwargs):
+        if user is not None:
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token(user)}")
+        else:
+            self.client.credentials()
+
+        # All simulated clients share one address, they'd only measure the throttles
+        with throttling.disabled(), CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(url, **kwargs)
+            elapsed = time.perf_counter() - start
+
+        name = response.resolver_match.url_name if response.resolver_match else url
+        self.samples[f"{method.upper()} {name}"].append((elapsed, len(queries), response.status_code))
+        return response
+
+    def token(self, user):
+        if user.pk not in self.tokens:
+            self.tokens[user.pk] = str(RefreshToken.for_user(user).access_token)
+        return self.tokens[user.pk]
+
+    # Scenarios
+
+    def browse(self):
+        if self.rng.random() < 0.3:
+            self.request('get', reverse('movie-list'), data={'search': self.rng.choice(WORDS)})
+        else:
+            self.request('get', reverse('movie-list'), data={'p': self.rng.randint(1, 20), 'size': 10})
+        self.request('get', reverse('movie-detail', args=(self.rng.choice(self.titles),)))
+
+    def reviews(self):
+        title = self.rng.choice(self.titles)
+        response = self.request('get', reverse('review-list', args=(title,)))
+
+        # Cache hits are plain responses, so read the body rather than .data
+        if response.status_code == 200 and response.json():
+            self.request('get', reverse('review-detail', args=(self.rng.choice(response.json())['id'],)))
+
+    def submit(self):
+        user = self.rng.choice(self.users)
+        title = self.rng.choice(self.titles)
+
+        if (user.pk, title) in self.reviewed:
+            review = Review.objects.only('id').get(review_user=user, watchlist_id=title)
+            data = {"description": sentence(self.rng, 8), "rating": self.rng.randint(1, 5), "watchlist": title}
+            self.request('put', reverse('review-detail', args=(review.pk,)), user=user, data=data, format='json')
+            return
+
+        data = {"description": sentence(self.rng, 8), "rating": self.rng.randint(1, 5), "watchlist": title}
+        response = self.request('post', reverse('review-create', args=(title,)), user=user, data=data, format='json')
+        if response.status_code == 201:
+            self.reviewed.add((user.pk, title))
+
+    def auth(self):
+        user = self.rng.choice(self.users)
+        response = self.request('post', reverse('token_obtain_pair'), data={'username': user.username, 'password': PASSWORD})
+        if response.status_code == 200:
+            self.request('post', reverse('token_refresh'), data={'refresh': response.data['refresh']})
+
+    def run(self, scenario, iterations):
+        step = getattr(self, scenario)
+        for _ in range(iterations):
+            step()
+
+    def report(self):
+        return {name: summarize(samples) for name, samples in sorted(self.samples.items())}
+
+
+SCENARIOS = ('browse', 'reviews', 'submit', 'auth')
+
+
+def percentile(cuts, n):
+    return round(cuts[n - 1] * 1000, 2)
+
+
+def summarize(samples):
+    timings = [elapsed for elapsed, queries, code in samples]
+    queries = [queries for elapsed, queries, code in samples]
+
+    cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+    return {
+        'requests': len(samples),
+        'errors': sum(code >= 500 for elapsed, queries, code in samples),
+        'req_per_sec': round(len(timings) / sum(timings), 1) if sum(timings) else 0,
+        'p50_ms': percentile(cuts, 50),
+        'p95_ms': percentile(cuts, 95),
+        'p99_ms': percentile(cuts, 99),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+# Latency changes smaller than this are noise whatever the percentage
+MIN_LATENCY_CHANGE_MS = 1
+
+
+def compare(baseline, current, tolerance=0.25):
+    """Regressions of `current` against `baseline`, as a list of messages."""
+    problems = []
+
+    for name, before in baseline['endpoints'].items():
+        after = current['endpoints'].get(name)
+        if after is None:
+            continue
+
+        # Query counts are deterministic, any increase is a regression
+        if after['queries_max'] > before['queries_max']:
+            problems.append(f"{name}: {after['queries_max']} queries per request, baseline {before['queries_max']}")
+        slower = after['p95_ms'] - before['p95_ms']
+        if slower > MIN_LATENCY_CHANGE_MS and after['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {after['p95_ms']} ms, baseline {before['p95_ms']} ms")
+        if after['req_per_sec'] < before['req_per_sec'] * (1 - tolerance):
+            problems.append(f"{name}: {after['req_per_sec']} req/s, baseline {before['req_per_sec']} req/s")
+        if after['errors'] > before['errors']:
+            problems.append(f"{name}: {after['errors']} server errors, baseline {before['errors']}")
+
+    return problems
+
+
+# Payload -> (queryset, serializer, projection, objects rendered); platforms nest all their titles
+PAYLOADS = {
+    'titles': (
+        lambda: WatchList.objects.order_by('-created'), WatchListSerializers, WatchListProjection,
+        lambda: WatchList.objects.count(),
+    ),
+    'reviews': (
+        lambda: Review.objects.for_api().order_by('-created'), ReviewSerializers, ReviewProjection,
+        lambda: Review.objects.count(),
+    ),
+    'platforms': (
+        lambda: StreamPlatform.objects.with_watchlist(), StreamPlatformSerializers, StreamPlatformProjection,
+        lambda: StreamPlatform.objects.count() + WatchList.objects.count(),
+    ),
+}
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def serialization(name, repeat=3):
+    """Objects/sec of a whole list payload before (serializer) and after (projection)."""
+    queryset, serializer, projection, count = PAYLOADS[name]
+    objects = count()
+
+    before, expected = best_of(repeat, lambda: JSONRenderer().render(serializer(queryset(), many=True).data))
+    after, rendered = best_of(
+        repeat, lambda: FastJSONRenderer().render(projection(projection.values(queryset()), many=True).data),
+    )
+
+    return {
+        'objects': objects,
+        'before_per_sec': round(objects / before),
+        'after_per_sec': round(objects / after),
+        'speedup': round(before / after, 1),
+        'same_output': rendered == expected,
+    }
+
+
+def synthetic_ratings(seed, reviews, users, titles, genres=20):
+    """
+    (user ids, title ids, ratings, title genres) of about `reviews` distinct
+    reviews. Title popularity is long-tailed, users watch their favourite
+    genre half of the time and rate it higher, so similar titles should share
+    a genre.
+    """
+    rng = np.random.default_rng(seed)
+
+    title_genres = rng.integers(0, genres, titles)
+    favourites = rng.integers(0, genres, users)
+
+    popularity = 1 / np.arange(1, titles + 1) ** 0.8
+    user_ids = rng.integers(0, users, reviews)
+    title_ids = rng.choice(titles, reviews, p=popularity / popularity.sum())
+
+    # Half of the reviews are redrawn from the user's favourite genre
+    by_genre = [np.flatnonzero(title_genres == genre) for genre in range(genres)]
+    for genre, members in enumerate(by_genre):
+        redraw = np.flatnonzero((favourites[user_ids] == genre) & (rng.random(reviews) < 0.5))
+        if len(members):
+            weights = popularity[members] / popularity[members].sum()
+            title_ids[redraw] = rng.choice(members, len(redraw), p=weights)
+
+    # One review per user and title
+    _, first = np.unique(user_ids * titles + title_ids, return_index=True)
+    user_ids, title_ids = user_ids[first], title_ids[first]
+
+    liked = title_genres[title_ids] == favourites[user_ids]
+    ratings = np.clip(np.where(liked, 4.5, 2.5) + rng.normal(0, 1, len(first)), 1, 5).round().astype(np.int64)
+
+    return user_ids, title_ids, ratings, title_genres
+
+
+def recommendation_build(seed=1, reviews=1_000_000, users=100_000, titles=10_000, k=None):
+    """Time the full item-item build on synthetic ratings, see the bench_recommendations command."""
+    user_ids, title_ids, ratings, genres = synthetic_ratings(seed, reviews, users, titles)
+
+    start = time.perf_counter()
+    recommendations.rating_matrices(user_ids, title_ids, ratings)
+    matrix = time.perf_counter() - start
+
+    start = time.perf_counter()
+    neighbors = recommendations.similar_titles(user_ids, title_ids, ratings, k=k)
+    total = time.perf_counter() - start
+
+    pairs = [(pk, other) for pk, similar in neighbors.items() for other, score in similar]
+    same_genre = sum(genres[pk] == genres[other] for pk, other in pairs)
+
+    return {
+        'reviews': len(ratings),
+        'titles': len(neighbors),
+        'matrix_sec': round(matrix, 2),
+        'build_sec': round(total, 2),
+        'reviews_per_sec': round(len(ratings) / total),
+        'neighbors': len(pairs),
+        'same_genre': round(same_genre / (len(pairs) or 1), 3),
+    }
+
+
+def _register(usernames):
+    client = APIClient()
+    samples = []
+
+    # A thread of its own, so the context of the caller doesn't apply
+    with throttling.disabled():
+        try:
+            for username in usernames:
+                data = {
+                    "username": username, "email": f"{username}@example.com",
+                    "password": PASSWORD, "password2": PASSWORD,
+                }
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = client.post(reverse('register'), data=data)
+                    elapsed = time.perf_counter() - start
+                samples.append((elapsed, len(queries), response.status_code))
+        finally:
+            connection.close()
+
+    return samples
+
+
+def registrations(count=200, threads=4):
+    """Registrations/sec of `count` registrations posted by `threads` clients at once; the users are deleted afterwards."""
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    usernames = [f"{prefix}{n}" for n in range(count)]
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            samples = [
+                sample for chunk in executor.map(_register, [usernames[n::threads] for n in range(threads)])
+                for sample in chunk
+            ]
+        wall = time.perf_counter() - start
+    finally:
+        OutstandingToken.objects.filter(user__username__startswith=prefix).delete()
+        User.objects.filter(username__startswith=prefix).delete()
+
+    result = summarize(samples)
+    result['created'] = sum(code == 201 for elapsed, queries, code in samples)
+    result['wall_per_sec'] = round(len(samples) / wall, 1)
+    return result
@@ -0,0 +1,193 @@
+"""
+Integer deltas buffered in the Django cache and drained in bulk.
+
+A ``DeltaBuffer`` keeps one counter per key (a title or platform id) and
+field in the cache alias ``BUFFER_CACHE_ALIAS``. ``add`` increments them with
+``incr``, so concurrent writers add up. The first delta of a key since it was
+last drained also appends the key to a journal: ``incr`` on a sequence number
+picks a slot and the key is stored under it. ``drain`` reads the journal from
+where the previous drain stopped and takes every listed key's counters away
+by decrementing the values it read, so deltas added meanwhile stay for the
+next drain.
+
+With a shared alias (``REDIS_URL``) any process drains what every process
+added, e.g. the flush_ratings command; with the default LocMemCache the
+buffer is per process. One drain runs at a time, under a lock key.
+
+``BufferedWriter`` drains one and writes the deltas out every
+``flush_interval`` seconds (a timer thread) or ``flush_events`` adds of the
+process, whichever comes first. A write that fails puts its deltas back.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+
+# A key is journaled again when its marker expires, in case the writer that
+# set it died before storing its slot
+QUEUED_TIMEOUT = 300
+
+# How long a drain may hold the lock, should its process die
+LOCK_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaBuffer:
+
+    def __init__(self, prefix, fields):
+        self.prefix = prefix
+        self.fields = fields
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'BUFFER_CACHE_ALIAS', 'buffers')]
+
+    def counter_key(self, field, key):
+        return f'{self.prefix}:{field}:{key}'
+
+    def slot_key(self, slot):
+        return f'{self.prefix}:slot:{slot}'
+
+    def incr(self, name, delta):
+        # incr() needs the key to exist, add() creates it unless a writer did first
+        self.cache.add(name, 0, None)
+        return self.cache.incr(name, delta)
+
+    def add(self, deltas):
+        """Buffer ``{key: {field: delta}}``. Returns the number of keys."""
+        for key, values in deltas.items():
+            for field, delta in values.items():
+                if delta:
+                    self.incr(self.counter_key(field, key), delta)
+
+            if self.cache.add(f'{self.prefix}:queued:{key}', 1, QUEUED_TIMEOUT):
+                slot = self.incr(f'{self.prefix}:seq', 1)
+                self.cache.set(self.slot_key(slot), key, None)
+        return len(deltas)
+
+    def drain(self):
+        """
+        Take everything buffered, as ``{key: {field: delta}}`` with every key
+        added since the last drain, even if its deltas sum to 0. Empty while
+        another drain runs.
+        """
+        cache = self.cache
+        lock = f'{self.prefix}:lock'
+        if not cache.add(lock, 1, LOCK_TIMEOUT):
+            return {}
+
+        try:
+            head = cache.get(f'{self.prefix}:head', 0)
+            tail = cache.get(f'{self.prefix}:seq', 0)
+            # Slots taken but not stored yet at the last drain, tried once more
+            gaps = cache.get(f'{self.prefix}:gaps', [])
+
+            slots = [*gaps, *range(head + 1, tail + 1)]
+            found = cache.get_many([self.slot_key(slot) for slot in slots])
+            keys = list(dict.fromkeys(found.values()))
+
+            # Unmark first: a delta added from here on journals its key again
+            cache.delete_many([f'{self.prefix}:queued:{key}' for key in keys])
+
+            names = {(key, field): self.counter_key(field, key) for key in keys for field in self.fields}
+            values = cache.get_many(list(names.values()))
+
+            drained = {key: dict.fromkeys(self.fields, 0) for key in keys}
+            for (key, field), name in names.items():
+                value = values.get(name, 0)
+                if value:
+                    cache.decr(name, value)
+                    drained[key][field] = value
+
+            cache.delete_many(list(found))
+            cache.set_many({
+                f'{self.prefix}:head': tail,
+                f'{self.prefix}:gaps': [slot for slot in range(head + 1, tail + 1) if self.slot_key(slot) not in found],
+            }, None)
+            return drained
+        finally:
+            cache.delete(lock)
+
+
+class BufferedWriter:
+
+    prefix = None
+    fields = ()
+
+    def __init__(self, flush_interval=0.5, flush_events=100):
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+
+        self.deltas = DeltaBuffer(self.prefix, self.fields)
+        self.lock = threading.Lock()
+        self.events = 0
+        self.last_flush = time.monotonic()
+        self.timer = None
+
+    def write(self, deltas):
+        raise NotImplementedError
+
+    def add_deltas(self, deltas):
+        self.deltas.add(deltas)
+
+        with self.lock:
+            self.events += 1
+            due = self.events >= self.flush_events
+            if self.flush_interval and time.monotonic() - self.last_flush >= self.flush_interval:
+                due = True
+
+        if due:
+            self.flush()
+        else:
+            self._schedule()
+
+    def flush(self):
+        """Write out everything buffered, by any process sharing the cache. Returns the number of keys."""
+        with self.lock:
+            self.events = 0
+            self.last_flush = time.monotonic()
+
+        drained = self.deltas.drain()
+        if not drained:
+            return 0
+
+        try:
+            self.write(drained)
+        except Exception:
+            # Put the deltas back so a later flush can retry them
+            self.deltas.add(drained)
+            raise
+        return len(drained)
+
+    def _schedule(self):
+        if not self.flush_interval:
+            return
+
+        with self.lock:
+            if self.timer is not None:
+                return
+            self.timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_from_timer(self):
+        with self.lock:
+            self.timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush the buffered %s", self.prefix)
+        finally:
+            # The timer thread has its own connection
+            connection.close()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        return self.flush()
@@ -0,0 +1,312 @@
+"""
+Response cache for the read-heavy catalog endpoints.
+
+Views opt in with the ``cache_response`` decorator, naming the tags their
+response depends on (e.g. ``'watch:{pk}'``). Every tag has a version number
+that is part of the cache key; the model signals in watchmate.signals bump
+the versions of the tags a change touches, so stale entries are never read
+again and simply age out.
+
+``RESPONSE_CACHE_BACKEND`` selects where the bodies go: ``lru`` (default) is
+an in-process LRU bounded by ``RESPONSE_CACHE_MAX_BYTES``, ``django`` uses the
+Django cache ``RESPONSE_CACHE_ALIAS`` and ``none`` turns caching off. TTLs
+come from ``RESPONSE_CACHE_TIMEOUTS`` by URL name, falling back to the
+decorator's timeout.
+
+The tag versions are always kept in the ``RESPONSE_CACHE_ALIAS`` cache, so a
+write in one process invalidates the entries of every process, the LRU's
+included, as long as that cache is shared (e.g. Redis or Memcached rather
+than the per-process LocMemCache).
+"""
+
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+
+class TagVersions:
+
+    prefix = 'response-cache'
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def blocking(self):
+        # Anything but the in-process LocMemCache is a round trip
+        return not isinstance(self.cache, LocMemCache)
+
+    def tag_key(self, tag):
+        return f'{self.prefix}:tag:{tag}'
+
+    def get_versions(self, tags):
+        keys = [self.tag_key(tag) for tag in tags]
+        versions = self.cache.get_many(keys)
+
+        # A version that was evicted must not restart at a number an old entry
+        # could still be stored under, so start from the clock instead of 0
+        missing = [key for key in keys if key not in versions]
+        for key in missing:
+            self.cache.add(key, time.time_ns(), None)
+        if missing:
+            versions.update(self.cache.get_many(missing))
+
+        return [versions.get(key, 0) for key in keys]
+
+    def bump(self, tags):
+        for tag in tags:
+            key = self.tag_key(tag)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, time.time_ns(), None)
+
+
+class LRUBackend:
+
+    def __init__(self, max_bytes, versions=None):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.versions = versions or TagVersions('default')
+
+    @property
+    def blocking(self):
+        return self.versions.blocking
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                self._delete(key)
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        content = value[0]
+        if len(content) > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._delete(key)
+
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.size += len(content)
+
+            # Evict least recently used entries until we fit again
+            while self.size > self.max_bytes:
+                self._delete(next(iter(self.entries)))
+
+    def _delete(self, key):
+        expires, value = self.entries.pop(key)
+        self.size -= len(value[0])
+
+    def get_versions(self, tags):
+        return self.versions.get_versions(tags)
+
+    def bump(self, tags):
+        self.versions.bump(tags)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class DjangoCacheBackend:
+
+    prefix = 'response-cache'
+    blocking = True
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.versions = TagVersions(alias)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(f'{self.prefix}:{key}')
+
+    def set(self, key, value, timeout):
+        self.cache.set(f'{self.prefix}:{key}', value, timeout)
+
+    def get_versions(self, tags):
+        return self.versions.get_versions(tags)
+
+    def bump(self, tags):
+        self.versions.bump(tags)
+
+    def clear(self):
+        self.cache.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+
+    name = getattr(settings, 'RESPONSE_CACHE_BACKEND', 'lru')
+    if name == 'none':
+        return None
+
+    with _backend_lock:
+        if _backend is None:
+            alias = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+            if name == 'django':
+                _backend = DjangoCacheBackend(alias)
+            else:
+                _backend = LRUBackend(getattr(settings, 'RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024), TagVersions(alias))
+        return _backend
+
+
+def shared():
+    """Whether invalidations made in this process reach the others: False with a LocMemCache alias."""
+    if getattr(settings, 'RESPONSE_CACHE_BACKEND', 'lru') == 'none':
+        return True
+    return TagVersions(getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')).blocking
+
+
+def invalidate(*tags):
+    backend = get_backend()
+    if backend is None or not tags:
+        return
+
+    backend.bump(tags)
+
+    # Bump again once the change is visible to other connections, in case a
+    # concurrent request re-cached the old data in between
+    transaction.on_commit(lambda: backend.bump(tags))
+
+
+def make_key(request, name, versions):
+    query = sorted(request.GET.lists())
+    raw = repr((name, request.get_host(), request.is_secure(), request.path, query, versions))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cached_response(request, content, content_type, etag=None, last_modified=None):
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = 'HIT'
+
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = last_modified
+
+    # The stored validators answer conditional requests without touching the database
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+        response=response,
+    )
+
+
+def lookup(backend, request, name, tags, timeout, kwargs):
+    # Returns (key, ttl, cached entry or None)
+    ttl = getattr(settings, 'RESPONSE_CACHE_TIMEOUTS', {}).get(name, timeout)
+
+    versions = backend.get_versions([tag.format(**kwargs) for tag in tags])
+    key = make_key(request, name, versions)
+
+    return key, ttl, backend.get(key)
+
+
+def store(backend, key, ttl, rendered):
+    backend.set(key, (
+        rendered.content,
+        rendered['Content-Type'],
+        rendered.get('ETag'),
+        rendered.get('Last-Modified'),
+    ), ttl)
+
+
+async def call(backend, func, *args):
+    # The in-process LRU never waits on I/O, a shared cache is a network round trip
+    if backend.blocking:
+        return await sync_to_async(func)(*args)
+    return func(*args)
+
+
+def cache_response(tags, timeout=60):
+    """
+    Cache the rendered body of a GET handler.
+
+    `tags` are formatted with the URL kwargs, so 'watch:{pk}' ties the entry
+    to one title. Every entry also depends on the 'catalog' tag, which
+    invalidates all of them at once. Works on sync DRF handlers and on the
+    async handlers of watchmate.api.async_views, which share the entries.
+    """
+    tags = ['catalog', *tags]
+
+    def get_name(request, method):
+        return request.resolver_match.url_name if request.resolver_match else method.__qualname__
+
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                backend = get_backend()
+                if backend is None:
+                    return await method(view, request, *args, **kwargs)
+
+                key, ttl, cached = await call(backend, lookup, backend, request, get_name(request, method), tags, timeout, kwargs)
+                if cached is not None:
+                    return cached_response(request, *cached)
+
+                # Async handlers return responses that are already rendered
+                response = await method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    await call(backend, store, backend, key, ttl, response)
+                    response['X-Cache'] = 'MISS'
+
+                return response
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            backend = get_backend()
+            if backend is None:
+                return method(view, request, *args, **kwargs)
+
+            key, ttl, cached = lookup(backend, request, get_name(request, method), tags, timeout, kwargs)
+            if cached is not None:
+                return cached_response(request, *cached)
+
+            response = method(view, request, *args, **kwargs)
+
+            if response.status_code == 200:
+                response.add_post_render_callback(lambda rendered: store(backend, key, ttl, rendered))
+                response['X-Cache'] = 'MISS'
+
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,266 @@
+"""
+Bulk catalog import from JSONL or CSV.
+
+Every row is a title (title, description, platform, active and optionally the
+id of a title to overwrite) unless its ``kind`` is ``platform`` (name, about,
+website). Platforms are matched by name and must come before their titles.
+
+Input is read lazily and written in chunks of ``batch_size`` rows, one
+transaction per chunk, so memory stays bounded however large the file is.
+Rows are validated with the API serializers without any per-row queries:
+platform names and ids are resolved from an in-memory map, new rows go in with
+``bulk_create`` and rows with an existing id are overwritten with
+``bulk_update``. Invalid rows are skipped and reported with their line number.
+
+The bulk writes bypass the model signals, so the platform statistics, the
+search index and the response cache are refreshed once at the end.
+"""
+
+import csv
+import json
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from watchmate import cache, ranking, search, stats
+from watchmate.api.serializers import StreamPlatformSerializers, WatchListImportSerializer
+from watchmate.models import StreamPlatform, WatchList
+
+
+FORMATS = ('jsonl', 'csv')
+
+PLATFORM_FIELDS = ['about', 'website']
+
+
+def decode(lines):
+    for line in lines:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+
+def read_rows(lines, fmt='jsonl'):
+    """Yield (line number, row) pairs from an iterable of text or byte lines."""
+    lines = decode(lines)
+
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Empty cells mean "not given", not an empty string
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}
+        return
+
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = exc
+        yield number, row
+
+
+def guess_format(name='', content_type=''):
+    if name.lower().endswith('.csv') or content_type.startswith('text/csv'):
+        return 'csv'
+    return 'jsonl'
+
+
+class CatalogImporter:
+
+    def __init__(self, batch_size=None, max_errors=None):
+        self.batch_size = batch_size or getattr(settings, 'CATALOG_IMPORT_BATCH_SIZE', 1000)
+        self.max_errors = max_errors if max_errors is not None else getattr(settings, 'CATALOG_IMPORT_MAX_ERRORS', 100)
+
+        self.platforms = {}
+        self.platform_ids = set()
+        self.touched = set()
+
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.platforms_created = 0
+        self.platforms_updated = 0
+        self.skipped = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def load_platforms(self):
+        # Names are not unique, the oldest platform with a name wins
+        for pk, name in StreamPlatform.objects.order_by('-id').values_list('id', 'name').iterator():
+            self.platforms[name] = pk
+            self.platform_ids.add(pk)
+
+    def error(self, line, detail):
+        self.skipped += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': detail})
+
+    def run(self, rows, progress=None):
+        """Import (line number, row) pairs; `progress` is called with the report after every chunk."""
+        start = time.perf_counter()
+        self.load_platforms()
+
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+
+            with transaction.atomic():
+                self.import_chunk(chunk)
+
+            self.rows += len(chunk)
+            self.seconds = time.perf_counter() - start
+            if progress:
+                progress(self.report())
+
+        self.finish()
+        self.seconds = time.perf_counter() - start
+        return self.report()
+
+    def import_chunk(self, chunk):
+        platform_rows = []
+        title_rows = []
+
+        for line, row in chunk:
+            if not isinstance(row, dict):
+                self.error(line, {'non_field_errors': [f'Not a JSON object: {row}']})
+            elif row.get('kind', 'title') == 'platform':
+                platform_rows.append((line, row))
+            elif row.get('kind', 'title') == 'title':
+                title_rows.append((line, row))
+            else:
+                self.error(line, {'kind': ['Must be "title" or "platform".']})
+
+        # Platforms first so titles of this chunk can use them
+        if platform_rows:
+            self.import_platforms(platform_rows)
+        if title_rows:
+            self.import_titles(title_rows)
+
+    def validate(self, serializer, line, row):
+        try:
+            return serializer.run_validation(row)
+        except serializers.ValidationError as exc:
+            self.error(line, exc.detail)
+            return None
+
+    def import_platforms(self, rows):
+        serializer = StreamPlatformSerializers()
+
+        # Last row of a name wins
+        latest = {}
+        for line, row in rows:
+            data = self.validate(serializer, line, row)
+            if data is not None:
+                latest[data['name']] = data
+
+        new = [StreamPlatform(**data) for name, data in latest.items() if name not in self.platforms]
+        existing = [
+            StreamPlatform(pk=self.platforms[name], **data)
+            for name, data in latest.items() if name in self.platforms
+        ]
+
+        if new:
+            StreamPlatform.objects.bulk_create(new)
+            for pk, name in StreamPlatform.objects.filter(name__in=[p.name for p in new]).order_by('-id').values_list('id', 'name'):
+                self.platforms[name] = pk
+                self.platform_ids.add(pk)
+        if existing:
+            StreamPlatform.objects.bulk_update(existing, PLATFORM_FIELDS)
+
+        self.platforms_created += len(new)
+        self.platforms_updated += len(existing)
+        self.touched.update(self.platforms[name] for name in latest)
+
+    def resolve_platform(self, value):
+        # By name first, then by id
+        if isinstance(value, str) and value in self.platforms:
+            return self.platforms[value]
+        try:
+            pk = int(value)
+        except (TypeError, ValueError):
+            return None
+        return pk if pk in self.platform_ids else None
+
+    def import_titles(self, rows):
+        serializer = WatchListImportSerializer()
+
+        titles = []
+        for line, row in rows:
+            platform = self.resolve_platform(row.get('platform'))
+            if platform is None:
+                self.error(line, {'platform': [f'Unknown platform "{row.get("platform")}".']})
+                continue
+
+            data = self.validate(serializer, line, {**row, 'platform': platform})
+            if data is None:
+                continue
+
+            pk = row.get('id')
+            try:
+                pk = int(pk) if pk is not None else None
+            except (TypeError, ValueError):
+                self.error(line, {'id': ['A valid integer is required.']})
+                continue
+
+            titles.append((line, pk, data))
+
+        existing = WatchList.objects.in_bulk([pk for line, pk, data in titles if pk is not None])
+        now = timezone.now()
+
+        new = []
+        changed = []
+        for line, pk, data in titles:
+            data = dict(data, platform_id=data.pop('platform'))
+
+            if pk is None:
+                new.append(WatchList(**data))
+                continue
+
+            title = existing.get(pk)
+            if title is None:
+                self.error(line, {'id': [f'Unknown title {pk}.']})
+                continue
+
+            # Moving a title changes the counts of its old platform too
+            self.touched.add(title.platform_id)
+            for field, value in data.items():
+                setattr(title, field, value)
+            # bulk_update does not set auto_now fields
+            title.updated = now
+            changed.append(title)
+
+        if new:
+            WatchList.objects.bulk_create(new)
+        if changed:
+            WatchList.objects.bulk_update(changed, ['title', 'description', 'platform', 'active', 'updated'])
+
+        self.created += len(new)
+        self.updated += len(changed)
+        self.touched.update(title.platform_id for title in new + changed)
+
+    def finish(self):
+        if self.touched:
+            stats.rebuild(self.touched)
+        if self.created or self.updated or self.platforms_created or self.platforms_updated:
+            transaction.on_commit(search.index.reset)
+            ranking.index.reset()
+            cache.invalidate('catalog')
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'platforms_created': self.platforms_created,
+            'platforms_updated': self.platforms_updated,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 3),
+            'rows_per_sec': round(self.rows / self.seconds) if self.seconds else 0,
+        }
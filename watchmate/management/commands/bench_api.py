@@ -0,0 +1,80 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from watchmate import benchmarks, ranking, search
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a reproducible data set and run API scenarios in process, reporting req/s, "
+        "p50/p95/p99 latency and queries per request for every endpoint. The data is "
+        "rolled back afterwards unless --keep is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--platforms', type=int, default=10)
+        parser.add_argument('--titles', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--reviews', type=int, default=5000)
+        parser.add_argument('--iterations', type=int, default=200, help="Runs of every scenario")
+        parser.add_argument('--warmup', type=int, default=20, help="Untimed runs of every scenario first")
+        parser.add_argument('--scenario', action='append', choices=benchmarks.SCENARIOS, help="Defaults to all")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Write the results as JSON, e.g. as a new baseline")
+        parser.add_argument('--keep', action='store_true', help="Commit the seeded data")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        scenarios = options['scenario'] or benchmarks.SCENARIOS
+
+        # The test client talks to "testserver"
+        with override_settings(ALLOWED_HOSTS=['testserver']), transaction.atomic():
+            start = time.perf_counter()
+            titles, users, reviewed = benchmarks.seed(
+                rng, options['platforms'], options['titles'], options['users'], options['reviews'],
+            )
+            self.stdout.write(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+            runner = benchmarks.Runner(rng, titles, users, reviewed)
+
+            # Fills the search index and the response cache like a running server has them
+            for scenario in scenarios:
+                runner.run(scenario, options['warmup'])
+            runner.samples.clear()
+
+            for scenario in scenarios:
+                runner.run(scenario, options['iterations'])
+
+            transaction.set_rollback(not options['keep'])
+
+        if not options['keep']:
+            # The indexes now point at rolled back rows
+            search.index.reset()
+            ranking.index.reset()
+
+        result = {
+            'config': {key: options[key] for key in ('platforms', 'titles', 'users', 'reviews', 'iterations', 'warmup', 'seed')},
+            'scenarios': list(scenarios),
+            'endpoints': runner.report(),
+        }
+        self.print(result['endpoints'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+                f.write('\n')
+
+    def print(self, endpoints):
+        self.stdout.write(
+            f"{'endpoint':<28}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        )
+        for name, row in endpoints.items():
+            self.stdout.write(
+                f"{name:<28}{row['requests']:>9}{row['req_per_sec']:>9}{row['p50_ms']:>9}"
+                f"{row['p95_ms']:>9}{row['p99_ms']:>9}{row['queries_mean']:>9}"
+            )
@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from watchmate import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare bench_api --output results against a baseline and fail on regressions: "
+        "more queries per request, a slower p95, lower req/s or new server errors"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline')
+        parser.add_argument('current')
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed latency/throughput change, 0.25 = 25%%")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            with open(options['current']) as f:
+                current = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+
+        if baseline['config'] != current['config']:
+            self.stderr.write(f"Warning: different settings, baseline {baseline['config']}, current {current['config']}")
+
+        problems = benchmarks.compare(baseline, current, options['tolerance'])
+        if problems:
+            raise CommandError("Regressions:\n" + "\n".join(problems))
+
+        self.stdout.write(self.style.SUCCESS(f"No regressions in {len(baseline['endpoints'])} endpoints"))
@@ -0,0 +1,131 @@
+import asyncio
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+DEFAULT_PATHS = ['/api/watch/', '/api/stream/', '/api/watch/1/', '/api/1/reviews/']
+
+
+async def fetch(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\n\r\n".encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+
+    return status, headers.get("connection", "").lower() == "close"
+
+
+async def client(target, paths, offset, deadline, latencies, errors):
+    # One keep-alive connection per simulated client, reopened when the server closes it
+    url = urlsplit(target)
+    host, port = url.hostname, url.port or 80
+    connection = None
+    i = offset
+
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+
+            start = time.perf_counter()
+            status, close = await fetch(*connection, url.netloc, path)
+            latencies.append(time.perf_counter() - start)
+
+            if status >= 400:
+                errors.append(status)
+            if close:
+                connection[1].close()
+                connection = None
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as exc:
+            errors.append(type(exc).__name__)
+            if connection is not None:
+                connection[1].close()
+            connection = None
+
+    if connection is not None:
+        connection[1].close()
+
+
+async def run(target, paths, concurrency, duration):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(target, paths, n, deadline, latencies, errors) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return latencies, errors, elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test running servers with concurrent keep-alive clients and report "
+        "throughput and latency percentiles, e.g. a gunicorn WSGI and an ASGI deployment: "
+        "--target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001. "
+        "Start the servers with THROTTLE_BACKEND=none, all clients share one address"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, help="name=url, repeatable")
+        parser.add_argument('--path', action='append', help=f"Paths to request in turn (default {' '.join(DEFAULT_PATHS)})")
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--warmup', type=float, default=2)
+
+    def handle(self, *args, **options):
+        paths = options['path'] or DEFAULT_PATHS
+
+        targets = []
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep:
+                name, url = target, target
+            if urlsplit(url).scheme != 'http':
+                raise CommandError(f"Only http:// targets are supported: {url}")
+            targets.append((name, url))
+
+        self.stdout.write(f"{'target':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+        for name, url in targets:
+            if options['warmup']:
+                asyncio.run(run(url, paths, options['concurrency'], options['warmup']))
+
+            latencies, errors, elapsed = asyncio.run(run(url, paths, options['concurrency'], options['duration']))
+            if len(latencies) < 2:
+                raise CommandError(f"{name}: no successful requests ({errors[:3]})")
+
+            cuts = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"{name:<12}{len(latencies) / elapsed:>10.0f}"
+                f"{cuts[49] * 1000:>10.1f}{cuts[94] * 1000:>10.1f}{cuts[98] * 1000:>10.1f}{len(errors):>8}"
+            )
+            if errors:
+                self.stderr.write(f"{name} errors: {dict(Counter(errors).most_common(5))}")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from watchmate import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the item-item similarity build (rating matrix, similarities, top-k) "
+        "on synthetic ratings. Nothing is written to the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--titles', type=int, default=10_000)
+        parser.add_argument('--k', type=int, help="Defaults to RECOMMENDATIONS_TOP_K")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        result = benchmarks.recommendation_build(
+            options['seed'], options['reviews'], options['users'], options['titles'], options['k'],
+        )
+
+        self.stdout.write(f"{result['reviews']} reviews of {result['titles']} titles")
+        self.stdout.write(f"rating matrix   {result['matrix_sec']:>8} s")
+        self.stdout.write(f"full build      {result['build_sec']:>8} s  ({result['reviews_per_sec']} reviews/s)")
+        self.stdout.write(f"neighbors       {result['neighbors']:>8}    ({result['same_genre']:.1%} of the same genre)")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from watchmate import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Post registrations from concurrent clients in process and report registrations/s, "
+        "latency and queries per registration. The users are deleted afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--iterations', type=int,
+            help="PBKDF2 iterations of the password hashes, defaults to PASSWORD_HASH_ITERATIONS",
+        )
+
+    def handle(self, *args, **options):
+        overrides = {'ALLOWED_HOSTS': ['testserver']}
+        if options['iterations'] is not None:
+            overrides['PASSWORD_HASH_ITERATIONS'] = options['iterations']
+
+        # The test client talks to "testserver"
+        with override_settings(**overrides):
+            result = benchmarks.registrations(options['count'], options['threads'])
+
+        self.stdout.write(f"{result['created']} of {result['requests']} registered with {options['threads']} threads")
+        self.stdout.write(f"throughput      {result['wall_per_sec']:>8} registrations/s")
+        self.stdout.write(f"latency         {result['p50_ms']:>8} ms p50, {result['p95_ms']} ms p95, {result['p99_ms']} ms p99")
+        self.stdout.write(f"queries         {result['queries_mean']:>8} per registration")
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework import filters
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+
+from watchmate import search
+from watchmate.api.filters import WatchListSearchFilter
+from watchmate.api.views import WatchlistAV
+from watchmate.models import StreamPlatform, WatchList
+
+
+WORDS = (
+    "night dark star war love city lost king queen ghost river shadow fire "
+    "blood moon iron silent last secret dream storm wild broken golden"
+).split()
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 500)) for _ in range(length))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ?search= latency of the stock SearchFilter against the configured "
+        "search backend. Seeds titles inside a transaction that is rolled back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            self.seed(rng, options['titles'])
+
+            terms = [rng.choice(WORDS) + str(rng.randint(0, 500)) for _ in range(options['queries'])]
+
+            search.index.reset()
+            start = time.perf_counter()
+            search.index.build()
+            self.stdout.write(f"Built in-process index in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+            self.report("SearchFilter (icontains)", self.measure(filters.SearchFilter(), terms))
+            self.report(f"{type(search.get_backend()).__name__}", self.measure(WatchListSearchFilter(), terms))
+
+            transaction.set_rollback(True)
+
+        # The index now points at rolled back rows
+        search.index.reset()
+
+    def seed(self, rng, count):
+        platforms = StreamPlatform.objects.bulk_create(
+            StreamPlatform(name=f"bench{n}", about="Benchmark platform", website="https://example.com")
+            for n in range(10)
+        )
+
+        batch = []
+        for n in range(count):
+            batch.append(WatchList(
+                title=sentence(rng, 3),
+                description=sentence(rng, 12),
+                platform=rng.choice(platforms),
+            ))
+            if len(batch) == 5000:
+                WatchList.objects.bulk_create(batch)
+                batch = []
+        WatchList.objects.bulk_create(batch)
+
+        self.stdout.write(f"Seeded {count} titles")
+
+    def measure(self, backend, terms):
+        factory = APIRequestFactory()
+        view = WatchlistAV()
+        timings = []
+
+        for term in terms:
+            request = Request(factory.get('/api/watch/', {'search': term}))
+            start = time.perf_counter()
+
+            # What WatchlistAV does for a page: filter, count and fetch the first page
+            queryset = backend.filter_queryset(request, WatchlistAV.queryset.all(), view)
+            queryset.count()
+            list(queryset[:10])
+
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return timings
+
+    def report(self, label, timings):
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:<28} mean {statistics.mean(timings):8.2f} ms   "
+            f"p50 {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms"
+        )
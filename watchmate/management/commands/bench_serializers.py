@@ -0,0 +1,42 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from watchmate import benchmarks, ranking, search
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a data set and time rendering whole list payloads (fetch, serialize, render) "
+        "with the ModelSerializers and JSONRenderer against the projections and "
+        "FastJSONRenderer, in objects/sec. The data is rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Titles and reviews to seed")
+        parser.add_argument('--platforms', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3, help="Best of this many runs")
+        parser.add_argument('--payload', action='append', choices=list(benchmarks.PAYLOADS), help="Defaults to all")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows = options['rows']
+
+        with transaction.atomic():
+            benchmarks.seed(rng, options['platforms'], rows, max(1, rows // 50), rows)
+
+            self.stdout.write(f"{'payload':<12}{'objects':>9}{'before/s':>12}{'after/s':>12}{'speedup':>9}  same output")
+            for name in options['payload'] or benchmarks.PAYLOADS:
+                result = benchmarks.serialization(name, options['repeat'])
+                self.stdout.write(
+                    f"{name:<12}{result['objects']:>9}{result['before_per_sec']:>12}{result['after_per_sec']:>12}"
+                    f"{result['speedup']:>8}x  {'yes' if result['same_output'] else 'NO'}"
+                )
+
+            transaction.set_rollback(True)
+
+        # The indexes now point at rolled back rows
+        search.index.reset()
+        ranking.index.reset()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from watchmate import recommendations
+
+
+class Command(BaseCommand):
+    help = "Precompute the most similar titles of every title from the Review table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help="Only recompute the titles reviewed since the last build and their similar titles",
+        )
+
+    def handle(self, *args, **options):
+        updated = recommendations.build(incremental=options['incremental'])
+        self.stdout.write(self.style.SUCCESS(f"Updated similar titles for {updated} titles"))
@@ -0,0 +1,34 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from watchmate import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream all titles or reviews as NDJSON or CSV in (created, id) order. "
+        "Pass the created/id of the last exported row as --since/--since-id to only export newer rows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(export.EXPORTS))
+        parser.add_argument('--fmt', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument('--since', help="ISO datetime watermark")
+        parser.add_argument('--since-id', type=int)
+        parser.add_argument('--output', '-o', help="File to write, defaults to stdout")
+
+    def handle(self, *args, **options):
+        try:
+            watermark = export.parse_watermark(options['since'], options['since_id'])
+        except ValidationError as exc:
+            raise CommandError(' '.join(exc.messages))
+
+        chunks = export.render(options['name'], options['fmt'], watermark)
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+            stream.writelines(chunks)
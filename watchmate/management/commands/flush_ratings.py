@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from watchmate import ratings, stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Force-flush the rating deltas buffered by the write-behind mode and the platform stats. "
+        "They are kept in BUFFER_CACHE_ALIAS, so with a shared cache (REDIS_URL) "
+        "this writes out what every process buffered, e.g. at the end of a scripted import"
+    )
+
+    def handle(self, *args, **options):
+        titles = ratings.flush()
+        platforms = stats.flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed pending ratings for {titles} titles and {platforms} platforms"))
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from watchmate import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import StreamPlatform and WatchList rows from a JSONL or CSV file "
+        "(see watchmate/importer.py for the row format)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, - for stdin")
+        parser.add_argument('--format', choices=importer.FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, help="Rows per transaction")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        fmt = options['format'] or importer.guess_format(path)
+
+        try:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        except OSError as exc:
+            raise CommandError(exc)
+
+        with stream:
+            report = importer.CatalogImporter(batch_size=options['batch_size']).run(
+                importer.read_rows(stream, fmt), progress=self.progress,
+            )
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['rows']} rows in {report['seconds']:.1f}s ({report['rows_per_sec']} rows/s): "
+            f"{report['created']} titles created, {report['updated']} updated, "
+            f"{report['platforms_created']} platforms created, {report['platforms_updated']} updated, "
+            f"{report['skipped']} skipped"
+        ))
+
+    def progress(self, report):
+        if self.verbosity > 1:
+            self.stdout.write(f"{report['rows']} rows, {report['rows_per_sec']} rows/s")
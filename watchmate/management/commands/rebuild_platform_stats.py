@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from watchmate import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute PlatformStats from the WatchList and Review tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help="Only rebuild these StreamPlatform ids")
+
+    def handle(self, *args, **options):
+        rebuilt = stats.rebuild(options['ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {rebuilt} platforms"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from watchmate import cache, ranking, ratings
+from watchmate.models import WatchList
+
+
+class Command(BaseCommand):
+    help = "Recompute WatchList rating aggregates from the Review table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help="Only rebuild these WatchList ids")
+
+    def handle(self, *args, **options):
+        queryset = WatchList.objects.all()
+        if options['ids']:
+            queryset = queryset.filter(pk__in=options['ids'])
+
+        updated = ratings.rebuild(queryset)
+        ranking.index.reset()
+        cache.invalidate('catalog')
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {updated} titles"))
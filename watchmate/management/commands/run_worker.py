@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from watchmate import queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background tasks of the outbox (see watchmate/queue.py) until interrupted: "
+        "due tasks are polled every --interval seconds and done tasks purged every --purge-interval"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the tasks due now and exit")
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--batch', type=int, default=100, help="Tasks read per poll")
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--purge-interval', type=float, default=3600.0)
+
+    def handle(self, *args, **options):
+        queue.check_settings('worker')
+        purged_at = None
+
+        try:
+            while True:
+                done = 0
+                # Keep going while full batches come back, the queue is behind
+                while True:
+                    ran = queue.run_due(options['batch'], options['threads'])
+                    done += ran
+                    if ran < options['batch']:
+                        break
+
+                if purged_at is None or time.monotonic() - purged_at > options['purge_interval']:
+                    queue.purge()
+                    purged_at = time.monotonic()
+
+                if options['once']:
+                    self.stdout.write(self.style.SUCCESS(f"Ran {done} tasks"))
+                    return
+
+                if done:
+                    self.stdout.write(f"Ran {done} tasks")
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 18:31
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
+
+
+def backfill_rating_sum(apps, schema_editor):
+    # The old (avg + new) / 2 formula drifted, so rebuild every aggregate from the reviews
+    WatchList = apps.get_model('watchmate', 'WatchList')
+    Review = apps.get_model('watchmate', 'Review')
+
+    reviews = Review.objects.filter(watchlist=OuterRef('pk')).order_by().values('watchlist')
+
+    WatchList.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        number_rating=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+    )
+    WatchList.objects.update(
+        avg_rating=Case(
+            When(GreaterThan(F('number_rating'), 0), then=Cast(F('rating_sum'), FloatField()) / F('number_rating')),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchmate', '0002_review_streamplatform_watchlist_delete_post_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlist',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 19:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_reviews(apps, schema_editor):
+    # Which of a user's reviews to keep is theirs to decide: list the titles
+    # reviewed more than once by the same user and stop before the constraint fails
+    Review = apps.get_model('watchmate', 'Review')
+
+    duplicates = list(
+        Review.objects.order_by().values('watchlist_id', 'review_user_id')
+        .annotate(reviews=Count('id')).filter(reviews__gt=1)
+        .values_list('watchlist_id', 'review_user_id')[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Some users reviewed a title more than once, delete all but one review of each "
+            "before migrating (title id, user id): "
+            + ", ".join(f"({watchlist_id}, {user_id})" for watchlist_id, user_id in duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchmate', '0003_watchlist_rating_sum'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['watchlist', '-created'], name='review_watchlist_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['review_user', '-created'], name='review_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['-created'], name='watchlist_created_idx'),
+        ),
+        migrations.RunPython(check_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('watchlist', 'review_user'), name='unique_review_per_user'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-18 19:20
+
+from django.db import migrations
+
+
+# Only PostgreSQL gets these; other databases use the in-process search index
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models.functions import Upper
+
+    WatchList = apps.get_model('watchmate', 'WatchList')
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # Matches the vector built by watchmate.search.PostgresSearchBackend
+    schema_editor.add_index(WatchList, GinIndex(
+        SearchVector('title', 'description', config='english'),
+        name='watchlist_search_idx',
+    ))
+    # icontains compiles to UPPER(title) LIKE UPPER('%term%')
+    schema_editor.add_index(WatchList, GinIndex(
+        OpClass(Upper('title'), name='gin_trgm_ops'),
+        name='watchlist_title_trgm_idx',
+    ))
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('DROP INDEX IF EXISTS watchlist_search_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS watchlist_title_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchmate', '0004_review_indexes_and_unique_review'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchmate', '0005_watchlist_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlist',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
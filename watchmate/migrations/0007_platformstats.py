@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_platform_stats(apps, schema_editor):
+    StreamPlatform = apps.get_model('watchmate', 'StreamPlatform')
+    WatchList = apps.get_model('watchmate', 'WatchList')
+    Review = apps.get_model('watchmate', 'Review')
+    PlatformStats = apps.get_model('watchmate', 'PlatformStats')
+
+    for platform_id in StreamPlatform.objects.values_list('id', flat=True):
+        titles = WatchList.objects.filter(platform_id=platform_id)
+        histogram = dict(
+            Review.objects.filter(watchlist__platform_id=platform_id)
+            .order_by().values_list('rating').annotate(count=models.Count('id'))
+        )
+        top = (
+            titles.filter(active=True, number_rating__gt=0)
+            .order_by('-avg_rating', '-number_rating', 'id')
+            .values('id', 'title', 'avg_rating', 'number_rating')[:5]
+        )
+
+        PlatformStats.objects.create(
+            platform_id=platform_id,
+            title_count=titles.count(),
+            active_count=titles.filter(active=True).count(),
+            review_count=sum(histogram.values()),
+            rating_sum=sum(rating * count for rating, count in histogram.items()),
+            top_titles=list(top),
+            **{f'rating_{rating}': histogram.get(rating, 0) for rating in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchmate', '0006_watchlist_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformStats',
+            fields=[
+                ('platform', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='watchmate.streamplatform')),
+                ('title_count', models.IntegerField(default=0)),
+                ('active_count', models.IntegerField(default=0)),
+                ('review_count', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_1', models.IntegerField(default=0)),
+                ('rating_2', models.IntegerField(default=0)),
+                ('rating_3', models.IntegerField(default=0)),
+                ('rating_4', models.IntegerField(default=0)),
+                ('rating_5', models.IntegerField(default=0)),
+                ('top_titles', models.JSONField(default=list)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_platform_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchmate', '0007_platformstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created', 'id'], name='review_created_id_idx'),
+        ),
+    ]
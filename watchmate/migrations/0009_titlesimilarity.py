@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 22:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watchmate', '0008_review_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TitleSimilarity',
+            fields=[
+                ('title', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similarity', serialize=False, to='watchmate.watchlist')),
+                ('neighbors', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -1,18 +1,50 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import RowNumber
 
 # Create your models here.
 
+class StreamPlatformQuerySet(models.QuerySet):
+
+    def with_watchlist(self, limit=None, fields=None):
+        # One extra query for the titles of every platform instead of one per platform
+        titles = WatchList.objects.latest_per_platform(limit)
+
+        if fields:
+            # The FK is needed to attach each title to its platform
+            titles = titles.only(*set(fields) | {"platform"})
+
+        return self.prefetch_related(models.Prefetch("watchlist", queryset=titles))
+
+
 class StreamPlatform(models.Model):
     name = models.CharField(max_length=30)
     about = models.CharField(max_length=255)
     website = models.URLField(max_length=100)
 
+    objects = StreamPlatformQuerySet.as_manager()
+
     def __str__(self):
         return self.name + " " + str(self.id)
     
 
+class WatchListQuerySet(models.QuerySet):
+
+    def latest_per_platform(self, limit=None):
+        titles = self.order_by("-created", "-id")
+
+        if limit:
+            # Slicing is done per platform with a window function rather than a single LIMIT
+            titles = titles.annotate(
+                platform_rank=models.Window(
+                    RowNumber(), partition_by="platform", order_by=("-created", "-id")
+                )
+            ).filter(platform_rank__lte=limit)
+
+        return titles
+
+
 class WatchList(models.Model):
     title = models.CharField(max_length=100)
     description = models.CharField(max_length=500)
@@ -20,12 +52,31 @@ class WatchList(models.Model):
     active = models.BooleanField(default=True)
     avg_rating = models.FloatField(default=0)
     number_rating = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = WatchListQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created"], name="watchlist_created_idx"),
+        ]
 
     def __str__(self):
         return self.title + " | " + self.platform.name
     
 
+class ReviewQuerySet(models.QuerySet):
+
+    def for_api(self):
+        # The author is joined in and only the columns ReviewSerializers renders are read
+        return self.select_related("review_user").only(
+            "id", "description", "rating", "watchlist", "active", "created", "updated",
+            "review_user__id", "review_user__username",
+        )
+
+
 class Review(models.Model):
     review_user = models.ForeignKey(User, on_delete=models.CASCADE)
     description = models.CharField(max_length=200, null=True)
@@ -35,5 +86,83 @@ class Review(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ReviewQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["watchlist", "-created"], name="review_watchlist_created_idx"),
+            models.Index(fields=["review_user", "-created"], name="review_user_created_idx"),
+            # Export order, see watchmate/export.py
+            models.Index(fields=["created", "id"], name="review_created_id_idx"),
+        ]
+        constraints = [
+            # One review per user per movie, enforced by the database
+            models.UniqueConstraint(fields=["watchlist", "review_user"], name="unique_review_per_user"),
+        ]
+
     def __str__(self):
         return self.review_user.username + " | " + self.watchlist.title + " | " + str(self.rating)
+
+
+class PlatformStats(models.Model):
+    platform = models.OneToOneField(StreamPlatform, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    title_count = models.IntegerField(default=0)
+    active_count = models.IntegerField(default=0)
+    review_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_1 = models.IntegerField(default=0)
+    rating_2 = models.IntegerField(default=0)
+    rating_3 = models.IntegerField(default=0)
+    rating_4 = models.IntegerField(default=0)
+    rating_5 = models.IntegerField(default=0)
+    top_titles = models.JSONField(default=list)
+    updated = models.DateTimeField(auto_now=True)
+
+    @property
+    def avg_rating(self):
+        if not self.review_count:
+            return 0
+        return self.rating_sum / self.review_count
+
+    @property
+    def rating_histogram(self):
+        return {str(rating): getattr(self, f"rating_{rating}") for rating in range(1, 6)}
+
+    def __str__(self):
+        return "Stats | " + str(self.platform_id)
+
+
+class TitleSimilarity(models.Model):
+    title = models.OneToOneField(WatchList, on_delete=models.CASCADE, primary_key=True, related_name="similarity")
+    # [[title id, score], ...], most similar first - see watchmate/recommendations.py
+    neighbors = models.JSONField(default=list)
+    computed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return "Similar | " + str(self.title_id)
+
+
+class Task(models.Model):
+    # Outbox of side effects run after the write commits - see watchmate/queue.py
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (DONE, "Done"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    key = models.CharField(max_length=200, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="task_status_run_at_idx"),
+        ]
+
+    def __str__(self):
+        return self.name + " | " + self.status
@@ -0,0 +1,210 @@
+"""
+Background tasks with a database outbox.
+
+Write endpoints hand their secondary work (rating aggregates, platform stats,
+see watchmate.tasks) to ``enqueue`` rather than doing it on the request
+thread. ``TASK_QUEUE`` selects what happens to it:
+
+- ``inline`` (default): the task runs at once, in the caller's transaction
+- ``thread``: a Task row is inserted in the caller's transaction, so it
+  exists exactly when the write commits, and is run by an in-process pool of
+  ``TASK_WORKER_THREADS`` threads once it has
+- ``worker``: only the Task row is inserted, ``manage.py run_worker`` runs it
+
+Running a task claims its row, calls the function and marks the row done in
+one transaction: the task's writes commit together with "done", so a worker
+dying halfway leaves the task pending rather than half applied. A task that
+raises is retried up to ``TASK_MAX_ATTEMPTS`` times, ``TASK_RETRY_DELAY_SECONDS``
+apart and doubling, and then marked failed with its traceback.
+
+Tasks run this way invalidate the response cache from another process (or
+thread pool) than the request's, so ``thread`` and ``worker`` need the cache
+alias to be shared (``REDIS_URL``) unless ``RESPONSE_CACHE_BACKEND`` is none;
+``check_settings`` refuses them otherwise. ``current_task`` tells a task
+function whether it runs from its row.
+
+A ``key`` makes enqueueing idempotent: a task with the key of an existing one
+is dropped. Done tasks are kept ``TASK_RETENTION_HOURS`` for that (run_worker
+purges them). In thread mode, run run_worker as well to pick up the tasks of
+processes that exited before running them.
+"""
+
+import logging
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from watchmate import cache
+from watchmate.models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# Task name -> function
+registry = {}
+
+# The Task whose function is running, None inline
+_current_task = ContextVar('current_task', default=None)
+
+
+def task(func):
+    """Register `func` as a task, under its dotted path."""
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    registry[func.task_name] = func
+    return func
+
+
+def current_task():
+    return _current_task.get()
+
+
+def check_settings(mode):
+    if mode != 'inline' and not cache.shared():
+        raise ImproperlyConfigured(
+            f"TASK_QUEUE={mode} invalidates the response cache outside of the web process: "
+            "set REDIS_URL to share the cache, or RESPONSE_CACHE_BACKEND=none"
+        )
+
+
+def enqueue(func, key=None, **payload):
+    """
+    Run ``func(**payload)`` once the current transaction commits. The payload
+    has to be JSON serializable. Returns the Task, None when the task ran
+    inline or `key` was already enqueued.
+    """
+    mode = getattr(settings, 'TASK_QUEUE', 'inline')
+    if mode == 'inline':
+        func(**payload)
+        return None
+
+    check_settings(mode)
+
+    try:
+        with transaction.atomic():
+            task = Task.objects.create(
+                name=func.task_name, payload=payload, key=key or uuid.uuid4().hex, run_at=timezone.now(),
+            )
+    except IntegrityError:
+        return None
+
+    if mode == 'thread':
+        transaction.on_commit(lambda: get_pool().submit(task.pk))
+    return task
+
+
+def retry_delay(attempts):
+    return getattr(settings, 'TASK_RETRY_DELAY_SECONDS', 1) * 2 ** (attempts - 1)
+
+
+def run(task_id):
+    """Run a pending task that is due. Returns it, None when it wasn't due or another worker has it."""
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Locks the row until this transaction ends, a concurrent claim waits and then finds it done
+        claimed = Task.objects.filter(pk=task_id, status=Task.PENDING, run_at__lte=now).update(attempts=F('attempts') + 1)
+        if not claimed:
+            return None
+
+        task = Task.objects.get(pk=task_id)
+        try:
+            token = _current_task.set(task)
+            try:
+                with transaction.atomic():
+                    registry[task.name](**task.payload)
+            finally:
+                _current_task.reset(token)
+        except Exception:
+            task.last_error = traceback.format_exc()
+            if task.attempts >= getattr(settings, 'TASK_MAX_ATTEMPTS', 5):
+                task.status = Task.FAILED
+                logger.error("Task %s (%s) failed after %d attempts", task.pk, task.name, task.attempts)
+            else:
+                task.run_at = now + timedelta(seconds=retry_delay(task.attempts))
+        else:
+            task.status = Task.DONE
+            task.last_error = ''
+
+        task.save(update_fields=['status', 'run_at', 'last_error', 'updated'])
+
+    return task
+
+
+def _run_in_thread(task_id):
+    try:
+        return run(task_id)
+    finally:
+        # Every thread has its own connection
+        connection.close()
+
+
+def run_due(limit=100, threads=1):
+    """Run up to `limit` due tasks, oldest first. Returns the number of tasks run."""
+    pending = Task.objects.filter(status=Task.PENDING, run_at__lte=timezone.now()).order_by('run_at', 'id')
+    ids = list(pending.values_list('id', flat=True)[:limit])
+
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            tasks = list(executor.map(_run_in_thread, ids))
+    else:
+        tasks = [run(pk) for pk in ids]
+
+    return sum(task is not None for task in tasks)
+
+
+def purge():
+    """Delete the done tasks older than TASK_RETENTION_HOURS; failed ones stay for inspection."""
+    cutoff = timezone.now() - timedelta(hours=getattr(settings, 'TASK_RETENTION_HOURS', 24))
+    deleted, _ = Task.objects.filter(status=Task.DONE, updated__lt=cutoff).delete()
+    return deleted
+
+
+class TaskPool:
+    """Runs the tasks enqueued by this process on a thread pool, retries after their delay."""
+
+    def __init__(self, threads):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='task')
+
+    def submit(self, task_id, delay=0):
+        if delay > 0:
+            timer = threading.Timer(delay, self.submit, (task_id,))
+            timer.daemon = True
+            timer.start()
+            return
+        self.executor.submit(self._run, task_id)
+
+    def _run(self, task_id):
+        try:
+            task = _run_in_thread(task_id)
+        except Exception:
+            # The database is unavailable: left pending for run_worker
+            logger.exception("Could not run task %s", task_id)
+            return
+
+        if task is not None and task.status == Task.PENDING:
+            self.submit(task_id, delay=(task.run_at - timezone.now()).total_seconds())
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = TaskPool(getattr(settings, 'TASK_WORKER_THREADS', 4))
+        return _pool
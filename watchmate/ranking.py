@@ -0,0 +1,280 @@
+"""
+Top rated and trending rankings of the reviewed titles.
+
+``top`` orders by the Bayesian average ``(v * R + m * C) / (v + m)``: R is the
+title's mean rating, v its number of ratings, C the mean rating over all
+reviews and m ``RANKING_PRIOR_WEIGHT``. Titles with few reviews are pulled
+towards C, so a single 5 does not beat a hundred 4.8s.
+
+``trending`` orders by the sum of the review ratings, each halved every
+``RANKING_HALF_LIFE_HOURS``. Scores are stored as ``rating * 2 ** ((created -
+epoch) / half_life)`` for a fixed epoch: the decay to "now" is the same
+factor for every title, so it does not change the order and nothing has to be
+decayed as time passes. A review only touches its own title's score.
+
+Both rankings live in ``index``: a SortedList of ``(-score, -id)`` keys for
+all titles and one per platform, so a page is an O(log n + page) slice. The
+views in watchmate.api.views and watchmate.reviews feed it review events as
+their transactions commit. It is rebuilt from the database every
+``RANKING_REBUILD_SECONDS``, which also picks up the writes of other processes
+and the drift of C: the first read builds it, later rebuilds run on a thread
+into a new index that is swapped in, so reads and events never wait on one.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from sortedcontainers import SortedList
+
+from watchmate.models import Review, WatchList
+
+
+# Older reviews add less than 2 ** -TRENDING_HALF_LIVES of their rating and are not read
+TRENDING_HALF_LIVES = 20
+
+RANKINGS = ('top', 'trending')
+
+logger = logging.getLogger(__name__)
+
+
+def half_life():
+    return getattr(settings, 'RANKING_HALF_LIFE_HOURS', 72) * 3600
+
+
+class RankedTitle:
+
+    __slots__ = ('platform', 'count', 'total', 'trend')
+
+    def __init__(self, platform, count=0, total=0, trend=0.0):
+        self.platform = platform
+        self.count = count
+        self.total = total
+        self.trend = trend
+
+
+class RankIndex:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Held by the build, which reads the database outside of ``lock``
+        self.build_lock = threading.RLock()
+        self.rebuilding = False
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.built_at = None
+            self.titles = {}
+            # Ranking -> platform id (None for all titles) -> SortedList of (-score, -id)
+            self.keys = {name: defaultdict(SortedList) for name in RANKINGS}
+            self.mean = 0.0
+            self.epoch = time.time()
+            # The events seen while a build reads the database, replayed on
+            # the built index. A build started before a reset is thrown away
+            self.events = None
+            self.generation += 1
+
+    def load(self):
+        now = timezone.now()
+        self.epoch = now.timestamp()
+
+        rows = WatchList.objects.filter(number_rating__gt=0).values_list('id', 'platform_id', 'number_rating', 'rating_sum')
+        for pk, platform, count, total in rows.iterator(chunk_size=2000):
+            self.titles[pk] = RankedTitle(platform, count, total)
+
+        totals = WatchList.objects.aggregate(count=Sum('number_rating'), total=Sum('rating_sum'))
+        self.mean = (totals['total'] or 0) / (totals['count'] or 1)
+
+        since = now - timedelta(seconds=half_life() * TRENDING_HALF_LIVES)
+        reviews = Review.objects.filter(created__gte=since).values_list('watchlist_id', 'rating', 'created')
+        for pk, rating, created in reviews.iterator(chunk_size=2000):
+            if pk in self.titles:
+                self.titles[pk].trend += self.weight(rating, created)
+
+        for pk, title in self.titles.items():
+            self._link(pk, title)
+
+        self.built_at = time.monotonic()
+
+    def build(self):
+        with self.build_lock:
+            with self.lock:
+                generation = self.generation
+                self.events = []
+
+            fresh = RankIndex()
+            fresh.load()
+
+            with self.lock:
+                events, self.events = self.events, None
+                if generation != self.generation:
+                    return
+
+                # An event committed just before the reads may be counted
+                # twice, until the next rebuild
+                for method, args in events:
+                    getattr(fresh, method)(*args)
+                self.titles, self.keys, self.mean, self.epoch = fresh.titles, fresh.keys, fresh.mean, fresh.epoch
+                self.built_at = fresh.built_at
+
+    def ensure_built(self):
+        if self.built_at is None:
+            # Nothing to serve yet: the first read builds, the others wait for it
+            with self.build_lock:
+                if self.built_at is None:
+                    self.build()
+            return
+
+        interval = getattr(settings, 'RANKING_REBUILD_SECONDS', 600)
+        with self.lock:
+            if self.rebuilding or time.monotonic() - self.built_at <= interval:
+                return
+            self.rebuilding = True
+
+        thread = threading.Thread(target=self._rebuild_in_thread, daemon=True)
+        thread.start()
+
+    def _rebuild_in_thread(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Could not rebuild the rankings")
+        finally:
+            with self.lock:
+                self.rebuilding = False
+            # The thread has its own connection
+            connection.close()
+
+    def _record(self, method, *args):
+        if self.events is not None:
+            self.events.append((method, args))
+
+    def weight(self, rating, created):
+        return rating * 2 ** ((created.timestamp() - self.epoch) / half_life())
+
+    def score(self, name, title):
+        if name == 'top':
+            prior = getattr(settings, 'RANKING_PRIOR_WEIGHT', 10)
+            return (title.total + prior * self.mean) / (title.count + prior)
+        return title.trend
+
+    def _link(self, pk, title):
+        for name in RANKINGS:
+            key = (-self.score(name, title), -pk)
+            self.keys[name][None].add(key)
+            self.keys[name][title.platform].add(key)
+
+    def _unlink(self, pk, title):
+        for name in RANKINGS:
+            key = (-self.score(name, title), -pk)
+            self.keys[name][None].discard(key)
+            self.keys[name][title.platform].discard(key)
+
+    def apply(self, pk, platform, count=0, total=0, created=None):
+        with self.lock:
+            self._record('apply', pk, platform, count, total, created)
+            # Not built yet: the build reads the change from the database
+            if self.built_at is None:
+                return
+
+            title = self.titles.get(pk)
+            if title is None:
+                title = self.titles[pk] = RankedTitle(platform)
+            else:
+                self._unlink(pk, title)
+
+            title.platform = platform
+            title.count += count
+            title.total += total
+            if created is not None:
+                # Subtracting removed reviews can leave float dust behind
+                title.trend = max(title.trend + self.weight(total, created), 0.0)
+
+            if title.count > 0:
+                self._link(pk, title)
+            else:
+                del self.titles[pk]
+
+    def move(self, pk, platform):
+        with self.lock:
+            self._record('move', pk, platform)
+            title = self.titles.get(pk)
+            if title is not None and title.platform != platform:
+                self._unlink(pk, title)
+                title.platform = platform
+                self._link(pk, title)
+
+    def remove(self, pk):
+        with self.lock:
+            self._record('remove', pk)
+            title = self.titles.pop(pk, None)
+            if title is not None:
+                self._unlink(pk, title)
+
+    def page(self, name, platform, start, stop):
+        """(id, score) of the titles ranked start to stop, and the number of titles ranked."""
+        self.ensure_built()
+
+        with self.lock:
+            keys = self.keys[name].get(platform) or ()
+            rows = [(-pk, -score) for score, pk in keys[start:stop]]
+            if name == 'trending':
+                # Decayed to now, for display
+                decay = 2 ** ((self.epoch - time.time()) / half_life())
+                rows = [(pk, score * decay) for pk, score in rows]
+            return rows, len(keys)
+
+
+index = RankIndex()
+
+
+class Ranking:
+    """A ranking as a sliceable sequence of (id, score), for the paginators."""
+
+    def __init__(self, name, platform=None):
+        self.name = name
+        self.platform = platform
+
+    def __len__(self):
+        return index.page(self.name, self.platform, 0, 0)[1]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return index.page(self.name, self.platform, item.start or 0, item.stop)[0]
+        return index.page(self.name, self.platform, item, item + 1)[0][0]
+
+
+# Review events, called by the views next to the ratings and stats updates and
+# applied once their transaction commits. A review's rating changes the trend
+# score by its weight, see RankIndex.weight()
+
+def review_added(title_id, platform_id, rating, created):
+    transaction.on_commit(lambda: index.apply(title_id, platform_id, count=1, total=rating, created=created))
+
+
+def reviews_added(reviews):
+    # (title id, platform id, rating, created) per review
+    reviews = list(reviews)
+
+    def apply():
+        for title_id, platform_id, rating, created in reviews:
+            index.apply(title_id, platform_id, count=1, total=rating, created=created)
+
+    transaction.on_commit(apply)
+
+
+def review_changed(title_id, platform_id, old_rating, new_rating, created):
+    delta = new_rating - old_rating
+    transaction.on_commit(lambda: index.apply(title_id, platform_id, total=delta, created=created))
+
+
+def review_removed(title_id, platform_id, rating, created):
+    transaction.on_commit(lambda: index.apply(title_id, platform_id, count=-1, total=-rating, created=created))
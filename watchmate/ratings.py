@@ -0,0 +1,184 @@
+"""
+Rating aggregation for WatchList.
+
+Every title keeps a running ``rating_sum`` and ``number_rating``; ``avg_rating``
+is derived from those two columns inside the same UPDATE statement. Nothing is
+read into Python first, so concurrent reviews on the same title can never
+overwrite each other's changes.
+
+With ``RATING_WRITE_BEHIND`` enabled, new ratings are collected in a
+RatingBuffer instead, kept in the Django cache (see watchmate/buffers.py), and
+written to the database in one bulk UPDATE every ``RATING_FLUSH_INTERVAL_MS``
+milliseconds or ``RATING_FLUSH_EVENTS`` ratings of a process, whichever comes
+first. Averages lag behind by at most one flush; anything still buffered is
+flushed when the process exits, or by the flush_ratings command. A flush that
+fails puts its deltas back for the next one.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Now
+from django.db.models.lookups import GreaterThan
+
+from watchmate import cache, stats
+from watchmate.buffers import BufferedWriter
+from watchmate.models import WatchList, Review
+
+
+logger = logging.getLogger(__name__)
+
+
+def average(total, count):
+    # Expression for total / count that falls back to 0 for unrated titles
+    return Case(
+        When(GreaterThan(count, 0), then=Cast(total, FloatField()) / count),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_delta(watchlist_id, total=0, count=0):
+    # Shift the running sum/count of one title and recompute its average
+    # in a single statement
+    new_total = F('rating_sum') + total
+    new_count = F('number_rating') + count
+
+    return WatchList.objects.filter(pk=watchlist_id).update(
+        rating_sum=new_total,
+        number_rating=new_count,
+        avg_rating=average(new_total, new_count),
+        updated=Now(),
+    )
+
+
+def apply_deltas(deltas):
+    # Same as apply_delta for many titles at once: {watchlist_id: (total, count)}
+    # becomes a single UPDATE ... WHERE id IN (...) with CASE per column
+    if not deltas:
+        return 0
+
+    total_case = Case(*[When(pk=pk, then=Value(total)) for pk, (total, count) in deltas.items()], default=Value(0))
+    count_case = Case(*[When(pk=pk, then=Value(count)) for pk, (total, count) in deltas.items()], default=Value(0))
+
+    new_total = F('rating_sum') + total_case
+    new_count = F('number_rating') + count_case
+
+    return WatchList.objects.filter(pk__in=list(deltas)).update(
+        rating_sum=new_total,
+        number_rating=new_count,
+        avg_rating=average(new_total, new_count),
+        updated=Now(),
+    )
+
+
+def _buffer_deltas(deltas):
+    # Runs after the review committed, so a failed flush must not fail the request:
+    # the buffer keeps the deltas and the next flush retries them
+    try:
+        for watchlist_id, (total, count) in deltas.items():
+            get_buffer().add(watchlist_id, total, count)
+    except Exception:
+        logger.exception("Could not flush the buffered ratings")
+
+
+def add_rating(watchlist_id, rating):
+    if getattr(settings, 'RATING_WRITE_BEHIND', False):
+        # Only buffer ratings whose review actually committed
+        transaction.on_commit(lambda: _buffer_deltas({watchlist_id: (rating, 1)}))
+        return 0
+    return apply_delta(watchlist_id, total=rating, count=1)
+
+
+def add_ratings(deltas):
+    # Many new ratings at once: {watchlist_id: (total, count)}
+    if getattr(settings, 'RATING_WRITE_BEHIND', False):
+        transaction.on_commit(lambda: _buffer_deltas(deltas))
+        return 0
+    return apply_deltas(deltas)
+
+
+def change_rating(watchlist_id, old_rating, new_rating):
+    if old_rating == new_rating:
+        return 0
+    return apply_delta(watchlist_id, total=new_rating - old_rating)
+
+
+def remove_rating(watchlist_id, rating):
+    return apply_delta(watchlist_id, total=-rating, count=-1)
+
+
+def rebuild(queryset=None):
+    """
+    Recompute the aggregates from the Review table.
+
+    Used to repair titles whose reviews were changed outside the API
+    (admin, shell, raw SQL).
+    """
+    if queryset is None:
+        queryset = WatchList.objects.all()
+
+    reviews = Review.objects.filter(watchlist=OuterRef('pk')).order_by().values('watchlist')
+
+    queryset.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        number_rating=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+    )
+    return queryset.update(avg_rating=average(F('rating_sum'), F('number_rating')), updated=Now())
+
+
+class RatingBuffer(BufferedWriter):
+    """
+    Accumulates rating deltas per title and writes them with apply_deltas.
+    """
+
+    prefix = 'ratings'
+    fields = ('total', 'count')
+
+    def add(self, watchlist_id, total, count=1):
+        self.add_deltas({watchlist_id: {'total': total, 'count': count}})
+
+    def write(self, deltas):
+        pending = {pk: (values['total'], values['count']) for pk, values in deltas.items() if any(values.values())}
+        apply_deltas(pending)
+
+        if pending:
+            stats.titles_rated(list(pending))
+            cache.invalidate('watch', *[f'watch:{pk}' for pk in pending])
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = RatingBuffer(
+                flush_interval=getattr(settings, 'RATING_FLUSH_INTERVAL_MS', 500) / 1000,
+                flush_events=getattr(settings, 'RATING_FLUSH_EVENTS', 100),
+            )
+        return _buffer
+
+
+def flush():
+    # Write out everything buffered in the cache, by any process sharing it
+    return (_buffer or RatingBuffer()).flush()
+
+
+@atexit.register
+def shutdown():
+    global _buffer
+
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+
+    if buffer is None:
+        return 0
+    return buffer.stop()
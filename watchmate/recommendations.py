@@ -0,0 +1,206 @@
+"""
+Item-item recommendations: "users who liked this also liked".
+
+The reviews form a sparse title x user rating matrix. Each rating is centered
+on its user's mean rating (adjusted cosine), so a user who rates everything 5
+says nothing and a 2 from a generous user counts against the title. Two
+titles are similar when the same users rate them on the same side of their
+mean. The similarity is the cosine of the two title rows, shrunk by
+``n / (n + RECOMMENDATIONS_SHRINKAGE)`` for n common raters so that one
+shared reviewer doesn't make a perfect match.
+
+``similar_titles`` computes it with SciPy sparse products, a block of title
+rows against all titles at a time, and keeps the best
+``RECOMMENDATIONS_TOP_K`` per title (np.argpartition over the block). The
+build_recommendations command stores the lists in TitleSimilarity; the API
+only reads them:
+
+- ``similar``: the stored list of one title
+- ``recommend``: the titles similar to what a user rated above their mean,
+  from the lists of the titles they reviewed (two queries)
+
+``build(incremental=True)`` only recomputes the titles reviewed since the
+last build, and the titles in their old and new lists, against the current
+matrix. The changed ratings also move their users' means, which shifts other
+titles a little; that, and deleted reviews, wait for the next full build, so
+run it periodically as well.
+"""
+
+from collections import defaultdict
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from scipy import sparse
+
+from watchmate.models import Review, TitleSimilarity
+
+
+# Cells of the dense similarity block computed at once, 16 MB of float32
+BLOCK_CELLS = 2 ** 22
+
+BATCH_SIZE = 2000
+
+# Users' mean ratings start from this many ratings of 3, so a single 5 still
+# says "liked" and a single 1 "disliked"
+PRIOR_RATINGS = 2
+PRIOR_MEAN = 3
+
+
+def top_k():
+    return getattr(settings, 'RECOMMENDATIONS_TOP_K', 20)
+
+
+def load_reviews():
+    """(user ids, title ids, ratings) of every review, as arrays."""
+    rows = Review.objects.order_by().values_list('review_user_id', 'watchlist_id', 'rating')
+    reviews = np.fromiter(rows.iterator(chunk_size=BATCH_SIZE), dtype=np.dtype((np.int64, 3)))
+    return reviews[:, 0], reviews[:, 1], reviews[:, 2]
+
+
+def rating_matrices(users, titles, ratings):
+    """Title ids, and the title x user matrices of normalized centered ratings and of raters."""
+    title_ids, rows = np.unique(titles, return_inverse=True)
+    _, columns = np.unique(users, return_inverse=True)
+    shape = (len(title_ids), columns.max() + 1 if len(columns) else 0)
+
+    ratings = ratings.astype(np.float64)
+    counts = np.bincount(columns, minlength=shape[1])
+    means = (np.bincount(columns, weights=ratings, minlength=shape[1]) + PRIOR_RATINGS * PRIOR_MEAN) / (counts + PRIOR_RATINGS)
+    centered = (ratings - means[columns]).astype(np.float32)
+
+    matrix = sparse.csr_matrix((centered, (rows, columns)), shape=shape)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    normalized = sparse.diags((1 / norms).astype(np.float32)) @ matrix
+
+    raters = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=shape)
+    return title_ids, normalized.tocsr(), raters
+
+
+def similar_titles(users, titles, ratings, only=None, k=None, shrinkage=None):
+    """
+    The k most similar titles of every title (or of the titles in `only`) as
+    {title id: [(title id, score), ...]}, best first. Only positive scores.
+    """
+    k = top_k() if k is None else k
+    shrinkage = getattr(settings, 'RECOMMENDATIONS_SHRINKAGE', 10) if shrinkage is None else shrinkage
+
+    title_ids, normalized, raters = rating_matrices(users, titles, ratings)
+    count = len(title_ids)
+
+    rows = np.arange(count)
+    if only is not None:
+        rows = rows[np.isin(title_ids, np.fromiter(only, dtype=np.int64))]
+
+    keep = min(k, count - 1)
+    if keep <= 0:
+        return {int(title_ids[row]): [] for row in rows}
+
+    normalized_t = normalized.T.tocsr()
+    raters_t = raters.T.tocsr()
+    batch = max(1, BLOCK_CELLS // count)
+
+    neighbors = {}
+    for start in range(0, len(rows), batch):
+        block = rows[start:start + batch]
+
+        scores = (normalized[block] @ normalized_t).toarray()
+        common = (raters[block] @ raters_t).toarray()
+        scores *= common / (common + shrinkage)
+        # Not similar to itself
+        scores[np.arange(len(block)), block] = 0
+
+        best = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+
+        # Highest score first, ties by title id
+        order = np.lexsort((title_ids[best], -best_scores), axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        for row, columns, values in zip(block, best, best_scores):
+            positive = values > 0
+            neighbors[int(title_ids[row])] = [
+                (int(pk), round(float(score), 4)) for pk, score in zip(title_ids[columns[positive]], values[positive])
+            ]
+
+    return neighbors
+
+
+def store(neighbors, computed_at):
+    rows = [
+        TitleSimilarity(title_id=pk, neighbors=[list(pair) for pair in pairs], computed_at=computed_at)
+        for pk, pairs in neighbors.items()
+    ]
+    TitleSimilarity.objects.bulk_create(
+        rows, batch_size=BATCH_SIZE,
+        update_conflicts=True, unique_fields=['title'], update_fields=['neighbors', 'computed_at'],
+    )
+
+
+def build(incremental=False):
+    """Recompute and store the similar titles, returns the number of titles updated."""
+    started = timezone.now()
+
+    since = TitleSimilarity.objects.aggregate(last=Max('computed_at'))['last'] if incremental else None
+    if since is None:
+        only = None
+        neighbors = similar_titles(*load_reviews())
+    else:
+        changed = set(Review.objects.filter(updated__gte=since).values_list('watchlist_id', flat=True).distinct())
+        if not changed:
+            return 0
+
+        reviews = load_reviews()
+        neighbors = similar_titles(*reviews, only=changed)
+
+        # Similarity is symmetric: the titles in the old and new lists of the
+        # changed titles may have to gain, move or lose them
+        only = set(changed)
+        lists = TitleSimilarity.objects.filter(title_id__in=changed).values_list('neighbors', flat=True)
+        for pairs in chain(lists, neighbors.values()):
+            only.update(pk for pk, score in pairs)
+        neighbors.update(similar_titles(*reviews, only=only - changed))
+
+    with transaction.atomic():
+        store(neighbors, started)
+
+        # Titles without reviews any more
+        if only is None:
+            TitleSimilarity.objects.filter(computed_at__lt=started).delete()
+        else:
+            TitleSimilarity.objects.filter(title_id__in=only - neighbors.keys()).delete()
+
+    return len(neighbors)
+
+
+def similar(title_id):
+    """[(title id, score), ...] of a title, None when it has not been computed."""
+    pairs = TitleSimilarity.objects.filter(title_id=title_id).values_list('neighbors', flat=True).first()
+    if pairs is None:
+        return None
+    return [(pk, score) for pk, score in pairs]
+
+
+def recommend(user_id):
+    """[(title id, score), ...] recommended to a user, best first."""
+    rated = dict(Review.objects.filter(review_user_id=user_id).values_list('watchlist_id', 'rating'))
+    if not rated:
+        return []
+
+    mean = (sum(rated.values()) + PRIOR_RATINGS * PRIOR_MEAN) / (len(rated) + PRIOR_RATINGS)
+
+    # Each reviewed title votes for its similar titles by how much the user liked it
+    scores = defaultdict(float)
+    lists = TitleSimilarity.objects.filter(title_id__in=rated).values_list('title_id', 'neighbors')
+    for title_id, pairs in lists:
+        for pk, score in pairs:
+            if pk not in rated:
+                scores[pk] += score * (rated[title_id] - mean)
+
+    ranked = sorted(((pk, score) for pk, score in scores.items() if score > 0), key=lambda pair: (-pair[1], pair[0]))
+    return [(pk, round(score, 4)) for pk, score in ranked]
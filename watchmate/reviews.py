@@ -0,0 +1,139 @@
+"""
+Batch review submission.
+
+``submit`` takes hundreds of reviews across many titles and writes them with a
+fixed number of queries: one lookup for the titles, one set-based duplicate
+check, one ``bulk_create``, and one task (see watchmate.queue) that runs one
+aggregated rating UPDATE for all affected titles and one PlatformStats UPDATE
+per affected platform. Items that fail validation, point at unknown titles or
+were already reviewed are reported per index and the rest are still created.
+"""
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from watchmate import cache, queue, ranking, tasks
+from watchmate.api.serializers import ReviewBulkSerializer
+from watchmate.models import Review, WatchList
+
+
+DUPLICATE = 'You have already reviewed this Movie'
+
+
+def submit(items, user):
+    """Create the reviews in `items` for `user`; returns one result dict per item."""
+    results = {}
+    valid = []
+
+    serializer = ReviewBulkSerializer()
+    for index, item in enumerate(items):
+        try:
+            data = serializer.run_validation(item)
+        except serializers.ValidationError as exc:
+            results[index] = {'index': index, 'errors': exc.detail}
+            continue
+
+        valid.append((index, data))
+
+    titles = WatchList.objects.only('id', 'platform_id').in_bulk({data['watchlist'] for index, data in valid})
+
+    pending = []
+    seen = set()
+    for index, data in valid:
+        if data['watchlist'] not in titles:
+            results[index] = {'index': index, 'errors': {'watchlist': [f'Unknown title {data["watchlist"]}.']}}
+        elif data['watchlist'] in seen:
+            results[index] = {'index': index, 'errors': {'non_field_errors': ['Duplicate review in this batch.']}}
+        else:
+            seen.add(data['watchlist'])
+            pending.append((index, data))
+
+    # A concurrent submission can still insert one of the titles between the
+    # duplicate check and the insert; the unique constraint catches that, and
+    # the reviews are then inserted one at a time so only the conflicting
+    # ones are reported as duplicates
+    try:
+        with transaction.atomic():
+            created = _create(pending, titles, results, user)
+    except IntegrityError:
+        with transaction.atomic():
+            created = _create(pending, titles, results, user, one_by_one=True)
+
+    for review in created:
+        cache.invalidate(f'reviews:{review.watchlist_id}', f'watch:{review.watchlist_id}')
+    if created:
+        cache.invalidate('watch')
+
+    return [results[index] for index in range(len(items))]
+
+
+def _existing(title_ids, user):
+    # Titles of `title_ids` the user has already reviewed
+    return set(Review.objects.filter(watchlist_id__in=title_ids, review_user=user).values_list('watchlist_id', flat=True))
+
+
+def _insert_each(indexes, reviews, results):
+    # Every review in its own savepoint; returns the indexes and reviews inserted
+    inserted = []
+    for index, review in zip(indexes, reviews):
+        try:
+            with transaction.atomic():
+                review.save(force_insert=True)
+        except IntegrityError:
+            results[index] = {'index': index, 'errors': {'non_field_errors': [DUPLICATE]}}
+        else:
+            inserted.append((index, review))
+
+    return [index for index, review in inserted], [review for index, review in inserted]
+
+
+def _create(pending, titles, results, user, one_by_one=False):
+    if not pending:
+        return []
+
+    existing = _existing({data['watchlist'] for index, data in pending}, user)
+
+    indexes = []
+    reviews = []
+    for index, data in pending:
+        if data['watchlist'] in existing:
+            results[index] = {'index': index, 'errors': {'non_field_errors': [DUPLICATE]}}
+            continue
+
+        indexes.append(index)
+        reviews.append(Review(
+            review_user=user,
+            watchlist_id=data['watchlist'],
+            rating=data['rating'],
+            description=data.get('description'),
+            active=data.get('active', True),
+        ))
+
+    if one_by_one:
+        indexes, reviews = _insert_each(indexes, reviews, results)
+    else:
+        Review.objects.bulk_create(reviews)
+
+    deltas = defaultdict(lambda: (0, 0))
+    platform_ratings = defaultdict(list)
+    for review in reviews:
+        total, count = deltas[review.watchlist_id]
+        deltas[review.watchlist_id] = (total + review.rating, count + 1)
+        platform_ratings[titles[review.watchlist_id].platform_id].append(review.rating)
+
+    queue.enqueue(
+        tasks.reviews_added,
+        deltas=[[pk, total, count] for pk, (total, count) in deltas.items()],
+        platform_ratings=[[platform_id, added] for platform_id, added in platform_ratings.items()],
+    )
+    ranking.reviews_added(
+        (review.watchlist_id, titles[review.watchlist_id].platform_id, review.rating, review.created)
+        for review in reviews
+    )
+
+    for index, review in zip(indexes, reviews):
+        results[index] = {'index': index, 'id': review.pk}
+
+    return reviews
@@ -0,0 +1,310 @@
+"""
+Search backends for the watchlist endpoint.
+
+``WATCHLIST_SEARCH_BACKEND`` picks the backend: ``postgres`` uses full-text
+search plus the trigram index on the title, ``memory`` uses an in-process
+inverted index, and ``auto`` (default) picks ``postgres`` whenever the
+database the titles are read from is PostgreSQL and ``memory`` otherwise
+(SQLite test runs).
+
+Both backends keep the old SearchFilter contract and add to it: a title
+matches a search term when its title contains the term (the old
+``icontains``), when its title or description has the term as a word, or
+when the term is its exact platform name. Every term has to match. Postgres
+matches words by their stem, the memory index only as written. Results come
+back ordered by relevance: all of them from Postgres, the best
+``WATCHLIST_SEARCH_MAX_RESULTS`` (default 10000) from the memory index, past
+its first RANKED_RESULTS newest first.
+
+The memory index is per process and only learns of the writes of its own
+process, once they commit: use it for single-process deployments and tests.
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from watchmate.models import StreamPlatform, WatchList
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+# Longest substrings of the titles indexed for the "within the title" match
+NGRAM = 3
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def ngrams(text):
+    """Every substring of `text` up to NGRAM characters long."""
+    return {text[start:start + size] for size in range(1, NGRAM + 1) for start in range(len(text) - size + 1)}
+
+
+class PostgresSearchBackend:
+
+    config = "english"
+
+    def search(self, queryset, terms):
+        # Imported here so SQLite installs don't need a PostgreSQL driver
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+
+        # Same expression as the watchlist_search_idx GIN index
+        vector = SearchVector("title", "description", config=self.config)
+        queryset = queryset.annotate(search=vector)
+
+        for term in terms:
+            queryset = queryset.filter(
+                Q(search=SearchQuery(term, config=self.config))
+                | Q(title__icontains=term)
+                | Q(platform__name__iexact=term)
+            )
+
+        text = " ".join(terms)
+        rank = SearchRank(vector, SearchQuery(text, config=self.config)) + TrigramSimilarity("title", text)
+
+        return queryset.annotate(rank=rank).order_by("-rank", "-created")
+
+
+def best_first(item):
+    # Highest score first, then the newest title
+    pk, score = item
+    return -score, -pk
+
+
+class InvertedIndex:
+    """
+    Token -> {watchlist id: weight} postings for title and description, plus
+    n-gram -> {watchlist id} postings of the lowercased titles for substring
+    matches, kept in sync by the signals in watchmate.signals once it has
+    been built.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.built = False
+            self.postings = defaultdict(dict)
+            self.grams = defaultdict(set)
+            # pk -> (tokens, platform id, lowercased title)
+            self.documents = {}
+            self.platform_titles = defaultdict(set)
+            self.platform_names = {}
+
+    def build(self):
+        with self.lock:
+            self.reset()
+
+            for pk, name in StreamPlatform.objects.values_list("id", "name"):
+                self.platform_names[pk] = name.lower()
+
+            rows = WatchList.objects.values_list("id", "title", "description", "platform_id")
+            for pk, title, description, platform_id in rows.iterator(chunk_size=2000):
+                self._add(pk, title, description, platform_id)
+
+            self.built = True
+
+    def ensure_built(self):
+        if not self.built:
+            self.build()
+
+    def _add(self, pk, title, description, platform_id):
+        weights = defaultdict(int)
+        for token in tokenize(title):
+            weights[token] += TITLE_WEIGHT
+        for token in tokenize(description):
+            weights[token] += DESCRIPTION_WEIGHT
+
+        for token, weight in weights.items():
+            self.postings[token][pk] = weight
+
+        title = (title or "").lower()
+        for gram in ngrams(title):
+            self.grams[gram].add(pk)
+
+        self.documents[pk] = (list(weights), platform_id, title)
+        self.platform_titles[platform_id].add(pk)
+
+    def _remove(self, pk):
+        tokens, platform_id, title = self.documents.pop(pk, ((), None, ""))
+
+        for token in tokens:
+            postings = self.postings[token]
+            postings.pop(pk, None)
+            if not postings:
+                del self.postings[token]
+
+        for gram in ngrams(title):
+            titles = self.grams[gram]
+            titles.discard(pk)
+            if not titles:
+                del self.grams[gram]
+
+        self.platform_titles[platform_id].discard(pk)
+
+    def update(self, pk, title, description, platform_id):
+        with self.lock:
+            if not self.built:
+                return
+            self._remove(pk)
+            self._add(pk, title, description, platform_id)
+
+    def remove(self, pk):
+        with self.lock:
+            if self.built:
+                self._remove(pk)
+
+    def update_platform(self, pk, name):
+        with self.lock:
+            if self.built:
+                self.platform_names[pk] = name.lower()
+
+    def remove_platform(self, pk):
+        with self.lock:
+            if self.built:
+                self.platform_names.pop(pk, None)
+
+    def _idf(self, matches):
+        return math.log(1 + (len(self.documents) or 1) / len(matches))
+
+    def _contained(self, text):
+        # Titles containing `text`: the ids on all of its n-grams' postings,
+        # checked against the title when the text is longer than an n-gram
+        if len(text) <= NGRAM:
+            return self.grams.get(text, set())
+
+        postings = sorted(
+            (self.grams.get(text[start:start + NGRAM], set()) for start in range(len(text) - NGRAM + 1)),
+            key=len,
+        )
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {pk for pk in candidates if text in self.documents[pk][2]}
+
+    def _match_term(self, term):
+        # Scores for one search term: all of its words, or the term within the title
+        scores = None
+        for token in tokenize(term):
+            postings = self.postings.get(token, {})
+            idf = self._idf(postings) if postings else 0
+            token_scores = {pk: weight * idf for pk, weight in postings.items()}
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pk: score + token_scores[pk] for pk, score in scores.items() if pk in token_scores}
+
+        scores = dict(scores or {})
+
+        # title__icontains, scored like a title word
+        text = term.lower()
+        contained = self._contained(text)
+        if contained:
+            idf = self._idf(contained)
+            for pk in contained:
+                scores[pk] = scores.get(pk, 0.0) + TITLE_WEIGHT * idf
+
+        # =platform__name: exact platform name matches every title on it
+        for platform_id, platform_name in self.platform_names.items():
+            if platform_name == text:
+                for pk in self.platform_titles[platform_id]:
+                    scores.setdefault(pk, 0.0)
+
+        return scores
+
+    def search(self, terms, limit=None):
+        """[(watchlist id, score), ...] of the best `limit` matches (all by default), best first."""
+        with self.lock:
+            self.ensure_built()
+
+            scores = None
+            for term in terms:
+                term_scores = self._match_term(term)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pk: score + term_scores[pk] for pk, score in scores.items() if pk in term_scores}
+
+        items = (scores or {}).items()
+        if limit is not None and limit < len(items):
+            return heapq.nsmallest(limit, items, key=best_first)
+        return sorted(items, key=best_first)
+
+
+# Matches ordered by their exact position in SQL, the rest follow newest first:
+# SQLite compiles a CASE in time quadratic in its size
+RANKED_RESULTS = 1000
+
+# Ids per leaf CASE of the position expression
+CASE_LEAF_SIZE = 32
+
+
+def position_sql(column, positions):
+    """
+    SQL for the position of `column` in {id: position}, NULL for other ids: a
+    CASE tree split on the id, so a row costs O(log n) comparisons rather than
+    one per id. Only integers go into it, no parameters.
+    """
+    ids = sorted(positions)
+
+    def node(low, high):
+        if high - low <= CASE_LEAF_SIZE:
+            whens = " ".join(f"WHEN {ids[n]} THEN {positions[ids[n]]}" for n in range(low, high))
+            return f"CASE {column} {whens} END"
+        middle = (low + high) // 2
+        return f"CASE WHEN {column} < {ids[middle]} THEN ({node(low, middle)}) ELSE ({node(middle, high)}) END"
+
+    return node(0, len(ids))
+
+
+class MemorySearchBackend:
+
+    def __init__(self, index):
+        self.index = index
+
+    def search(self, queryset, terms):
+        ranked = self.index.search(terms, limit=getattr(settings, "WATCHLIST_SEARCH_MAX_RESULTS", 10000))
+
+        if not ranked:
+            return queryset.none()
+
+        # The ids come from the index rather than the request, so they are
+        # inlined instead of running into parameter limits; the cap keeps the
+        # statement of a broad term bounded
+        quote = connections[queryset.db].ops.quote_name
+        column = f"{quote(WatchList._meta.db_table)}.{quote('id')}"
+        positions = {int(pk): position for position, (pk, score) in enumerate(ranked[:RANKED_RESULTS])}
+
+        matches = RawSQL(", ".join(str(int(pk)) for pk, score in ranked), ())
+        rank = RawSQL(f"COALESCE({position_sql(column, positions)}, {len(positions)})", ())
+        return queryset.filter(pk__in=matches).annotate(rank=rank).order_by("rank", "-id")
+
+
+index = InvertedIndex()
+
+postgres_backend = PostgresSearchBackend()
+memory_backend = MemorySearchBackend(index)
+
+
+def get_backend(using="default"):
+    name = getattr(settings, "WATCHLIST_SEARCH_BACKEND", "auto")
+
+    if name == "auto":
+        name = "postgres" if connections[using].vendor == "postgresql" else "memory"
+
+    if name == "postgres":
+        return postgres_backend
+    return memory_backend
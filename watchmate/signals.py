@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from watchmate import cache, queue, ranking, search, tasks
+from watchmate.models import PlatformStats, StreamPlatform, WatchList, Review
+
+
+# Keep the in-process search index in step with the catalog, once the write commits
+
+@receiver(post_save, sender=WatchList)
+def index_watchlist(sender, instance, **kwargs):
+    row = (instance.pk, instance.title, instance.description, instance.platform_id)
+    transaction.on_commit(lambda: search.index.update(*row))
+
+
+@receiver(post_delete, sender=WatchList)
+def unindex_watchlist(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search.index.remove(pk))
+
+
+@receiver(post_save, sender=StreamPlatform)
+def index_platform(sender, instance, **kwargs):
+    pk, name = instance.pk, instance.name
+    transaction.on_commit(lambda: search.index.update_platform(pk, name))
+
+
+@receiver(post_delete, sender=StreamPlatform)
+def unindex_platform(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search.index.remove_platform(pk))
+
+
+# Titles moved or deleted leave the platform rankings (reviews are fed by the views)
+
+@receiver(post_save, sender=WatchList)
+def rerank_watchlist(sender, instance, **kwargs):
+    pk, platform_id = instance.pk, instance.platform_id
+    transaction.on_commit(lambda: ranking.index.move(pk, platform_id))
+
+
+@receiver(post_delete, sender=WatchList)
+def unrank_watchlist(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: ranking.index.remove(pk))
+
+
+# Invalidate the cached responses that render the changed rows
+
+@receiver(post_save, sender=StreamPlatform)
+@receiver(post_delete, sender=StreamPlatform)
+def invalidate_platform(sender, instance, **kwargs):
+    cache.invalidate('stream', f'stream:{instance.pk}')
+
+
+@receiver(post_save, sender=WatchList)
+@receiver(post_delete, sender=WatchList)
+def invalidate_watchlist(sender, instance, **kwargs):
+    cache.invalidate('watch', f'watch:{instance.pk}')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review(sender, instance, **kwargs):
+    # The review also changed the title's rating
+    cache.invalidate(f'reviews:{instance.watchlist_id}', 'watch', f'watch:{instance.watchlist_id}')
+
+
+# Keep PlatformStats title counts current, +1/-1 per title
+
+@receiver(post_save, sender=StreamPlatform)
+def create_platform_stats(sender, instance, created, **kwargs):
+    if created:
+        PlatformStats.objects.get_or_create(platform=instance)
+
+
+@receiver(post_init, sender=WatchList)
+def remember_platform(sender, instance, **kwargs):
+    # The platform and active flag as loaded, so a save can tell what it
+    # changed without reading the row again (None when deferred)
+    instance._counted = (instance.__dict__.get('platform_id'), instance.__dict__.get('active'))
+
+
+@receiver(pre_save, sender=WatchList)
+def read_platform(sender, instance, **kwargs):
+    # Only instances loaded without those fields, or built with the pk of a row, read them first
+    if instance.pk and (instance._state.adding or None in instance._counted):
+        instance._counted = (
+            WatchList.objects.filter(pk=instance.pk).values_list('platform_id', 'active').first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=WatchList)
+def count_platform_titles(sender, instance, created, **kwargs):
+    previous_platform, previous_active = (None, None) if created else instance._counted
+    instance._counted = (instance.platform_id, instance.active)
+
+    if previous_platform is None or previous_platform == instance.platform_id:
+        changes = [[instance.platform_id, int(created), int(instance.active) - bool(previous_active)]]
+    else:
+        # Moved to another platform
+        changes = [[previous_platform, -1, -int(previous_active)], [instance.platform_id, 1, int(instance.active)]]
+
+    queue.enqueue(tasks.titles_changed, changes=changes)
+
+
+@receiver(post_delete, sender=WatchList)
+def uncount_platform_title(sender, instance, **kwargs):
+    queue.enqueue(tasks.titles_changed, changes=[[instance.platform_id, -1, -int(instance.active)]])
@@ -0,0 +1,181 @@
+"""
+Denormalized per-platform statistics (PlatformStats).
+
+Title writes adjust the title counts (+1/-1 for a title created, deleted,
+moved or (de)activated) at once, with single F()-expression UPDATEs, so
+concurrent writes add up. Review writes don't touch the platform row: once
+they commit, their rating histogram deltas go to a StatsBuffer (see
+watchmate/buffers.py), which writes the reviews of each platform in one UPDATE
+every ``PLATFORM_STATS_FLUSH_INTERVAL_MS`` or ``PLATFORM_STATS_FLUSH_EVENTS``.
+The top titles are recomputed there, by the rating flushes and, marked by
+title writes, by the next flush, so reading the stats is a primary key
+lookup. ``rebuild`` recomputes everything from scratch (see the
+rebuild_platform_stats command).
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from watchmate.buffers import BufferedWriter
+from watchmate.models import PlatformStats, Review, StreamPlatform, WatchList
+
+
+RATINGS = range(1, 6)
+
+logger = logging.getLogger(__name__)
+
+
+def top_titles(platform_id):
+    limit = getattr(settings, "PLATFORM_STATS_TOP_N", 5)
+
+    titles = (
+        WatchList.objects
+        .filter(platform_id=platform_id, active=True, number_rating__gt=0)
+        .order_by("-avg_rating", "-number_rating", "id")
+        .values("id", "title", "avg_rating", "number_rating")[:limit]
+    )
+    return list(titles)
+
+
+def rating_changes(removed=(), added=()):
+    # Reviews moved out of the `removed` rating buckets and into the `added` ones
+    buckets = Counter(added)
+    buckets.subtract(removed)
+    return {f"rating_{rating}": buckets[rating] for rating in RATINGS}
+
+
+def apply_ratings(deltas):
+    # {platform id: {"rating_1": delta, ...}}, and the top titles, per platform
+    for platform_id, buckets in deltas.items():
+        changes = {"top_titles": top_titles(platform_id)}
+
+        for rating in RATINGS:
+            delta = buckets.get(f"rating_{rating}", 0)
+            if delta:
+                changes[f"rating_{rating}"] = F(f"rating_{rating}") + delta
+
+        count = sum(buckets.values())
+        total = sum(rating * buckets.get(f"rating_{rating}", 0) for rating in RATINGS)
+        if count or total:
+            changes["review_count"] = F("review_count") + count
+            changes["rating_sum"] = F("rating_sum") + total
+
+        PlatformStats.objects.filter(platform_id=platform_id).update(**changes)
+
+
+def _buffer_deltas(deltas):
+    # Runs after the write committed, so a failed flush must not fail the request:
+    # the buffer keeps the deltas and the next flush retries them
+    try:
+        get_buffer().add_deltas(deltas)
+    except Exception:
+        logger.exception("Could not flush the buffered platform stats")
+
+
+def buffer_ratings(deltas):
+    # Only buffer the ratings of reviews that actually committed
+    transaction.on_commit(lambda: _buffer_deltas(deltas))
+
+
+def titles_changed(platform_id, titles=0, active=0):
+    # Titles created (+1) or deleted (-1), of which `active` were active; 0 and 0 for
+    # an edit that only changes what the top titles show
+    if titles or active:
+        PlatformStats.objects.filter(platform_id=platform_id).update(
+            title_count=F("title_count") + titles,
+            active_count=F("active_count") + active,
+        )
+    # No rating changes, the next flush recomputes the top titles
+    buffer_ratings({platform_id: {}})
+
+
+def titles_rated(title_ids):
+    # Ratings written later than their reviews (write-behind) move the top titles too
+    platform_ids = WatchList.objects.filter(pk__in=title_ids).order_by().values_list("platform_id", flat=True).distinct()
+    for platform_id in platform_ids:
+        PlatformStats.objects.filter(platform_id=platform_id).update(top_titles=top_titles(platform_id))
+
+
+class StatsBuffer(BufferedWriter):
+    """
+    Accumulates rating histogram deltas per platform and writes them with apply_ratings.
+    """
+
+    prefix = "platform-stats"
+    fields = tuple(f"rating_{rating}" for rating in RATINGS)
+
+    def write(self, deltas):
+        apply_ratings(deltas)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = StatsBuffer(
+                flush_interval=getattr(settings, "PLATFORM_STATS_FLUSH_INTERVAL_MS", 500) / 1000,
+                flush_events=getattr(settings, "PLATFORM_STATS_FLUSH_EVENTS", 100),
+            )
+        return _buffer
+
+
+def flush():
+    # Write out everything buffered in the cache, by any process sharing it
+    return (_buffer or StatsBuffer()).flush()
+
+
+@atexit.register
+def shutdown():
+    global _buffer
+
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+
+    if buffer is None:
+        return 0
+    return buffer.stop()
+
+
+def rebuild(platform_ids=None):
+    platforms = StreamPlatform.objects.all()
+    if platform_ids is not None:
+        platforms = platforms.filter(pk__in=platform_ids)
+
+    rebuilt = 0
+    for platform_id in platforms.values_list("id", flat=True).iterator():
+        counts = WatchList.objects.filter(platform_id=platform_id).aggregate(
+            total=Count("id"),
+            active=Count("id", filter=Q(active=True)),
+        )
+        histogram = dict(
+            Review.objects.filter(watchlist__platform_id=platform_id)
+            .order_by()
+            .values_list("rating")
+            .annotate(count=Count("id"))
+        )
+
+        PlatformStats.objects.update_or_create(
+            platform_id=platform_id,
+            defaults={
+                "title_count": counts["total"],
+                "active_count": counts["active"],
+                "review_count": sum(histogram.values()),
+                "rating_sum": sum(rating * count for rating, count in histogram.items()),
+                **{f"rating_{rating}": histogram.get(rating, 0) for rating in RATINGS},
+                "top_titles": top_titles(platform_id),
+            },
+        )
+        rebuilt += 1
+
+    return rebuilt
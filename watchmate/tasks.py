@@ -0,0 +1,73 @@
+"""
+Side effects of review and title writes, run through watchmate.queue.
+
+The views and signals enqueue them next to the write. Payloads are JSON, so
+mappings travel as lists of rows. The in-process indexes (search, rankings)
+are still updated by the writing process itself, they are per process.
+
+Run from their Task row the rating deltas are applied at once, so they commit
+together with the row's "done" (see watchmate.queue). Only inline do they go
+through the buffers: the platform stats always, the title ratings with
+``RATING_WRITE_BEHIND``.
+"""
+
+from watchmate import cache, ratings, stats
+from watchmate.queue import current_task, task
+
+
+def _add_ratings(deltas):
+    # {title id: (rating total, count)}
+    if current_task() is not None:
+        ratings.apply_deltas(deltas)
+    else:
+        ratings.add_ratings(deltas)
+
+
+def _platform_ratings(platform_id, removed=(), added=()):
+    deltas = {platform_id: stats.rating_changes(removed, added)}
+    if current_task() is not None:
+        stats.apply_ratings(deltas)
+    else:
+        stats.buffer_ratings(deltas)
+
+
+def _invalidate(*title_ids):
+    # The aggregates can change after the review's own invalidation
+    cache.invalidate('watch', *[f'watch:{pk}' for pk in title_ids])
+
+
+@task
+def review_added(title_id, platform_id, rating):
+    _add_ratings({title_id: (rating, 1)})
+    _platform_ratings(platform_id, added=[rating])
+    _invalidate(title_id)
+
+
+@task
+def reviews_added(deltas, platform_ratings):
+    # [[title id, rating total, count], ...] and [[platform id, [rating, ...]], ...]
+    _add_ratings({pk: (total, count) for pk, total, count in deltas})
+    for platform_id, added in platform_ratings:
+        _platform_ratings(platform_id, added=added)
+    _invalidate(*[pk for pk, total, count in deltas])
+
+
+@task
+def review_changed(title_id, platform_id, old_rating, new_rating):
+    ratings.change_rating(title_id, old_rating, new_rating)
+    _platform_ratings(platform_id, removed=[old_rating], added=[new_rating])
+    _invalidate(title_id)
+
+
+@task
+def review_removed(title_id, platform_id, rating):
+    ratings.remove_rating(title_id, rating)
+    _platform_ratings(platform_id, removed=[rating])
+    _invalidate(title_id)
+
+
+@task
+def titles_changed(changes):
+    # [[platform id, titles, active titles], ...]
+    for platform_id, titles, active in changes:
+        stats.titles_changed(platform_id, titles, active)
@@ -1,13 +1,56 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.apps import apps
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db import IntegrityError, connection
+from django.conf import settings
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
 
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
 
-from watchmate import models
+from IMDB import instrumentation, routers, throttling
+from watchmate import buffers, cache, models, queue, ranking, ratings, recommendations, search, stats, tasks
+from watchmate.api import async_views, views
+from watchmate.api.renderers import FastJSONRenderer
 
 # Create your tests here.
 
+# Platform stats are written right after each commit rather than from a timer thread
+buffer_settings = override_settings(PLATFORM_STATS_FLUSH_INTERVAL_MS=0, PLATFORM_STATS_FLUSH_EVENTS=1)
+
+
+def setUpModule():
+    buffer_settings.enable()
+    stats.shutdown()
+    caches['buffers'].clear()
+
+
+def tearDownModule():
+    stats.shutdown()
+    buffer_settings.disable()
+
+
 class StreamPlatformAPITests(APITestCase):
 
     def setUp(self):
@@ -61,6 +104,29 @@ class StreamPlatformAPITests(APITestCase):
         self.assertEqual(models.StreamPlatform.objects.count(), 1)
 
 
+    def test_streamplatform_list_query_count(self):
+        for n in range(3):
+            platform = models.StreamPlatform.objects.create(name=f"platform{n}", about="About", website="https://example.com")
+            for i in range(3):
+                models.WatchList.objects.create(title=f"Title {i}", description="Description", platform=platform)
+
+        url = reverse('stream-list')
+
+        # One query for the platforms and one for all of their titles
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(response.data[1]['watchlist']), 3)
+
+        # Titles are not fetched when they are not asked for
+        with self.assertNumQueries(1):
+            response = self.client.get(url + '?fields=id,name')
+        self.assertEqual(set(response.data[0]), {'id', 'name'})
+
+        response = self.client.get(url + '?watchlist_size=2')
+        self.assertEqual(len(response.data[1]['watchlist']), 2)
+
+
     def test_streamplatform_create_invalid_data(self):
         self.user.is_staff = True
         self.user.save()
@@ -114,6 +180,9 @@ class WatchListAPITests(APITestCase):
 
         self.watch = models.WatchList.objects.create(title='Aladdin', description='It is about a genie and a boy', platform=self.stream, active=True)
 
+        # Built again from this test's rows
+        search.index.reset()
+
     
     def test_watchlist_create(self):
         data = {
@@ -168,6 +237,112 @@ class WatchListAPITests(APITestCase):
         self.assertEqual(models.WatchList.objects.count(), 1)
 
 
+    def test_watchlist_search(self):
+        other = models.StreamPlatform.objects.create(name="hulu", about="Stream", website="https://hulu.com")
+        models.WatchList.objects.create(title='Genie Returns', description='A sequel', platform=other)
+
+        url = reverse('movie-list')
+
+        # Title matches rank above description matches
+        response = self.client.get(url, {'search': 'genie'})
+        self.assertEqual([movie['title'] for movie in response.data['results']], ['Genie Returns', 'Aladdin'])
+
+        # Every term has to match
+        response = self.client.get(url, {'search': 'genie sequel'})
+        self.assertEqual(response.data['count'], 1)
+
+        # Exact platform name still matches its titles
+        response = self.client.get(url, {'search': 'netflix'})
+        self.assertEqual([movie['title'] for movie in response.data['results']], ['Aladdin'])
+
+        # Within the title, like icontains
+        response = self.client.get(url, {'search': 'ladd'})
+        self.assertEqual([movie['title'] for movie in response.data['results']], ['Aladdin'])
+
+        # Edits are picked up by the index once they commit
+        self.watch.title = 'Jasmine'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.watch.save()
+        response = self.client.get(url, {'search': 'jasmine'})
+        self.assertEqual(response.data['count'], 0)
+
+        for callback in callbacks:
+            callback()
+        response = self.client.get(url, {'search': 'jasmine'})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_watchlist_search_returns_every_match(self):
+        models.WatchList.objects.bulk_create(
+            models.WatchList(title=f'Genie {n}', description='Lamp', platform=self.stream) for n in range(1200)
+        )
+        search.index.reset()
+
+        response = self.client.get(reverse('movie-list'), {'search': 'genie', 'p': 'end'})
+        self.assertEqual(response.data['count'], 1201)
+        self.assertEqual(response.data['results'][-1]['title'], 'Aladdin')
+
+    def test_watchlist_search_caps_broad_terms(self):
+        models.WatchList.objects.bulk_create(
+            models.WatchList(title=f'Genie {n}', description='Lamp', platform=self.stream) for n in range(20)
+        )
+        search.index.reset()
+
+        with override_settings(WATCHLIST_SEARCH_MAX_RESULTS=5):
+            response = self.client.get(reverse('movie-list'), {'search': 'genie'})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['results'][0]['title'], 'Genie 19')
+
+    def test_index_substring_matches(self):
+        models.WatchList.objects.create(title='The Lion King', description='Cubs', platform=self.stream)
+        index = search.InvertedIndex()
+        index.build()
+
+        def contained(text):
+            return sorted(models.WatchList.objects.get(pk=pk).title for pk in index._contained(text))
+
+        self.assertEqual(contained('a'), ['Aladdin'])
+        self.assertEqual(contained('in'), ['Aladdin', 'The Lion King'])
+        self.assertEqual(contained('ddin'), ['Aladdin'])
+        self.assertEqual(contained('lion king'), ['The Lion King'])
+        self.assertEqual(contained('lion queen'), [])
+
+        index.update(self.watch.pk, 'Jasmine', '', self.stream.pk)
+        self.assertEqual(contained('ddin'), [])
+        self.assertEqual(index._contained('smi'), {self.watch.pk})
+
+
+    def test_watchlist_cursor_pagination(self):
+        for n in range(4):
+            models.WatchList.objects.create(title=f'Movie {n}', description='Description', platform=self.stream)
+
+        url = reverse('movie-list') + '?pagination=cursor'
+
+        # No COUNT query, just the page itself
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertNotIn('count', response.data)
+
+        titles = []
+        while True:
+            titles += [movie['title'] for movie in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(titles, ['Movie 3', 'Movie 2', 'Movie 1', 'Movie 0', 'Aladdin'])
+
+        response = self.client.get(url + '&total=true')
+        self.assertEqual(response.data['count'], 5)
+
+        response = self.client.get(reverse('movie-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Keyset pages would drop the relevance order
+        response = self.client.get(url + '&search=movie')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pagination', response.data)
+
+
     def test_watchlist_individual(self):
         url = reverse('movie-detail', args=(self.watch.id,))
         
@@ -230,6 +405,9 @@ class ReviewAPITests(APITestCase):
 
         self.review = models.Review.objects.create(review_user=self.user, description='I like the movie', rating=4, watchlist=self.watch1)
 
+        # Left behind by other tests' write-behind reviews
+        caches['buffers'].clear()
+
     
     def test_review_create(self):
         data = {
@@ -252,6 +430,24 @@ class ReviewAPITests(APITestCase):
         self.assertEqual(response.data[0]['rating'], 4)
 
 
+    def test_review_list_cursor_pagination(self):
+        for n in range(3):
+            user = User.objects.create(username=f'user{n}')
+            models.Review.objects.create(review_user=user, description='Fine', rating=3, watchlist=self.watch1)
+
+        url = reverse('review-list', args=(self.watch1.id,))
+
+        # Unpaginated unless a cursor page is asked for
+        self.assertEqual(len(self.client.get(url).data), 4)
+
+        response = self.client.get(url, {'cursor': '', 'size': 3})
+        self.assertEqual(len(response.data['results']), 3)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([review['review_user'] for review in response.data['results']], ['jude'])
+        self.assertIsNone(response.data['next'])
+
+
     def test_review_individual(self):
         url = reverse('review-detail', args=(self.review.id,))
         response = self.client.get(url)
@@ -279,4 +475,1544 @@ class ReviewAPITests(APITestCase):
 
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['rating'], 4)
\ No newline at end of file
+        self.assertEqual(response.data[0]['rating'], 4)
+
+    def test_review_rating_aggregates(self):
+        other = User.objects.create_user(username='ada', password='password@123')
+
+        url = reverse('review-create', args=(self.watch2.id,))
+        self.client.post(url, {"description": "Great", "rating": 5, "watchlist": self.watch2.id})
+
+        self.client.force_authenticate(user=other)
+        response = self.client.post(url, {"description": "Okay", "rating": 2, "watchlist": self.watch2.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.watch2.refresh_from_db()
+        self.assertEqual(self.watch2.number_rating, 2)
+        self.assertEqual(self.watch2.rating_sum, 7)
+        self.assertEqual(self.watch2.avg_rating, 3.5)
+
+        # Editing only shifts the sum
+        review_id = response.data['id']
+        self.client.patch(reverse('review-detail', args=(review_id,)), {"rating": 4})
+        self.watch2.refresh_from_db()
+        self.assertEqual(self.watch2.number_rating, 2)
+        self.assertEqual(self.watch2.avg_rating, 4.5)
+
+        # Deleting removes the rating entirely
+        self.client.delete(reverse('review-detail', args=(review_id,)))
+        self.watch2.refresh_from_db()
+        self.assertEqual(self.watch2.number_rating, 1)
+        self.assertEqual(self.watch2.avg_rating, 5)
+
+    def test_review_update_delta_uses_locked_rating(self):
+        url = reverse('review-create', args=(self.watch2.id,))
+        review_id = self.client.post(url, {"description": "Great", "rating": 5, "watchlist": self.watch2.id}).data['id']
+
+        get_object = views.ReviewdetailAV.get_object
+
+        def edited_meanwhile(view):
+            # Another edit commits between this request's read and its update
+            review = get_object(view)
+            models.Review.objects.filter(pk=review_id).update(rating=2)
+            ratings.change_rating(self.watch2.id, 5, 2)
+            return review
+
+        with mock.patch.object(views.ReviewdetailAV, 'get_object', edited_meanwhile):
+            self.client.patch(reverse('review-detail', args=(review_id,)), {"rating": 4})
+
+        self.watch2.refresh_from_db()
+        self.assertEqual(self.watch2.rating_sum, 4)
+        self.assertEqual(self.watch2.avg_rating, 4)
+
+
+    def test_rebuild_ratings(self):
+        call_command('rebuild_ratings', stdout=StringIO())
+
+        self.watch1.refresh_from_db()
+        self.assertEqual(self.watch1.number_rating, 1)
+        self.assertEqual(self.watch1.rating_sum, 4)
+        self.assertEqual(self.watch1.avg_rating, 4)
+
+
+
+    @override_settings(RATING_WRITE_BEHIND=True, RATING_FLUSH_EVENTS=10000, RATING_FLUSH_INTERVAL_MS=0)
+    def test_write_behind_ratings_flushed_on_shutdown(self):
+        url = reverse('review-create', args=(self.watch2.id,))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"description": "Great", "rating": 5, "watchlist": self.watch2.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Buffered only, nothing written yet
+        self.watch2.refresh_from_db()
+        self.assertEqual(self.watch2.number_rating, 0)
+
+        # Hammer the same buffer from several threads
+        buffer = ratings.get_buffer()
+        workers = [
+            threading.Thread(target=lambda: [buffer.add(self.watch1.id, 3) for _ in range(250)])
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # The atexit hook must not lose a single increment
+        ratings.shutdown()
+
+        self.watch1.refresh_from_db()
+        self.watch2.refresh_from_db()
+        self.assertEqual(self.watch1.number_rating, 1000)
+        self.assertEqual(self.watch1.rating_sum, 3000)
+        self.assertEqual(self.watch1.avg_rating, 3)
+        self.assertEqual(self.watch2.number_rating, 1)
+        self.assertEqual(self.watch2.avg_rating, 5)
+
+
+    @override_settings(RATING_WRITE_BEHIND=True, RATING_FLUSH_EVENTS=1, RATING_FLUSH_INTERVAL_MS=0)
+    def test_write_behind_failed_flush_keeps_the_review(self):
+        url = reverse('review-create', args=(self.watch2.id,))
+        with mock.patch('watchmate.ratings.apply_deltas', side_effect=RuntimeError('database is down')):
+            with self.assertLogs('watchmate.ratings', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {"description": "Great", "rating": 5, "watchlist": self.watch2.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Kept for the next flush
+        ratings.shutdown()
+        self.watch2.refresh_from_db()
+        self.assertEqual(self.watch2.number_rating, 1)
+
+    @override_settings(RATING_WRITE_BEHIND=True, RATING_FLUSH_EVENTS=10000, RATING_FLUSH_INTERVAL_MS=0)
+    def test_flush_ratings_command(self):
+        self.addCleanup(ratings.shutdown)
+        url = reverse('review-create', args=(self.watch2.id,))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"description": "Great", "rating": 5, "watchlist": self.watch2.id})
+
+        # Another process sharing the cache: a buffer of its own, the same deltas
+        ratings.RatingBuffer().add(self.watch1.id, 2)
+
+        out = StringIO()
+        call_command('flush_ratings', stdout=out)
+        self.assertIn('Flushed pending ratings for 2 titles', out.getvalue())
+
+        self.watch1.refresh_from_db()
+        self.watch2.refresh_from_db()
+        self.assertEqual((self.watch1.number_rating, self.watch1.rating_sum), (1, 2))
+        self.assertEqual((self.watch2.number_rating, self.watch2.rating_sum), (1, 5))
+
+        # Drained: nothing left for the next flush
+        self.assertEqual(ratings.flush(), 0)
+
+    def test_delta_buffer_journals_keys_again_after_a_drain(self):
+        deltas = buffers.DeltaBuffer('test-deltas', ('a', 'b'))
+        deltas.add({1: {'a': 2}, 2: {'b': -1}})
+        deltas.add({1: {'a': 3, 'b': 1}})
+
+        self.assertEqual(deltas.drain(), {1: {'a': 5, 'b': 1}, 2: {'a': 0, 'b': -1}})
+        self.assertEqual(deltas.drain(), {})
+
+        deltas.add({2: {'a': 1}})
+        self.assertEqual(deltas.drain(), {2: {'a': 1, 'b': 0}})
+
+
+class UniqueReviewMigrationTests(TransactionTestCase):
+    # Outside a transaction, where SQLite can rebuild the table without the constraint
+
+    def test_migration_stops_on_duplicate_reviews(self):
+        migration = import_module('watchmate.migrations.0004_review_indexes_and_unique_review')
+        user = User.objects.create_user(username='jude', password='password@123')
+        stream = models.StreamPlatform.objects.create(name="netflix", about="Stream", website="https://netflix.com")
+        watch = models.WatchList.objects.create(title='Aladdin', description='Genie', platform=stream)
+        migration.check_duplicate_reviews(apps, None)
+
+        # As before the constraint: SQLite rebuilds the table from the model's constraints
+        constraint = models.Review._meta.constraints[0]
+        with connection.schema_editor() as editor, mock.patch.object(models.Review._meta, 'constraints', []):
+            editor.remove_constraint(models.Review, constraint)
+        try:
+            models.Review.objects.bulk_create(
+                models.Review(review_user=user, watchlist=watch, rating=rating) for rating in (4, 5)
+            )
+            with self.assertRaisesMessage(RuntimeError, f"({watch.id}, {user.id})"):
+                migration.check_duplicate_reviews(apps, None)
+        finally:
+            models.Review.objects.all().delete()
+            with connection.schema_editor() as editor:
+                editor.add_constraint(models.Review, constraint)
+
+        # And back after it
+        with self.assertRaises(IntegrityError):
+            models.Review.objects.bulk_create(
+                models.Review(review_user=user, watchlist=watch, rating=rating) for rating in (4, 5)
+            )
+
+
+class QueryCountMixin:
+
+    # Request url, add more rows with grow(), then request it again:
+    # both requests must run exactly num queries
+    def assertConstantQueries(self, num, url, grow, method='get', data=None):
+        request = getattr(self.client, method)
+
+        with self.assertNumQueries(num):
+            first = request(url, data)
+        grow()
+        with self.assertNumQueries(num):
+            second = request(url, data)
+
+        return first, second
+
+
+
+class QueryCountTests(QueryCountMixin, APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.watch = models.WatchList.objects.create(title='Aladdin', description='It is about a genie and a boy', platform=self.stream)
+        self.review = models.Review.objects.create(review_user=self.user, description='I like the movie', rating=4, watchlist=self.watch)
+
+
+    def add_rows(self, count=5):
+        for n in range(count):
+            stream = models.StreamPlatform.objects.create(name=f"platform{n}", about="About", website="https://example.com")
+            watch = models.WatchList.objects.create(title=f"Title {n}", description="Description", platform=stream)
+            models.WatchList.objects.create(title=f"Title {n}b", description="Description", platform=self.stream)
+
+            user = User.objects.create(username=f'user{n}')
+            models.Review.objects.create(review_user=user, description='Fine', rating=3, watchlist=self.watch)
+            models.Review.objects.create(review_user=self.user, description='Fine', rating=3, watchlist=watch)
+
+
+    def test_stream_list_queries(self):
+        self.assertConstantQueries(2, reverse('stream-list'), self.add_rows)
+
+
+    def test_stream_detail_queries(self):
+        self.assertConstantQueries(2, reverse('stream-detail', args=(self.stream.id,)), self.add_rows)
+
+
+    def test_movie_list_queries(self):
+        # Page query plus the COUNT of the page number pagination
+        first, second = self.assertConstantQueries(2, reverse('movie-list') + '?size=10', self.add_rows)
+        self.assertEqual(len(second.data['results']), 10)
+
+
+    def test_movie_detail_queries(self):
+        self.assertConstantQueries(1, reverse('movie-detail', args=(self.watch.id,)), self.add_rows)
+
+
+    def test_review_list_queries(self):
+        first, second = self.assertConstantQueries(1, reverse('review-list', args=(self.watch.id,)), self.add_rows)
+        self.assertEqual(len(second.data), 6)
+
+
+    def test_review_detail_queries(self):
+        self.assertConstantQueries(1, reverse('review-detail', args=(self.review.id,)), self.add_rows)
+
+
+    def test_user_review_list_queries(self):
+        first, second = self.assertConstantQueries(1, reverse('user-review-list') + '?username=jude', self.add_rows)
+        self.assertEqual(len(second.data), 6)
+
+
+    def test_review_create_queries(self):
+        other = User.objects.create_user(username='ada', password='password@123')
+        self.client.force_authenticate(user=other)
+
+        url = reverse('review-create', args=(self.watch.id,))
+
+        # Movie lookup, watchlist field validation, savepoint, insert,
+        # rating update and savepoint release; the platform stats are buffered
+        with self.assertNumQueries(6):
+            response = self.client.post(url, {"description": "Great", "rating": 5, "watchlist": self.watch.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+    def test_review_create_duplicate(self):
+        url = reverse('review-create', args=(self.watch.id,))
+
+        # The duplicate is caught by the unique constraint, not a separate lookup
+        with self.assertNumQueries(6):
+            response = self.client.post(url, {"description": "Again", "rating": 5, "watchlist": self.watch.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.watch.refresh_from_db()
+        self.assertEqual(self.watch.number_rating, 0)
+        self.assertEqual(models.Review.objects.filter(watchlist=self.watch, review_user=self.user).count(), 1)
+
+
+
+class ResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.watch = models.WatchList.objects.create(title='Aladdin', description='It is about a genie and a boy', platform=self.stream)
+
+
+    def test_detail_cached_until_review(self):
+        url = reverse('movie-detail', args=(self.watch.id,))
+
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['number_rating'], 0)
+
+        # Different query parameters are cached separately
+        self.assertEqual(self.client.get(url + '?x=1')['X-Cache'], 'MISS')
+
+        self.client.post(reverse('review-create', args=(self.watch.id,)), {"description": "Great", "rating": 5, "watchlist": self.watch.id})
+
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['number_rating'], 1)
+
+
+    def test_platform_list_invalidated_by_title_change(self):
+        url = reverse('stream-list')
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        self.watch.title = 'Jasmine'
+        self.watch.save()
+
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data[0]['watchlist'][0]['title'], 'Jasmine')
+
+
+    @override_settings(RESPONSE_CACHE_BACKEND='none')
+    def test_cache_disabled(self):
+        url = reverse('movie-detail', args=(self.watch.id,))
+        self.client.get(url)
+        self.assertFalse(self.client.get(url).has_header('X-Cache'))
+
+
+    def test_lru_eviction(self):
+        backend = cache.LRUBackend(max_bytes=10)
+        backend.set('a', (b'aaaa', 'application/json'), 60)
+        backend.set('b', (b'bbbb', 'application/json'), 60)
+
+        # Touch a so b is the least recently used
+        backend.get('a')
+        backend.set('c', (b'cccc', 'application/json'), 60)
+
+        self.assertIsNotNone(backend.get('a'))
+        self.assertIsNone(backend.get('b'))
+        self.assertIsNotNone(backend.get('c'))
+        self.assertEqual(backend.size, 8)
+
+
+    def test_lru_versions_are_shared(self):
+        url = reverse('movie-detail', args=(self.watch.id,))
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        # Another process, with its own LRU but the same Django cache, saves the title
+        other = cache.LRUBackend(cache.get_backend().max_bytes, cache.TagVersions('default'))
+        other.bump([f'watch:{self.watch.id}'])
+
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+
+
+class ConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.watch = models.WatchList.objects.create(title='Aladdin', description='It is about a genie and a boy', platform=self.stream)
+        self.review = models.Review.objects.create(review_user=self.user, description='I like the movie', rating=4, watchlist=self.watch)
+
+
+    def test_detail_validators(self):
+        url = reverse('movie-detail', args=(self.watch.id,))
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # Served from the response cache: no queries at all
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.watch.description = 'A genie, a boy and a lamp'
+        self.watch.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+    @override_settings(RESPONSE_CACHE_BACKEND='none')
+    def test_review_detail_not_modified_without_serializing(self):
+        url = reverse('review-detail', args=(self.review.id,))
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+
+    @override_settings(RESPONSE_CACHE_BACKEND='none')
+    def test_list_etag_changes_with_rows(self):
+        url = reverse('review-list', args=(self.watch.id,))
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Rating changes come through the rating engine
+        self.client.patch(reverse('review-detail', args=(self.review.id,)), {"rating": 2})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        self.review.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
+    @override_settings(RESPONSE_CACHE_BACKEND='none')
+    def test_movie_list_etag(self):
+        url = reverse('movie-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Another page of the same list is a different representation
+        self.assertEqual(self.client.get(url + '?size=1', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        # The rating change is visible through WatchList.updated
+        self.client.delete(reverse('review-detail', args=(self.review.id,)))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+
+    @override_settings(RESPONSE_CACHE_BACKEND='none')
+    def test_list_last_modified(self):
+        url = reverse('review-list', args=(self.watch.id,))
+        response = self.client.get(url)
+        self.assertEqual(response['Last-Modified'], http_date(self.review.updated.timestamp()))
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # The latest row of the page
+        other = User.objects.create_user(username='other', password='password@123')
+        self.client.force_authenticate(user=other)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('review-create', args=(self.watch.id,)), {"rating": 5, "description": "Great"})
+        latest = models.Review.objects.latest('updated')
+        self.assertEqual(self.client.get(url)['Last-Modified'], http_date(latest.updated.timestamp()))
+
+        # No rows, no Last-Modified
+        response = self.client.get(reverse('review-list', args=(9999,)))
+        self.assertNotIn('Last-Modified', response)
+
+
+
+class PlatformStatsTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.watch = models.WatchList.objects.create(platform=self.stream, title="Example Movie", description="Example Movie", active=True)
+        models.WatchList.objects.create(platform=self.stream, title="Hidden", description="Hidden", active=False)
+
+    def get_stats(self):
+        response = self.client.get(reverse('stream-stats', args=(self.stream.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_reads_are_a_primary_key_lookup(self):
+        url = reverse('stream-stats', args=(self.stream.id,))
+
+        # The review commits without touching the platform row, the flush after it writes the stats
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('review-create', args=(self.watch.id,)), {"description": "Great", "rating": 4, "watchlist": self.watch.id})
+        self.assertEqual(models.PlatformStats.objects.get(platform=self.stream).review_count, 0)
+
+        # The buffered delta, then the top titles and the UPDATE with both
+        with self.assertNumQueries(2):
+            for callback in callbacks:
+                callback()
+
+        with self.assertNumQueries(1):
+            data = self.client.get(url).data
+        self.assertEqual(data['review_count'], 1)
+        self.assertEqual([title['id'] for title in data['top_titles']], [self.watch.id])
+
+    @override_settings(PLATFORM_STATS_FLUSH_EVENTS=100)
+    def test_review_deltas_are_flushed_in_bulk(self):
+        stats.shutdown()
+        self.addCleanup(stats.shutdown)
+
+        users = [User.objects.create_user(username=f'user{i}', password='password@123') for i in range(3)]
+        for user, rating in zip(users, (5, 4, 4)):
+            self.client.force_authenticate(user)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('review-create', args=(self.watch.id,)), {"description": "Great", "rating": rating, "watchlist": self.watch.id})
+
+        # Buffered, then written in one UPDATE by the command
+        self.assertEqual(models.PlatformStats.objects.get(platform=self.stream).review_count, 0)
+        out = StringIO()
+        call_command('flush_ratings', stdout=out)
+        self.assertIn('and 1 platforms', out.getvalue())
+
+        data = self.get_stats()
+        self.assertEqual((data['review_count'], data['rating_histogram']['4']), (3, 2))
+        self.assertEqual([title['id'] for title in data['top_titles']], [self.watch.id])
+
+    def test_title_writes_only_apply_deltas(self):
+        title = models.WatchList.objects.get(pk=self.watch.pk)
+
+        # The update itself, the platform is neither read again nor written
+        with self.assertNumQueries(1):
+            title.save()
+
+        title.active = False
+        title.save()
+        data = self.get_stats()
+        self.assertEqual((data['title_count'], data['active_count']), (2, 0))
+
+        models.WatchList.objects.get(title="Hidden").delete()
+        self.assertEqual(self.get_stats()['title_count'], 1)
+
+        # Loaded without the platform, read before saving
+        deferred = models.WatchList.objects.only('id', 'title').get(pk=self.watch.pk)
+        deferred.title = 'Renamed'
+        deferred.save()
+        data = self.get_stats()
+        self.assertEqual((data['title_count'], data['active_count']), (1, 0))
+
+    def test_title_counts(self):
+        data = self.get_stats()
+        self.assertEqual(data['title_count'], 2)
+        self.assertEqual(data['active_count'], 1)
+
+        other = models.StreamPlatform.objects.create(name="hulu", about="Hulu", website="https://hulu.com")
+        self.watch.platform = other
+        self.watch.save()
+
+        data = self.get_stats()
+        self.assertEqual(data['title_count'], 1)
+        self.assertEqual(data['active_count'], 0)
+        self.assertEqual(models.PlatformStats.objects.get(platform=other).active_count, 1)
+
+    def test_review_stats(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('review-create', args=(self.watch.id,)), {"description": "Great", "rating": 4, "watchlist": self.watch.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        review_id = models.Review.objects.get(watchlist=self.watch).id
+
+        data = self.get_stats()
+        self.assertEqual(data['review_count'], 1)
+        self.assertEqual(data['avg_rating'], 4)
+        self.assertEqual(data['rating_histogram'], {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0})
+        self.assertEqual([title['id'] for title in data['top_titles']], [self.watch.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('review-detail', args=(review_id,)), {"description": "Fine", "rating": 2, "watchlist": self.watch.id})
+        data = self.get_stats()
+        self.assertEqual(data['avg_rating'], 2)
+        self.assertEqual(data['rating_histogram']["2"], 1)
+        self.assertEqual(data['rating_histogram']["4"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('review-detail', args=(review_id,)))
+        data = self.get_stats()
+        self.assertEqual(data['review_count'], 0)
+        self.assertEqual(data['avg_rating'], 0)
+        self.assertEqual(data['top_titles'], [])
+
+    def test_rebuild_platform_stats(self):
+        models.Review.objects.create(review_user=self.user, watchlist=self.watch, rating=5, description="Great")
+        models.PlatformStats.objects.filter(platform=self.stream).update(title_count=0, review_count=0)
+
+        call_command('rebuild_platform_stats', stdout=StringIO())
+
+        stats = models.PlatformStats.objects.get(platform=self.stream)
+        self.assertEqual(stats.title_count, 2)
+        self.assertEqual(stats.review_count, 1)
+        self.assertEqual(stats.rating_5, 1)
+
+
+
+class CatalogImportTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.watch = models.WatchList.objects.create(platform=self.stream, title="Old title", description="Old", active=True)
+
+    def jsonl(self, *rows):
+        return "\n".join(json.dumps(row) for row in rows) + "\n"
+
+    def test_import_jsonl(self):
+        body = self.jsonl(
+            {"kind": "platform", "name": "hulu", "about": "Hulu", "website": "https://hulu.com"},
+            {"title": "First", "description": "First title", "platform": "hulu"},
+            {"title": "Second", "description": "Second title", "platform": self.stream.id, "active": False},
+            {"id": self.watch.id, "title": "New title", "description": "New", "platform": "hulu"},
+            {"title": "Orphan", "description": "No platform", "platform": "missing"},
+            {"title": "", "description": "Blank title", "platform": "hulu"},
+        )
+
+        url = reverse('catalog-import')
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(response.data['rows'], 6)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['platforms_created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [5, 6])
+
+        hulu = models.StreamPlatform.objects.get(name="hulu")
+        self.watch.refresh_from_db()
+        self.assertEqual((self.watch.title, self.watch.platform_id), ("New title", hulu.id))
+        self.assertFalse(models.WatchList.objects.get(title="Second").active)
+
+        # Statistics of both the new and the old platform of the moved title
+        self.assertEqual(models.PlatformStats.objects.get(platform=hulu).title_count, 2)
+        self.assertEqual(models.PlatformStats.objects.get(platform=self.stream).title_count, 1)
+
+    def test_import_csv_upload_in_batches(self):
+        rows = "title,description,platform,active\n" + "".join(f"Title {i},Description {i},netflix,true\n" for i in range(5))
+        upload = SimpleUploadedFile("titles.csv", rows.encode(), content_type="text/csv")
+
+        with self.settings(CATALOG_IMPORT_BATCH_SIZE=2):
+            response = self.client.post(reverse('catalog-import'), {"file": upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(models.WatchList.objects.filter(platform=self.stream).count(), 6)
+
+    def test_import_admin_only(self):
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.generic('POST', reverse('catalog-import'), self.jsonl({"title": "x"}), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_import_catalog_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write(self.jsonl(*({"title": f"Title {i}", "description": "d", "platform": "netflix"} for i in range(3))))
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('import_catalog', f.name, '--batch-size', '2', stdout=out, stderr=StringIO())
+
+        self.assertIn("3 titles created", out.getvalue())
+        self.assertEqual(models.WatchList.objects.count(), 4)
+
+
+
+class ReviewBulkCreateTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.hulu = models.StreamPlatform.objects.create(name="hulu", about="Hulu", website="https://hulu.com")
+        self.watches = [
+            models.WatchList.objects.create(platform=platform, title=f"Movie {i}", description="Example Movie", active=True)
+            for i, platform in enumerate([self.stream, self.stream, self.hulu])
+        ]
+        models.Review.objects.create(review_user=self.user, watchlist=self.watches[2], rating=1, description="Bad")
+        ratings.rebuild()
+        call_command('rebuild_platform_stats', stdout=StringIO())
+
+        self.url = reverse('review-bulk-create')
+
+    def test_bulk_create(self):
+        items = [
+            {"watchlist": self.watches[0].id, "rating": 5, "description": "Great"},
+            {"watchlist": self.watches[1].id, "rating": 3, "description": "Fine"},
+            {"watchlist": self.watches[0].id, "rating": 4, "description": "Twice"},
+            {"watchlist": self.watches[2].id, "rating": 4, "description": "Reviewed before"},
+            {"watchlist": 9999, "rating": 4, "description": "Unknown"},
+            {"watchlist": self.watches[1].id, "rating": 9, "description": "Out of range"},
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 2)
+
+        results = response.data['results']
+        self.assertEqual([('id' in result) for result in results], [True, True, False, False, False, False])
+        self.assertIn('rating', results[5]['errors'])
+
+        self.watches[0].refresh_from_db()
+        self.assertEqual((self.watches[0].number_rating, self.watches[0].avg_rating), (1, 5))
+
+        platform_stats = models.PlatformStats.objects.get(platform=self.stream)
+        self.assertEqual((platform_stats.review_count, platform_stats.rating_5, platform_stats.rating_3), (2, 1, 1))
+
+    def test_bulk_create_queries(self):
+        items = [{"watchlist": watch.id, "rating": 4, "description": "Good"} for watch in self.watches[:2]]
+
+        # Titles, savepoint, duplicate check, insert, ratings, savepoint
+        # release; the platform stats are buffered
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_create_concurrent_duplicate(self):
+        items = [
+            {"watchlist": self.watches[2].id, "rating": 5, "description": "Reviewed meanwhile"},
+            {"watchlist": self.watches[0].id, "rating": 4, "description": "Good"},
+        ]
+
+        # The review of watches[2] was inserted after the duplicate check
+        with mock.patch('watchmate.reviews._existing', return_value=set()):
+            response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+
+        results = response.data['results']
+        self.assertEqual(results[0]['errors'], {'non_field_errors': ['You have already reviewed this Movie']})
+        self.assertIn('id', results[1])
+
+        self.watches[0].refresh_from_db()
+        self.assertEqual(self.watches[0].number_rating, 1)
+
+    def test_bulk_create_limit(self):
+        with self.settings(REVIEW_BULK_MAX_ITEMS=1):
+            response = self.client.post(self.url, [{}, {}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.watches = [
+            models.WatchList.objects.create(platform=self.stream, title=f"Movie {i}", description="Example, Movie", active=True)
+            for i in range(3)
+        ]
+        for watch in self.watches:
+            models.Review.objects.create(review_user=self.user, watchlist=watch, rating=4, description="Good")
+
+    def export(self, name, **params):
+        response = self.client.get(reverse('catalog-export', args=(name,)), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export_resumes_from_watermark(self):
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            rows = [json.loads(line) for line in self.export('reviews').splitlines()]
+        self.assertEqual([row['watchlist_id'] for row in rows], [watch.id for watch in self.watches])
+        self.assertEqual(rows[0]['review_user__username'], 'jude')
+
+        last = rows[1]
+        rest = [json.loads(line) for line in self.export('reviews', since=last['created'], since_id=last['id']).splitlines()]
+        self.assertEqual([row['id'] for row in rest], [rows[2]['id']])
+
+    def test_csv_export(self):
+        lines = self.export('titles', fmt='csv').splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'title', 'description'])
+        self.assertEqual(len(lines), 4)
+        self.assertIn('"Example, Movie"', lines[1])
+
+    def test_export_admin_only(self):
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.get(reverse('catalog-export', args=('reviews',)))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_catalog', 'titles', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+        with self.assertRaises(CommandError):
+            call_command('export_catalog', 'titles', '--since', 'yesterday', stdout=StringIO())
+
+
+
+@override_settings(RESPONSE_CACHE_BACKEND='none')
+class AsyncReadViewTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123', is_staff=True)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        self.watches = [
+            models.WatchList.objects.create(platform=self.stream, title=f"Movie {i}", description="Example Movie", active=True)
+            for i in range(3)
+        ]
+        self.review = models.Review.objects.create(review_user=self.user, watchlist=self.watches[0], rating=4, description="Good")
+        search.index.reset()
+
+        self.factory = APIRequestFactory()
+
+    def call(self, view, url, method='get', user=None, **kwargs):
+        request = getattr(self.factory, method)(url, **kwargs)
+        if user:
+            force_authenticate(request, user=user)
+        match = resolve(url.split('?')[0])
+        return async_to_sync(view.as_view())(request, **match.kwargs)
+
+    def test_reads_match_sync_views(self):
+        cases = [
+            (async_views.WatchlistAsync, reverse('movie-list')),
+            (async_views.WatchlistAsync, reverse('movie-list') + '?p=2'),
+            (async_views.WatchlistdetailAsync, reverse('movie-detail', args=(self.watches[0].id,))),
+            (async_views.ReviewlistAsync, reverse('review-list', args=(self.watches[0].id,))),
+            (async_views.ReviewdetailAsync, reverse('review-detail', args=(self.review.id,))),
+            (async_views.StreamplatformListAsync, reverse('stream-list')),
+            (async_views.StreamplatformDetailAsync, reverse('stream-detail', args=(self.stream.id,))),
+        ]
+        for view, url in cases:
+            with self.subTest(url=url):
+                expected = self.client.get(url)
+                response = self.call(view, url)
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(json.loads(response.content), expected.json())
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+                self.assertEqual(response.get('Last-Modified'), expected.get('Last-Modified'))
+
+    def test_not_modified_and_not_found(self):
+        url = reverse('movie-detail', args=(self.watches[0].id,))
+        etag = self.call(async_views.WatchlistdetailAsync, url)['ETag']
+
+        response = self.call(async_views.WatchlistdetailAsync, url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.call(async_views.WatchlistdetailAsync, reverse('movie-detail', args=(9999,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_writes_and_unsupported_reads_use_drf_view(self):
+        url = reverse('movie-list')
+        data = {"title": "New", "description": "New", "platform": self.stream.id, "active": True}
+
+        response = self.call(async_views.WatchlistAsync, url, method='post', data=data)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.call(async_views.WatchlistAsync, url, method='post', user=self.user, data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.call(async_views.WatchlistAsync, url + '?search=new')
+        response.render()
+        self.assertEqual([title['title'] for title in json.loads(response.content)['results']], ['New'])
+
+    def test_reads_are_authenticated(self):
+        url = reverse('movie-list')
+
+        response = self.call(async_views.WatchlistAsync, url, HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(json.loads(response.content)['code'], 'token_not_valid')
+        self.assertIn('WWW-Authenticate', response)
+
+    def test_read_is_required(self):
+        class Incomplete(async_views.AsyncReadView):
+            sync_view = views.WatchlistAV
+
+        with self.assertRaises(ImproperlyConfigured):
+            Incomplete.as_view()
+
+
+
+class ReplicaRouterTests(APITestCase):
+
+    def test_reads_of_get_requests_use_replicas(self):
+        router = routers.ReplicaRouter()
+        seen = []
+
+        def view(request):
+            seen.append(router.db_for_read(models.WatchList))
+            return HttpResponse()
+
+        async def async_view(request):
+            return view(request)
+
+        factory = APIRequestFactory()
+
+        with override_settings(DATABASE_REPLICAS=['replica_1']):
+            routers.read_from_replicas(view)(factory.get('/api/watch/'))
+            routers.read_from_replicas(view)(factory.post('/api/watch/'))
+            async_to_sync(routers.read_from_replicas(async_view))(factory.get('/api/watch/'))
+
+            # Views that aren't wrapped, e.g. the admin or accounts
+            view(factory.get('/admin/'))
+
+            # Outside requests, e.g. management commands
+            self.assertIsNone(router.db_for_read(models.WatchList))
+            self.assertFalse(router.allow_migrate('replica_1', 'watchmate'))
+
+        self.assertEqual(seen, ['replica_1', None, 'replica_1', None])
+        self.assertEqual(router.db_for_write(models.WatchList), 'default')
+
+    def test_no_replicas_configured(self):
+        with routers.replica_reads():
+            self.assertIsNone(routers.ReplicaRouter().db_for_read(models.Review))
+
+
+
+class InstrumentationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies and series in one place", website="https://netflix.com")
+        models.WatchList.objects.create(platform=self.stream, title="Example Movie", description="Example Movie", active=True)
+
+        instrumentation.registry.clear()
+
+    @override_settings(SERVER_TIMING=True, RESPONSE_CACHE_BACKEND='none')
+    def test_request_metrics(self):
+        response = self.client.get(reverse('movie-list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        text = response.content.decode()
+        self.assertIn('# TYPE http_request_db_queries histogram', text)
+        self.assertIn('http_request_db_queries_bucket{method="GET",view="movie-list",le="2"} 1', text)
+        self.assertIn('http_request_db_queries_sum{method="GET",view="movie-list"} 2', text)
+        self.assertIn('http_request_serializer_seconds_count{method="GET",view="movie-list"} 1', text)
+
+    def test_metrics_admin_only(self):
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertNotIn('Server-Timing', response)
+
+
+
+class BenchmarkTests(APITestCase):
+
+    def test_bench_api_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            current = os.path.join(directory, 'current.json')
+
+            options = ['--titles', '20', '--users', '5', '--reviews', '30', '--iterations', '3', '--warmup', '1', '--scenario', 'browse', '--scenario', 'reviews']
+            call_command('bench_api', *options, '--output', baseline, stdout=StringIO())
+            call_command('bench_api', *options, '--output', current, stdout=StringIO())
+
+            with open(baseline) as f:
+                result = json.load(f)
+            self.assertIn('GET movie-list', result['endpoints'])
+            self.assertEqual(models.WatchList.objects.count(), 0)
+
+            out = StringIO()
+            call_command('bench_compare', baseline, current, '--tolerance', '1000', stdout=out, stderr=StringIO())
+            self.assertIn('No regressions', out.getvalue())
+
+            # More queries per request always fail the comparison
+            result['endpoints']['GET movie-list']['queries_max'] -= 1
+            with open(baseline, 'w') as f:
+                json.dump(result, f)
+            with self.assertRaises(CommandError):
+                call_command('bench_compare', baseline, current, '--tolerance', '1000', stdout=StringIO(), stderr=StringIO())
+
+
+
+@override_settings(RESPONSE_CACHE_BACKEND='none')
+class ProjectionTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+
+        self.streams = [
+            models.StreamPlatform.objects.create(name=name, about="Get all the best movies", website=f"https://{name}.com")
+            for name in ("netflix", "prime")
+        ]
+        self.watches = [
+            models.WatchList.objects.create(platform=self.streams[i % 2], title=f"Movie {i}", description="Example Movie \u2028 é", active=True)
+            for i in range(4)
+        ]
+        models.Review.objects.create(review_user=self.user, watchlist=self.watches[0], rating=4, description="Good")
+        ratings.add_rating(self.watches[0].pk, 4)
+        search.index.reset()
+
+    def test_lists_match_serializers(self):
+        cases = [
+            (views.WatchlistAV, reverse('movie-list')),
+            (views.WatchlistAV, reverse('movie-list') + '?p=2'),
+            (views.WatchlistAV, reverse('movie-list') + '?pagination=cursor&size=3'),
+            (views.WatchlistAV, reverse('movie-list') + '?search=movie'),
+            (views.ReviewlistAV, reverse('review-list', args=(self.watches[0].id,))),
+            (views.UserReview, reverse('user-review-list') + '?username=jude'),
+            (views.StreamplatformList, reverse('stream-list')),
+            (views.StreamplatformList, reverse('stream-list') + '?fields=id,name'),
+            (views.StreamplatformList, reverse('stream-list') + '?watchlist_size=1'),
+        ]
+        for view, url in cases:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+                with mock.patch.object(view, 'projection_class', None), mock.patch.object(view, 'renderer_classes', [JSONRenderer]):
+                    expected = self.client.get(url)
+
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'created': timezone.now(),
+            'price': Decimal('1.50'),
+            'message': gettext_lazy('Not found.'),
+            'items': [1, 2.5, None, True, 'line\u2029break'],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+    def test_bench_serializers(self):
+        out = StringIO()
+        call_command('bench_serializers', '--rows', '50', '--repeat', '1', stdout=out)
+
+        lines = out.getvalue().splitlines()[1:]
+        self.assertEqual([line.split()[0] for line in lines], ['titles', 'reviews', 'platforms'])
+        self.assertTrue(all(line.endswith('yes') for line in lines))
+        self.assertEqual(models.WatchList.objects.count(), 4)
+
+
+
+@override_settings(RESPONSE_CACHE_BACKEND='none')
+class SparseFieldsTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="Get all the best movies", website="https://netflix.com")
+        self.watches = [
+            models.WatchList.objects.create(platform=self.stream, title=f"Movie {i}", description="Example Movie", active=True)
+            for i in range(3)
+        ]
+        self.review = models.Review.objects.create(review_user=self.user, watchlist=self.watches[0], rating=4, description="Good")
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+
+    def test_lists_trim_output_and_columns(self):
+        data, sql = self.get(reverse('movie-list') + '?fields=id,title')
+        self.assertEqual([set(row) for row in data['results']], [{'id', 'title'}] * 2)
+        self.assertNotIn('"description"', sql)
+
+        data, sql = self.get(reverse('movie-list') + '?exclude=description,rating_sum&pagination=cursor&size=2')
+        self.assertNotIn('description', data['results'][0])
+        self.assertIn('title', data['results'][0])
+        self.assertNotIn('"description"', sql)
+
+        # The cursor still works without `created` in the output
+        data, sql = self.get(data['next'])
+        self.assertEqual([row['id'] for row in data['results']], [self.watches[0].id])
+
+        # The author is not joined when it is not rendered
+        data, sql = self.get(reverse('review-list', args=(self.watches[0].id,)) + '?exclude=review_user')
+        self.assertEqual(set(data[0]), {'id', 'description', 'rating', 'active', 'created', 'updated', 'watchlist'})
+        self.assertNotIn('auth_user', sql)
+
+        data, sql = self.get(reverse('stream-list') + '?exclude=watchlist,about')
+        self.assertEqual(set(data[0]), {'id', 'name', 'website'})
+        self.assertNotIn('watchmate_watchlist', sql)
+
+    def test_details_trim_output_and_columns(self):
+        url = reverse('movie-detail', args=(self.watches[0].id,))
+        full = self.client.get(url)
+
+        data, sql = self.get(url + '?fields=title,avg_rating')
+        self.assertEqual(data, {'title': 'Movie 0', 'avg_rating': 0.0})
+        self.assertNotIn('"description"', sql)
+        self.assertNotEqual(self.client.get(url + '?fields=title').get('ETag'), full.get('ETag'))
+
+        data, sql = self.get(reverse('review-detail', args=(self.review.id,)) + '?fields=rating')
+        self.assertEqual(data, {'rating': 4})
+        self.assertNotIn('auth_user', sql)
+
+        data, sql = self.get(reverse('stream-detail', args=(self.stream.id,)) + '?fields=name,unknown')
+        self.assertEqual(data, {'name': 'netflix'})
+
+        data, sql = self.get(reverse('stream-stats', args=(self.stream.id,)) + '?fields=title_count')
+        self.assertEqual(data, {'title_count': 3})
+
+    def test_writes_ignore_selection(self):
+        self.client.force_authenticate(self.user)
+
+        url = reverse('review-detail', args=(self.review.id,)) + '?fields=rating'
+        response = self.client.put(url, {'rating': 5, 'description': 'Better', 'watchlist': self.watches[0].id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['description'], 'Better')
+
+
+
+@override_settings(RANKING_PRIOR_WEIGHT=2, RANKING_HALF_LIFE_HOURS=24, RANKING_REBUILD_SECONDS=3600)
+class RankingTests(APITestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='password@123') for i in range(3)]
+
+        self.streams = [
+            models.StreamPlatform.objects.create(name=name, about="About", website=f"https://{name}.com")
+            for name in ("netflix", "prime")
+        ]
+        self.watches = [
+            models.WatchList.objects.create(platform=self.streams[i % 2], title=f"Movie {i}", description="Example Movie")
+            for i in range(4)
+        ]
+
+        ranking.index.reset()
+
+    def review(self, user, watch, rating):
+        self.client.force_authenticate(user)
+        # The index takes the review once it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('review-create', args=(watch.id,)), {'rating': rating, 'description': 'Review', 'watchlist': watch.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def ranked(self, name, query=''):
+        response = self.client.get(reverse(name) + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_top_is_bayesian_weighted(self):
+        # One 5 is worth less than three high ratings with the prior pulling both to the mean
+        self.review(self.users[0], self.watches[0], 5)
+        for user, rating in zip(self.users, (5, 5, 4)):
+            self.review(user, self.watches[1], rating)
+        self.review(self.users[0], self.watches[2], 1)
+
+        self.assertEqual(self.ranked('movie-top', '?size=10'), [self.watches[1].id, self.watches[0].id, self.watches[2].id])
+
+        # Built now, further reviews update it in place
+        review = self.review(self.users[1], self.watches[2], 5)
+        self.review(self.users[2], self.watches[2], 5)
+        self.assertEqual(self.ranked('movie-top', '?size=10')[0], self.watches[1].id)
+
+        self.client.force_authenticate(self.users[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('review-detail', args=(review,)))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        top = self.ranked('movie-top', '?size=10')
+
+        # Same as rebuilt from the database
+        ranking.index.reset()
+        self.assertEqual(self.ranked('movie-top', '?size=10'), top)
+
+    def test_trending_decays_and_filters_by_platform(self):
+        for watch in self.watches:
+            self.review(self.users[0], watch, 4)
+
+        # Two days ago, i.e. two half-lives
+        models.Review.objects.filter(watchlist=self.watches[0]).update(created=timezone.now() - timedelta(days=2))
+        ranking.index.reset()
+
+        trending = self.ranked('movie-trending', '?size=10')
+        self.assertEqual(trending[-1], self.watches[0].id)
+
+        response = self.client.get(reverse('movie-trending') + '?size=10')
+        scores = {row['id']: row['score'] for row in response.data['results']}
+        self.assertAlmostEqual(scores[self.watches[0].id], 1.0, places=2)
+        self.assertAlmostEqual(scores[self.watches[1].id], 4.0, places=2)
+
+        platform = self.streams[0].id
+        self.assertEqual(
+            self.ranked('movie-trending', f'?platform={platform}&size=10'),
+            [self.watches[2].id, self.watches[0].id],
+        )
+
+        # A title moved to the other platform moves in the rankings too
+        self.watches[2].platform = self.streams[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.watches[2].save()
+        self.assertEqual(self.ranked('movie-trending', f'?platform={platform}&size=10'), [self.watches[0].id])
+
+    def test_rebuild_runs_beside_reads_and_events(self):
+        for watch in self.watches[:2]:
+            self.review(self.users[0], watch, 4)
+        self.assertEqual(len(self.ranked('movie-top', '?size=10')), 2)
+
+        # A review committed while the index is rebuilt is replayed on the new one
+        load = ranking.RankIndex.load
+
+        def load_during_review(index):
+            load(index)
+            ranking.index.apply(self.watches[2].id, self.watches[2].platform_id, count=1, total=5, created=timezone.now())
+
+        with mock.patch.object(ranking.RankIndex, 'load', load_during_review):
+            ranking.index.build()
+        self.assertEqual(len(self.ranked('movie-top', '?size=10')), 3)
+
+        # A stale index is still served while a thread rebuilds it
+        with override_settings(RANKING_REBUILD_SECONDS=0), mock.patch.object(threading, 'Thread') as thread:
+            self.assertEqual(len(self.ranked('movie-top', '?size=10')), 3)
+        thread.assert_called_once_with(target=ranking.index._rebuild_in_thread, daemon=True)
+        self.assertTrue(ranking.index.rebuilding)
+
+        with mock.patch.object(ranking.connection, 'close'):
+            ranking.index._rebuild_in_thread()
+        self.assertFalse(ranking.index.rebuilding)
+
+    def test_rolled_back_reviews_are_not_ranked(self):
+        self.review(self.users[0], self.watches[0], 4)
+        self.ranked('movie-top')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('review-create', args=(self.watches[0].id,)), {'rating': 5, 'description': 'Again', 'watchlist': self.watches[0].id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ranking.index.titles[self.watches[0].id].count, 1)
+
+    def test_page_costs_one_query(self):
+        for watch in self.watches:
+            self.review(self.users[0], watch, 3)
+        self.client.force_authenticate(None)
+        self.ranked('movie-top')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('movie-top') + '?p=2&fields=title,score')
+
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual([set(row) for row in response.data['results']], [{'title', 'score'}] * 2)
+
+        response = self.client.get(reverse('movie-top') + '?platform=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(RECOMMENDATIONS_TOP_K=5, RECOMMENDATIONS_SHRINKAGE=1)
+class RecommendationTests(APITestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}', password='password@123') for i in range(6)]
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="About", website="https://netflix.com")
+        self.watches = [
+            models.WatchList.objects.create(platform=self.stream, title=f"Movie {i}", description="Example Movie")
+            for i in range(5)
+        ]
+
+        # Two tastes: users 0 and 1 like movies 0 and 1, users 2 and 3 like movies 2 and 3
+        a, b, c, d, _ = self.watches
+        for user in self.users[:2]:
+            self.rate(user, {a: 5, b: 5, c: 1})
+        for user in self.users[2:4]:
+            self.rate(user, {a: 1, c: 5, d: 5})
+
+    def rate(self, user, ratings):
+        for watch, rating in ratings.items():
+            models.Review.objects.create(review_user=user, watchlist=watch, rating=rating, description="Review")
+
+    def similar(self, watch):
+        response = self.client.get(reverse('movie-similar', args=(watch.id,)) + '?size=10')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_similar_titles(self):
+        self.assertEqual(recommendations.build(), 4)
+        a, b, c, d, unreviewed = self.watches
+
+        self.assertEqual(self.similar(a), [b.id])
+        self.assertEqual(self.similar(c), [d.id])
+        self.assertEqual(self.similar(unreviewed), [])
+
+        response = self.client.get(reverse('movie-similar', args=(a.id,)) + '?fields=title,score')
+        self.assertEqual(list(response.data['results'][0]), ['title', 'score'])
+        self.assertGreater(response.data['results'][0]['score'], 0)
+
+        response = self.client.get(reverse('movie-similar', args=(9999,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_recommendations(self):
+        recommendations.build()
+        a, b, c, d, _ = self.watches
+
+        response = self.client.get(reverse('user-recommendations'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Liked movie 0 and didn't like movie 2
+        self.rate(self.users[4], {a: 5, c: 2})
+        self.client.force_authenticate(self.users[4])
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('user-recommendations'))
+        self.assertEqual([row['id'] for row in response.data['results']], [b.id])
+
+        # Nothing reviewed, nothing to go by
+        self.client.force_authenticate(self.users[5])
+        response = self.client.get(reverse('user-recommendations'))
+        self.assertEqual(response.data['results'], [])
+
+    def test_incremental_build(self):
+        recommendations.build()
+        a, b, c, d, unreviewed = self.watches
+
+        self.assertEqual(recommendations.build(incremental=True), 0)
+
+        # Fans of movie 0 like the unreviewed movie as well
+        for user in self.users[:2]:
+            self.rate(user, {unreviewed: 5})
+
+        self.assertEqual(recommendations.build(incremental=True), 3)
+        self.assertEqual(set(self.similar(unreviewed)), {a.id, b.id})
+        self.assertEqual(set(self.similar(a)), {b.id, unreviewed.id})
+        # Not touched by the incremental build
+        self.assertEqual(self.similar(c), [d.id])
+
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('Updated similar titles for 5 titles', out.getvalue())
+
+
+@override_settings(TASK_QUEUE='worker', TASK_RETRY_DELAY_SECONDS=0, TASK_MAX_ATTEMPTS=2, RESPONSE_CACHE_BACKEND='none')
+class TaskQueueTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+        self.client.force_authenticate(user=self.user)
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="About", website="https://netflix.com")
+        self.watch = models.WatchList.objects.create(platform=self.stream, title="Example Movie", description="Example Movie")
+        queue.run_due()
+
+    def run_worker(self):
+        out = StringIO()
+        call_command('run_worker', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_review_side_effects_run_in_the_worker(self):
+        # The title, the review insert and the task insert (and savepoints), no UPDATEs
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('review-create', args=(self.watch.id,)), {'rating': 4, 'description': 'Great', 'watchlist': self.watch.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # The review and its task are committed, the aggregates not yet
+        self.watch.refresh_from_db()
+        self.assertEqual(self.watch.number_rating, 0)
+        task = models.Task.objects.get(name=tasks.review_added.task_name)
+        self.assertEqual(task.payload, {'title_id': self.watch.id, 'platform_id': self.stream.id, 'rating': 4})
+
+        self.assertIn('Ran 1 tasks', self.run_worker())
+        self.watch.refresh_from_db()
+        self.assertEqual((self.watch.number_rating, self.watch.avg_rating), (1, 4))
+        self.assertEqual(models.PlatformStats.objects.get(platform=self.stream).rating_4, 1)
+
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (models.Task.DONE, 1))
+
+        # Done tasks never run again
+        self.assertIsNone(queue.run(task.id))
+        self.assertIn('Ran 0 tasks', self.run_worker())
+
+    def test_idempotency_key(self):
+        first = queue.enqueue(tasks.review_added, key='review-added:1', title_id=self.watch.id, platform_id=self.stream.id, rating=5)
+        second = queue.enqueue(tasks.review_added, key='review-added:1', title_id=self.watch.id, platform_id=self.stream.id, rating=5)
+
+        self.assertIsNotNone(first)
+        self.assertIsNone(second)
+        self.assertEqual(queue.run_due(), 1)
+        self.watch.refresh_from_db()
+        self.assertEqual(self.watch.rating_sum, 5)
+
+    def test_retries_then_fails(self):
+        task = queue.enqueue(tasks.review_added, title_id=self.watch.id, platform_id=self.stream.id, rating=5)
+
+        with mock.patch('watchmate.stats.apply_ratings', side_effect=RuntimeError('stats are down')):
+            queue.run(task.id)
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.attempts), (models.Task.PENDING, 1))
+            self.assertIn('stats are down', task.last_error)
+
+            # The rating UPDATE of the failed attempt was rolled back with it
+            self.watch.refresh_from_db()
+            self.assertEqual(self.watch.rating_sum, 0)
+
+            queue.run(task.id)
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.attempts), (models.Task.FAILED, 2))
+
+        self.assertIsNone(queue.run(task.id))
+
+    @override_settings(TASK_QUEUE='inline')
+    def test_inline_runs_at_once(self):
+        self.assertIsNone(queue.enqueue(tasks.review_added, title_id=self.watch.id, platform_id=self.stream.id, rating=3))
+        self.assertFalse(models.Task.objects.filter(name=tasks.review_added.task_name).exists())
+        self.watch.refresh_from_db()
+        self.assertEqual(self.watch.rating_sum, 3)
+
+    @override_settings(RATING_WRITE_BEHIND=True, RATING_FLUSH_EVENTS=10000, RATING_FLUSH_INTERVAL_MS=0)
+    def test_write_behind_is_skipped_by_tasks(self):
+        # The rating is applied in the task's transaction, not left in a buffer
+        task = queue.enqueue(tasks.review_added, title_id=self.watch.id, platform_id=self.stream.id, rating=4)
+        queue.run(task.id)
+
+        self.watch.refresh_from_db()
+        self.assertEqual((self.watch.number_rating, self.watch.rating_sum), (1, 4))
+        self.assertIsNone(queue.current_task())
+
+    @override_settings(RESPONSE_CACHE_BACKEND='lru', CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            queue.enqueue(tasks.review_added, title_id=self.watch.id, platform_id=self.stream.id, rating=4)
+        with self.assertRaises(ImproperlyConfigured):
+            self.run_worker()
+
+        # Inline tasks invalidate in the request's own process
+        queue.check_settings('inline')
+
+    def test_purge(self):
+        task = queue.enqueue(tasks.titles_changed, changes=[[self.stream.id, 1, 1]])
+        queue.run(task.id)
+        models.Task.objects.filter(pk=task.pk).update(updated=timezone.now() - timedelta(hours=25))
+
+        self.assertEqual(queue.purge(), 1)
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates},
+    })
+
+
+@override_settings(RESPONSE_CACHE_BACKEND='none')
+class ThrottlingTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jude', password='password@123')
+        self.other = User.objects.create_user(username='tom', password='password@123')
+
+        self.stream = models.StreamPlatform.objects.create(name="netflix", about="About", website="https://netflix.com")
+        self.watches = [
+            models.WatchList.objects.create(platform=self.stream, title=f"Movie {i}", description="Example Movie")
+            for i in range(3)
+        ]
+
+        throttling.reset()
+        self.addCleanup(throttling.reset)
+
+    def test_token_bucket(self):
+        store = throttling.MemoryStore(max_keys=10)
+
+        # A burst of the bucket size, then one token every period / size
+        self.assertEqual([store.take('a', 2, 10, 100) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(store.take('a', 2, 10, 101), 4)
+        self.assertEqual(store.take('a', 2, 10, 105), 0)
+        self.assertAlmostEqual(store.take('a', 2, 10, 105), 5)
+
+    def test_store_eviction(self):
+        store = throttling.MemoryStore(max_keys=2)
+        for key in 'abc':
+            store.take(key, 5, 60, 100)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+
+        # Full again after a period, dropped with the next check
+        store.take('d', 5, 60, 161)
+        self.assertEqual(list(store.buckets), ['d'])
+
+    @throttle_rates(auth='10/min')
+    @override_settings(THROTTLE_BACKEND='django')
+    def test_shared_store(self):
+        throttling.reset()
+        self.assertIsInstance(throttling.get_store(), throttling.DjangoCacheStore)
+
+        self.assertEqual(throttling.take('auth', 'ip:10.0.0.1'), 0)
+        for _ in range(9):
+            throttling.take('auth', 'ip:10.0.0.1')
+        self.assertGreater(throttling.take('auth', 'ip:10.0.0.1'), 0)
+        self.assertEqual(throttling.take('auth', 'ip:10.0.0.2'), 0)
+
+    @throttle_rates(review='2/min')
+    def test_review_writes_per_user(self):
+        self.client.force_authenticate(self.user)
+        for watch in self.watches[:2]:
+            response = self.client.post(reverse('review-create', args=(watch.id,)), {'rating': 4, 'description': 'Good', 'watchlist': watch.id})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(reverse('review-create', args=(self.watches[2].id,)), {'rating': 4, 'description': 'Good', 'watchlist': self.watches[2].id})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 30)
+        self.assertFalse(models.Review.objects.filter(watchlist=self.watches[2]).exists())
+
+        # Another user has a bucket of their own
+        self.client.force_authenticate(self.other)
+        response = self.client.post(reverse('review-create', args=(self.watches[2].id,)), {'rating': 4, 'description': 'Good', 'watchlist': self.watches[2].id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @throttle_rates(review='2/min', catalog='100/min')
+    def test_review_edits_use_the_review_scope(self):
+        self.client.force_authenticate(self.user)
+        review = models.Review.objects.create(review_user=self.user, watchlist=self.watches[0], rating=3, description="Fine")
+        url = reverse('review-detail', args=(review.id,))
+
+        for rating in (4, 5):
+            response = self.client.put(url, {'rating': rating, 'description': 'Better', 'watchlist': self.watches[0].id})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Reads are still catalog traffic
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    @throttle_rates(catalog='2/min', catalog_ip='4/min')
+    def test_catalog_reads(self):
+        self.assertEqual([self.client.get(reverse('movie-list')).status_code for _ in range(3)], [200, 200, 429])
+
+        # Users are counted on their own, and the address as a whole (the refused request counted there too)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('movie-list')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('movie-list')).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Scopeless endpoints and disabled throttling are not counted
+        self.client.force_authenticate(None)
+        with throttling.disabled():
+            self.assertEqual(self.client.get(reverse('movie-list')).status_code, status.HTTP_200_OK)
+        with override_settings(THROTTLE_BACKEND='none'):
+            throttling.reset()
+            self.assertEqual(self.client.get(reverse('movie-list')).status_code, status.HTTP_200_OK)
+
+    @throttle_rates(catalog='1/min')
+    def test_async_reads(self):
+        factory = APIRequestFactory()
+        view = async_views.WatchlistAsync.as_view()
+
+        self.assertEqual(async_to_sync(view)(factory.get(reverse('movie-list'))).status_code, status.HTTP_200_OK)
+        response = async_to_sync(view)(factory.get(reverse('movie-list')))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertIn(b'Request was throttled', response.content)
+
+        # Authenticated reads are counted per user, as on the DRF views
+        request = factory.get(reverse('movie-list'))
+        force_authenticate(request, user=self.user)
+        self.assertEqual(async_to_sync(view)(request).status_code, status.HTTP_200_OK)
+        request = factory.get(reverse('movie-list'))
+        force_authenticate(request, user=self.other)
+        self.assertEqual(async_to_sync(view)(request).status_code, status.HTTP_200_OK)